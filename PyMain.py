@@ -1,11 +1,43 @@
+import argparse
+import os
 import pygame
 import sys
+import time
+
+from animation import MOVE_MS, RETURN_MS, SNAP_MS, Animator
+from bitboard import PROMOTION_PIECES
+from book import Book
+from endgame import load_tables
+# The rules live in game.py; these names stay importable from PyMain
+from game import Game, check_winner, init_board, is_valid_move, path_is_clear  # noqa: F401
+from instrument import NULL_PROFILER, OVERLAY_REFRESH_MS, Profiler
+from movegen import move_from_squares, move_from_uci
+from netplay import DEFAULT_PORT, NetClient
+from parallel import ParallelSearch
+from pgn import write_game
+from renderer import DirtyRenderer
+from search import Search
+from sprites import SpriteCache
+from worker import SearchWorker
+
+IMPORTED = time.perf_counter()
 
 # Constants
 WIDTH, HEIGHT = 640, 640
 ROWS, COLS = 8, 8
 SQUARE_SIZE = WIDTH // COLS
 
+FPS = 60
+# Longest sleep between wake-ups while nothing is happening
+IDLE_TIMEOUT_MS = 1000
+
+# States of the main loop
+GAME, PROMOTION, GAME_OVER, REPLAY = 'game', 'promotion', 'game over', 'replay'
+
+# Posted from other threads to wake the main loop
+SEARCH_DONE = pygame.event.custom_type()
+NET_MESSAGE = pygame.event.custom_type()
+
 # Colors
 WHITE = (232, 235, 239)
 GRAY = (125, 135, 150)
@@ -13,229 +45,204 @@ PROMO_BG = (200, 200, 200)
 PROMO_BORDER = (50, 50, 50)
 
 # Load images
-def load_images():
-    pieces = ['bp', 'br', 'bn', 'bb', 'bq', 'bk',
-              'wp', 'wr', 'wn', 'wb', 'wq', 'wk']
-    images = {}
-    for piece in pieces:
-        images[piece] = pygame.transform.scale(
-            pygame.image.load(f"images/{piece}.png"), (SQUARE_SIZE, SQUARE_SIZE)
-        )
-    return images
-
-def draw_board(win):
+def load_images(cache=None, size=SQUARE_SIZE):
+    # The sprite atlas is built, or loaded from the cache, on first use
+    cache = cache or SpriteCache('images')
+    return cache.sprites(size)
+
+def startup_seconds():
+    # Time since the process was launched, read from /proc on Linux (to the
+    # nearest clock tick); elsewhere, since PyMain was imported
+    try:
+        with open('/proc/self/stat') as f:
+            started = int(f.read().rsplit(')', 1)[1].split()[19])
+        return time.clock_gettime(time.CLOCK_BOOTTIME) - started / os.sysconf('SC_CLK_TCK')
+    except (OSError, AttributeError, ValueError, IndexError):
+        return time.perf_counter() - IMPORTED
+
+def next_events(timeout=None):
+    # Everything queued. With a timeout in ms, first sleeps until an event
+    # arrives or the time is up. A timeout of 0 would make pygame wait
+    # without limit, so it is raised to 1 ms.
+    if timeout is not None:
+        event = pygame.event.wait(max(1, timeout))
+        if event.type == pygame.NOEVENT:
+            return []
+        return [event] + pygame.event.get()
+    return pygame.event.get()
+
+def coalesce_motion(events):
+    # Keeps only the last of each run of MOUSEMOTION events; a drag only
+    # needs to know where the mouse is now
+    return [event for event, following in zip(events, events[1:] + [None])
+            if not (event.type == pygame.MOUSEMOTION and following and following.type == pygame.MOUSEMOTION)]
+
+def draw_board(win, origin=(0, 0), square_size=SQUARE_SIZE):
+    x, y = origin
     for row in range(ROWS):
         for col in range(COLS):
             color = WHITE if (row + col) % 2 == 0 else GRAY
-            pygame.draw.rect(win, color, (col*SQUARE_SIZE, row*SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE))
-
-def init_board():
-    board = [[None for _ in range(COLS)] for _ in range(ROWS)]
+            pygame.draw.rect(win, color, (x + col*square_size, y + row*square_size, square_size, square_size))
 
-    for i in range(COLS):
-        board[1][i] = 'bp'
-        board[6][i] = 'wp'
-
-    order = ['r', 'n', 'b', 'q', 'k', 'b', 'n', 'r']
-    for i in range(COLS):
-        board[0][i] = 'b' + order[i]
-        board[7][i] = 'w' + order[i]
-
-    return board
-
-def draw_pieces(win, board, images, selected_piece):
+def draw_pieces(win, board, images, selected_piece, origin=(0, 0), square_size=SQUARE_SIZE):
+    # images must hold sprites of square_size
+    x, y = origin
+    placements = []
     for row in range(ROWS):
         for col in range(COLS):
             piece = board[row][col]
             if piece:
                 if selected_piece and selected_piece['pos'] == (row, col):
                     continue
-                win.blit(images[piece], (col*SQUARE_SIZE, row*SQUARE_SIZE))
-
-def check_winner(board):
-    white_king = black_king = False
-    for row in board:
-        for piece in row:
-            if piece == 'wk':
-                white_king = True
-            elif piece == 'bk':
-                black_king = True
-    if not white_king:
-        return 'Black wins!'
-    if not black_king:
-        return 'White wins!'
-    return None
+                placements.append((piece, (x + col*square_size, y + row*square_size)))
+    images.draw(win, placements)
 
 def get_row_col_from_mouse(pos):
     x, y = pos
     return y // SQUARE_SIZE, x // SQUARE_SIZE
 
-def path_is_clear(start, end, board):
-    r1, c1 = start
-    r2, c2 = end
-    dr = r2 - r1
-    dc = c2 - c1
-
-    step_r = (dr // abs(dr)) if dr != 0 else 0
-    step_c = (dc // abs(dc)) if dc != 0 else 0
-
-    r, c = r1 + step_r, c1 + step_c
-    while (r, c) != (r2, c2):
-        if board[r][c] is not None:
-            return False
-        r += step_r
-        c += step_c
-    return True
-
-def is_valid_move(piece, start, end, board, en_passant_target, has_moved):
-    piece_type = piece[1]
-    color = piece[0]
-    start_row, start_col = start
-    end_row, end_col = end
-    dr = end_row - start_row
-    dc = end_col - start_col
-
-    destination = board[end_row][end_col]
-    if destination and destination[0] == color:
-        return False
-
-    if piece_type == 'p':
-        direction = -1 if color == 'w' else 1
-        start_row_home = 6 if color == 'w' else 1
-
-        if dc == 0:
-            if dr == direction and not destination:
-                return True
-            if dr == 2 * direction and start_row == start_row_home and not board[start_row + direction][start_col] and not destination:
-                return True
-        elif abs(dc) == 1 and dr == direction:
-            if destination and destination[0] != color:
-                return True
-            if en_passant_target and (end_row, end_col) == en_passant_target and not destination:
-                return True
-
-    elif piece_type == 'r':
-        if dr == 0 or dc == 0:
-            return path_is_clear(start, end, board)
-
-    elif piece_type == 'n':
-        if (abs(dr), abs(dc)) in [(2, 1), (1, 2)]:
-            return True
-
-    elif piece_type == 'b':
-        if abs(dr) == abs(dc):
-            return path_is_clear(start, end, board)
-
-    elif piece_type == 'q':
-        if dr == 0 or dc == 0 or abs(dr) == abs(dc):
-            return path_is_clear(start, end, board)
-
-    elif piece_type == 'k':
-        if max(abs(dr), abs(dc)) == 1:
-            return True
-
-        if dr == 0 and abs(dc) == 2:
-            rook_col = 7 if dc > 0 else 0
-            rook = board[start_row][rook_col]
-            if not rook or rook[1] != 'r' or rook[0] != color:
-                return False
-
-            step = 1 if dc > 0 else -1
-            for c in range(start_col + step, rook_col, step):
-                if board[start_row][c] is not None:
-                    return False
-
-            if color == 'w':
-                if has_moved['w_king']:
-                    return False
-                if dc > 0 and has_moved['w_rook_ks']:
-                    return False
-                if dc < 0 and has_moved['w_rook_qs']:
-                    return False
-            else:
-                if has_moved['b_king']:
-                    return False
-                if dc > 0 and has_moved['b_rook_ks']:
-                    return False
-                if dc < 0 and has_moved['b_rook_qs']:
-                    return False
-
-            return True
-
-    return False
-
-def choose_promotion_piece(win, color, images, board):
-    options = ['q', 'r', 'b', 'n']
-    selecting = True
-    draw_board(win)
-    draw_pieces(win, board, images, None)
-
-    # Draw selection UI
+def promotion_menu_rects():
     size = SQUARE_SIZE
     start_x = WIDTH // 2 - 2 * size
     start_y = HEIGHT // 2 - size // 2
+    return [pygame.Rect(start_x + i * size, start_y, size, size) for i in range(len(PROMOTION_PIECES))]
 
-    for i, opt in enumerate(options):
-        rect = pygame.Rect(start_x + i * size, start_y, size, size)
+def draw_promotion_menu(win, color, images):
+    for opt, rect in zip(PROMOTION_PIECES, promotion_menu_rects()):
         pygame.draw.rect(win, PROMO_BG, rect)
         pygame.draw.rect(win, PROMO_BORDER, rect, 2)
         win.blit(images[color + opt], (rect.x, rect.y))
 
-    pygame.display.flip()
-
-    while selecting:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-            elif event.type == pygame.MOUSEBUTTONDOWN:
-                mx, my = pygame.mouse.get_pos()
-                for i in range(len(options)):
-                    rect = pygame.Rect(start_x + i * size, start_y, size, size)
-                    if rect.collidepoint(mx, my):
-                        return options[i]
+def promotion_choice_at(pos):
+    for opt, rect in zip(PROMOTION_PIECES, promotion_menu_rects()):
+        if rect.collidepoint(pos):
+            return opt
+    return None
 
-def main():
+def draw_winner(win, winner):
+    font = pygame.font.SysFont('Arial', 48)
+    text = font.render(winner, True, (0, 0, 0))
+    text_rect = text.get_rect(center=(WIDTH//2, HEIGHT//2))
+    win.blit(text, text_rect)
+
+def main(ai_color=None, ai_time_ms=1000, ai_workers=1, pgn_path=None, book_paths=(), tables_dir=None,
+         sprite_cache_dir=None, report_startup=False, connect=None, game_id=None, profile=False,
+         trace_path=None):
+    # connect=(host, port) plays against someone else through a relay
+    # server (see netplay.py) instead of on this board alone. profile shows
+    # frame timings over the board; trace_path also saves every timed stage
+    # to that file on exit (see instrument.py).
     pygame.init()
     win = pygame.display.set_mode((WIDTH, HEIGHT))
     pygame.display.set_caption("Basic Chess with Promotion")
     clock = pygame.time.Clock()
 
-    images = load_images()
-    board = init_board()
+    sprite_cache = SpriteCache('images', cache_dir=sprite_cache_dir)
+    images = load_images(sprite_cache)
+    game = Game()
     selected_piece = None
-    en_passant_target = None
-    turn = 'w'
-    has_moved = {
-        'w_king': False,
-        'w_rook_ks': False,
-        'w_rook_qs': False,
-        'b_king': False,
-        'b_rook_ks': False,
-        'b_rook_qs': False
-    }
-
+    promotion = None  # the pawn move waiting for a promotion choice
+    game_over = None  # the result text and when to start the next game
+    # More than one worker searches in a process pool (lazy SMP)
+    engine = ParallelSearch(ai_workers) if ai_workers > 1 else Search()
+    # The opening book and endgame tables answer before the engine searches
+    books = [Book(path) for path in book_paths]
+    if tables_dir:
+        books += load_tables(tables_dir)
+    # The worker and the network client post an event to wake the loop
+    worker = SearchWorker(engine, books, notify=lambda: pygame.event.post(pygame.event.Event(SEARCH_DONE)))
+    renderer = DirtyRenderer((WIDTH, HEIGHT), SQUARE_SIZE, draw_board)
+    animator = Animator(renderer)
+    drawn_overlay = None
+    first_frame = True
+    net = NetClient(*connect, game_id=game_id,
+                    notify=lambda: pygame.event.post(pygame.event.Event(NET_MESSAGE))) if connect else None
+    net_color = None  # our colour once the server has seated us
+    profiler = Profiler(trace_path) if profile or trace_path else NULL_PROFILER
+
+    def draw_overlay(win):
+        if promotion:
+            draw_promotion_menu(win, game.turn, images)
+        if game_over:
+            draw_winner(win, game_over['winner'])
+
+    def play(move, duration=MOVE_MS, start=None):
+        # Plays move on the board and slides the piece there. A search
+        # of a finished position comes back without a move.
+        if move is None:
+            return
+        before = list(game.position.squares)
+        game.play(move)
+        animator.animate_move(before, move, duration, start)
+
+    def step(backward):
+        # Takes back or replays one move, sliding the piece
+        before = list(game.position.squares)
+        move = game.undo() if backward else game.redo()
+        if move:
+            animator.animate_move(game.position.squares if backward else before, move, reverse=backward)
+        return move
+
+    state = GAME
+    events = []
     run = True
     while run:
-        clock.tick(60)
-        draw_board(win)
-        draw_pieces(win, board, images, selected_piece)
-        if selected_piece:
-            win.blit(images[selected_piece['piece']], selected_piece['mouse_pos'])
-        pygame.display.flip()
-
-        for event in pygame.event.get():
+        profiler.begin_frame()
+        for event in events:
             if event.type == pygame.QUIT:
                 run = False
 
+            elif net and event.type == pygame.KEYDOWN:
+                # Reset and take-backs are not shared with the other player
+                continue
+
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_r:
+                worker.cancel()
+                game = Game()
+                animator.clear()
+                selected_piece = promotion = game_over = None
+                state = GAME
+
+            elif event.type == pygame.KEYDOWN and event.key in (pygame.K_LEFT, pygame.K_RIGHT):
+                # Browse the game: left takes a move back, right replays it.
+                # Against the computer, also step over its reply. Playing a
+                # move from an earlier position starts a new line from there.
+                worker.cancel()
+                backward = event.key == pygame.K_LEFT
+                if step(backward) and game.turn == ai_color:
+                    step(backward)
+                selected_piece = promotion = game_over = None
+                # Stepping back onto a finished game's last move only browses
+                # it: no result screen and no restart
+                state = REPLAY if game.redo_moves or game.winner else GAME
+
+            elif state == PROMOTION:
+                if event.type == pygame.MOUSEBUTTONDOWN:
+                    choice = promotion_choice_at(pygame.mouse.get_pos())
+                    if choice:
+                        move = move_from_squares(promotion['start'], promotion['end'], choice)
+                        promotion = None
+                        state = GAME
+                        play(move, SNAP_MS)
+                        if net:
+                            net.send_move(move)
+
+            elif state == GAME_OVER or game.turn == ai_color or net and game.turn != net_color:
+                continue
+
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 row, col = get_row_col_from_mouse(pygame.mouse.get_pos())
-                piece = board[row][col]
-                if piece and piece[0] == turn:
+                piece = game.position[row][col]
+                if piece and piece[0] == game.turn:
+                    with profiler.stage('validation'):
+                        targets = game.destinations((row, col))
+                    profiler.count('validations')
                     selected_piece = {
                         'piece': piece,
                         'pos': (row, col),
-                        'mouse_pos': pygame.mouse.get_pos()
+                        'mouse_pos': pygame.mouse.get_pos(),
+                        # Legal destinations, looked up once per pick-up
+                        'targets': targets
                     }
 
             elif event.type == pygame.MOUSEBUTTONUP:
@@ -243,77 +250,25 @@ def main():
                     new_row, new_col = get_row_col_from_mouse(pygame.mouse.get_pos())
                     old_row, old_col = selected_piece['pos']
                     piece = selected_piece['piece']
-
-                    if 0 <= new_row < 8 and 0 <= new_col < 8:
-                        if is_valid_move(piece, (old_row, old_col), (new_row, new_col), board, en_passant_target, has_moved):
-                            if piece[1] == 'p' and en_passant_target and (new_row, new_col) == en_passant_target:
-                                board[old_row][new_col] = None
-
-                            board[old_row][old_col] = None
-
-                            # Castling rook move
-                            if piece[1] == 'k' and abs(new_col - old_col) == 2:
-                                if new_col > old_col:
-                                    board[new_row][5] = board[new_row][7]
-                                    board[new_row][7] = None
-                                else:
-                                    board[new_row][3] = board[new_row][0]
-                                    board[new_row][0] = None
-
-                            # Promotion
-                            if piece[1] == 'p' and (new_row == 0 or new_row == 7):
-                                promotion = choose_promotion_piece(win, piece[0], images, board)
-                                board[new_row][new_col] = piece[0] + promotion
-                            else:
-                                board[new_row][new_col] = piece
-
-                            # has_moved tracking
-                            if piece[1] == 'k':
-                                has_moved[f'{piece[0]}_king'] = True
-                            elif piece[1] == 'r':
-                                if piece[0] == 'w':
-                                    if old_row == 7 and old_col == 0:
-                                        has_moved['w_rook_qs'] = True
-                                    elif old_row == 7 and old_col == 7:
-                                        has_moved['w_rook_ks'] = True
-                                else:
-                                    if old_row == 0 and old_col == 0:
-                                        has_moved['b_rook_qs'] = True
-                                    elif old_row == 0 and old_col == 7:
-                                        has_moved['b_rook_ks'] = True
-
-                            if piece[1] == 'p' and abs(new_row - old_row) == 2:
-                                en_passant_target = ((old_row + new_row) // 2, new_col)
-                            else:
-                                en_passant_target = None
-
-                            turn = 'b' if turn == 'w' else 'w'
-
-                            winner = check_winner(board)
-                            if winner:
-                                font = pygame.font.SysFont('Arial', 48)
-                                text = font.render(winner, True, (0, 0, 0))
-                                text_rect = text.get_rect(center=(WIDTH//2, HEIGHT//2))
-                                draw_board(win)
-                                draw_pieces(win, board, images, None)
-                                win.blit(text, text_rect)
-                                pygame.display.flip()
-                                pygame.time.wait(3000)  # Show result for 3 seconds
-
-                                # Restart game
-                                board = init_board()
-                                selected_piece = None
-                                en_passant_target = None
-                                turn = 'w'
-                                has_moved = {
-                                    'w_king': False,
-                                    'w_rook_ks': False,
-                                    'w_rook_qs': False,
-                                    'b_king': False,
-                                    'b_rook_ks': False,
-                                    'b_rook_qs': False
-                                }
-                                continue
+                    dropped = selected_piece['mouse_pos']
+
+                    on_board = 0 <= new_row < 8 and 0 <= new_col < 8
+                    if on_board:
+                        profiler.count('validations')
+                    if on_board and (new_row, new_col) in selected_piece['targets']:
+                        # Promotion: wait for a click on the menu
+                        if piece[1] == 'p' and (new_row == 0 or new_row == 7):
+                            promotion = {'start': (old_row, old_col), 'end': (new_row, new_col)}
+                            state = PROMOTION
+                        else:
+                            move = move_from_squares((old_row, old_col), (new_row, new_col))
+                            play(move, SNAP_MS, dropped)
+                            state = GAME
+                            if net:
+                                net.send_move(move)
+                    else:
+                        # Not a legal move: the piece slides back home
+                        animator.slide(piece, dropped, old_row * 8 + old_col, RETURN_MS)
 
                     selected_piece = None
 
@@ -321,8 +276,128 @@ def main():
                 if selected_piece:
                     selected_piece['mouse_pos'] = pygame.mouse.get_pos()
 
+        if net:
+            with profiler.stage('network'):
+                messages = net.poll()
+            for message in messages:
+                kind = message['type']
+                if kind == 'joined':
+                    net_color = message['color']
+                    pygame.display.set_caption(f"Basic Chess with Promotion - game {message['game']}, "
+                                               f"playing {'White' if net_color == 'w' else 'Black'}")
+                elif kind == 'state':
+                    # The server's move list is the game; replay it
+                    game = Game()
+                    for text in message['moves']:
+                        game.play(move_from_uci(text))
+                    animator.clear()
+                    selected_piece = promotion = None
+                    state = GAME
+                elif kind == 'move' and message['by'] != net_color:
+                    play(move_from_uci(message['move']))
+                elif kind in ('opponent_left', 'disconnected', 'error'):
+                    pygame.display.set_caption(f"Basic Chess with Promotion - {message.get('reason', kind)}")
+
+        if state == GAME_OVER and not net and pygame.time.get_ticks() >= game_over['restart_at']:
+            # Restart game after showing the result for 3 seconds
+            worker.cancel()
+            game = Game()
+            animator.clear()
+            game_over = None
+            state = GAME
+
+        if state == GAME and game.turn == ai_color and not game.winner:
+            if not worker.pending:
+                worker.start(game.position, ai_time_ms, game.repetitions)
+            with profiler.stage('engine'):
+                result = worker.poll()
+            if result:
+                pygame.display.set_caption(
+                    f"Basic Chess with Promotion - depth {result['depth']}, {result['nps']} nodes/sec")
+                play(result['move'])
+
+        if game.winner and state == GAME:
+            game_over = {'winner': game.winner, 'restart_at': pygame.time.get_ticks() + 3000}
+            selected_piece = promotion = None
+            state = GAME_OVER
+            if pgn_path and not game.recorded:
+                game.recorded = True
+                write_game(pgn_path, game, {
+                    'Event': 'Basic Chess with Promotion',
+                    'White': 'Computer' if ai_color == 'w' else 'Human',
+                    'Black': 'Computer' if ai_color == 'b' else 'Human'
+                })
+
+        overlay = (promotion is not None, game_over['winner'] if game_over else None)
+        if overlay != drawn_overlay:
+            renderer.invalidate()
+            drawn_overlay = overlay
+        highlights = [row * 8 + col for row, col in selected_piece['targets']] if selected_piece else ()
+        sprites, hidden = animator.frame()
+        with profiler.stage('render'):
+            rects = renderer.render(win, game.position, images, selected_piece,
+                                    draw_overlay if any(overlay) else None, update=False, highlights=highlights,
+                                    sprites=sprites, hidden=hidden)
+        rects += profiler.overlay(win, renderer, rects)
+        if rects:
+            with profiler.stage('flip'):
+                pygame.display.update(rects)
+        if first_frame:
+            first_frame = False
+            if report_startup:
+                print(f'First frame {startup_seconds() * 1000:.0f} ms after launch', file=sys.stderr)
+            sprite_cache.save()
+        profiler.end_frame()
+
+        if not run:
+            break
+        # Draw at full frame rate only while a piece is being dragged or
+        # animated; otherwise sleep until an event, a finished search, a
+        # network message or the next timed step wakes the loop
+        if selected_piece or animator.active:
+            clock.tick(FPS)
+            timeout = None
+        elif state == GAME_OVER and not net:
+            # pygame.event.wait(0) would wait for good, so at least 1 ms
+            timeout = max(1, game_over['restart_at'] - pygame.time.get_ticks())
+        else:
+            timeout = IDLE_TIMEOUT_MS
+        if profiler.enabled and timeout is not None:
+            timeout = max(1, min(timeout, OVERLAY_REFRESH_MS))
+        events = coalesce_motion(next_events(timeout))
+
+    worker.cancel()
+    profiler.export()
+    if net:
+        net.close()
+    if ai_workers > 1:
+        engine.close()
+    for book in books:
+        book.close()
     pygame.quit()
     sys.exit()
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description='Basic Chess with Promotion')
+    parser.add_argument('--ai', choices=['w', 'b'], help='let the computer play this colour')
+    parser.add_argument('--ai-time-ms', type=int, default=1000, help='thinking time per computer move')
+    parser.add_argument('--ai-workers', type=int, default=1, help='processes the computer searches with')
+    parser.add_argument('--pgn', help='append finished games to this PGN file')
+    parser.add_argument('--book', action='append', default=[], help='opening book for the computer (can be repeated)')
+    parser.add_argument('--tables', help='directory with endgame tables from endgame.py')
+    parser.add_argument('--sprite-cache', metavar='DIR', help='keep pre-scaled piece atlases here for faster starts')
+    parser.add_argument('--startup-time', action='store_true', help='print the time from launch to the first frame')
+    parser.add_argument('--connect', metavar='HOST[:PORT]', help='play online through a relay server')
+    parser.add_argument('--profile', action='store_true', help='show frame timings over the board')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='save timed stages to FILE on exit, as Chrome trace JSON (.json) or CSV')
+    parser.add_argument('--game', help='game id to join on the relay server (default: next free opponent)')
+    args = parser.parse_args()
+    connect = None
+    if args.connect:
+        if args.ai:
+            parser.error('--ai cannot be combined with --connect')
+        host, _, port = args.connect.partition(':')
+        connect = (host or '127.0.0.1', int(port) if port else DEFAULT_PORT)
+    main(args.ai, args.ai_time_ms, args.ai_workers, args.pgn, args.book, args.tables,
+         args.sprite_cache, args.startup_time, connect, args.game, args.profile, args.trace)
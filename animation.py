@@ -0,0 +1,144 @@
+import pygame
+
+SNAP_MS = 90  # a dropped piece settling onto its square
+RETURN_MS = 160  # a rejected drop sliding back home
+MOVE_MS = 220  # engine, network and replayed moves
+PATH_STEPS = 32  # points precomputed along every path
+# Animated frames further apart than this count as late; after LATE_FRAMES
+# of them in a row the animations in flight jump to their ends
+FRAME_BUDGET_MS = 34
+LATE_FRAMES = 3
+MAX_ANIMATIONS = 8
+
+def ease_out_cubic(t):
+    return 1 - (1 - t) ** 3
+
+# Eased progress at PATH_STEPS + 1 evenly spaced times, shared by every path
+EASING = [ease_out_cubic(step / PATH_STEPS) for step in range(PATH_STEPS + 1)]
+
+class Animation:
+    __slots__ = ('piece', 'square', 'hides', 'path', 'start', 'duration')
+
+    def __init__(self, piece, square, path, start, duration, hides=True):
+        self.piece = piece
+        self.square = square  # where the piece ends up
+        self.hides = hides  # whether the board's piece there waits for it
+        self.path = path
+        self.start = start
+        self.duration = duration
+
+    def rect(self, now):
+        step = (now - self.start) * PATH_STEPS // self.duration
+        return self.path[min(max(step, 0), PATH_STEPS)]
+
+    def done(self, now):
+        return now - self.start >= self.duration
+
+class Animator:
+    # Slides pieces between squares. Each animation's path is worked out
+    # once when it starts, as PATH_STEPS + 1 rects along an ease-out curve,
+    # so a frame only looks up where every sprite is. frame() hands the
+    # renderer the sprites and the squares to leave empty under them, and
+    # the renderer repaints just the squares a sprite covered last frame or
+    # covers now.
+    #
+    # A piece that starts moving again before it has arrived carries on
+    # from where it is, so quick steps through a game merge into one
+    # smooth path. When frames fall behind FRAME_BUDGET_MS, or too many
+    # animations are running, pieces are put on their squares at once
+    # rather than slowing the loop down further.
+    def __init__(self, renderer, budget_ms=FRAME_BUDGET_MS, max_animations=MAX_ANIMATIONS):
+        self.renderer = renderer
+        self.budget_ms = budget_ms
+        self.max_animations = max_animations
+        self.animations = []
+        self.last_frame = None  # when the last animated frame was drawn
+        self.late = 0
+
+    @property
+    def active(self):
+        return bool(self.animations)
+
+    def clear(self):
+        # Drops every animation; the board shows its pieces where they are
+        self.animations = []
+        self.last_frame = None
+
+    def _take(self, square):
+        # Removes the animations ending on square, returning where the
+        # piece heading there is now, or None
+        now = pygame.time.get_ticks()
+        position = None
+        kept = []
+        for animation in self.animations:
+            if animation.square == square:
+                if animation.hides:
+                    position = animation.rect(now).topleft
+            else:
+                kept.append(animation)
+        self.animations = kept
+        return position
+
+    def slide(self, piece, start, square, duration, hides=True):
+        # Moves piece from start, a window position for its top-left corner,
+        # onto square, in place of any other piece heading there. Returns
+        # False where it was not worth animating.
+        self.animations = [animation for animation in self.animations
+                           if animation.square != square or not animation.hides]
+        if self.late >= LATE_FRAMES or len(self.animations) >= self.max_animations or duration <= 0:
+            return False
+        x0, y0 = start
+        end = self.renderer.square_rect(square)
+        dx, dy = end.left - x0, end.top - y0
+        size = end.size
+        path = [pygame.Rect((round(x0 + dx * e), round(y0 + dy * e)), size) for e in EASING]
+        self.animations.append(Animation(piece, square, path, pygame.time.get_ticks(), duration, hides))
+        return True
+
+    def animate_move(self, squares, move, duration=MOVE_MS, start=None, reverse=False):
+        # Animates move, just played on a board that showed squares before
+        # it; with reverse the move was just taken back, and squares is the
+        # board now. start overrides where the moving piece sets off from,
+        # such as where it was dropped. A castling rook slides as well.
+        from_sq, to_sq, _ = move
+        piece = squares[from_sq]
+        if not piece:
+            return
+        slides = [(piece, from_sq, to_sq)]
+        if piece[1] == 'k' and abs(to_sq - from_sq) == 2:
+            row = from_sq - from_sq % 8
+            home, rook_sq = (row + 7, row + 5) if to_sq > from_sq else (row, row + 3)
+            slides.append((squares[home], home, rook_sq))
+        if reverse:
+            slides = [(moving, target, origin) for moving, origin, target in slides]
+        # Pieces already on their way carry on from where they are
+        origins = [self._take(origin) for _, origin, _ in slides]
+        landing = [self._take(target) for _, _, target in slides]
+        if start is not None:
+            origins[0] = start
+        if not reverse and squares[to_sq]:
+            # The captured piece stays on show until the mover lands on it
+            captured = landing[0] or self.renderer.square_rect(to_sq).topleft
+            self.slide(squares[to_sq], captured, to_sq, duration, hides=False)
+        for (moving, origin, target), current in zip(slides, origins):
+            self.slide(moving, current or self.renderer.square_rect(origin).topleft, target, duration)
+
+    def frame(self):
+        # (sprites, hidden squares) to render this frame
+        now = pygame.time.get_ticks()
+        if self.last_frame is None:
+            # Time spent idle says nothing about how long frames take
+            self.late = 0
+        elif now - self.last_frame > self.budget_ms:
+            self.late += 1
+            if self.late >= LATE_FRAMES:
+                self.animations = []
+        else:
+            self.late = 0
+        self.animations = [animation for animation in self.animations if not animation.done(now)]
+        self.last_frame = now if self.animations else None
+        if not self.animations:
+            return [], frozenset()
+        sprites = [(animation.piece, animation.rect(now)) for animation in self.animations]
+        hidden = frozenset(animation.square for animation in self.animations if animation.hides)
+        return sprites, hidden
@@ -0,0 +1,249 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from bitboard import Position, START_FEN
+from movegen import decode_move, encode_move, move_from_uci
+from pgn import PgnError, game_to_pgn, read_games
+
+# A game archive is a directory of append-only column files, one value per
+# game in each, plus one blob holding every move:
+#
+#   moves.u16    every move of every game, 16 bits each (encode_move:
+#                from square, to square << 6, promotion piece << 12)
+#   index.u64    where each game's moves start in moves.u16, in moves
+#   plies.u16    number of moves in each game
+#   result.i8    1 white won, -1 black won, 0 draw, UNFINISHED otherwise
+#   opening.u64  the first four moves, 16 bits each, ply 0 in the low bits
+#   tags.u64     where each game's tags start in tags.jsonl, in bytes
+#   tags.jsonl   every other PGN tag, one JSON object per game
+#
+# All files are little-endian and headerless, so each column loads with
+# np.fromfile() or maps with np.memmap(), and a scan only reads the columns
+# it filters on. Appends write the moves and tags before the columns, and
+# the index last, so a reader never sees a game whose moves are missing.
+RESULT_CODES = {'1-0': 1, '0-1': -1, '1/2-1/2': 0}
+RESULT_NAMES = {code: result for result, code in RESULT_CODES.items()}
+UNFINISHED = -128
+OPENING_PLIES = 4
+# Tags kept in columns rather than in tags.jsonl
+COLUMN_TAGS = ('Result',)
+
+COLUMNS = {
+    'index': ('index.u64', '<u8'),
+    'plies': ('plies.u16', '<u2'),
+    'result': ('result.i8', 'i1'),
+    'opening': ('opening.u64', '<u8'),
+    'tags': ('tags.u64', '<u8'),
+}
+# Written in this order; index goes last since it defines the game count
+WRITE_ORDER = ('plies', 'result', 'opening', 'tags', 'index')
+
+def opening_key(codes):
+    # The first OPENING_PLIES move codes packed into one 64-bit value
+    key = 0
+    for ply, code in enumerate(codes[:OPENING_PLIES]):
+        key |= int(code) << (16 * ply)
+    return key
+
+class GameArchive:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        for name in [file for file, _ in COLUMNS.values()] + ['moves.u16', 'tags.jsonl']:
+            open(self._file(name), 'ab').close()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def __len__(self):
+        return os.path.getsize(self._file('index.u64')) // 8
+
+    def column(self, name):
+        # One column for every game, as a read-only memory map
+        file, dtype = COLUMNS[name]
+        count = len(self)
+        if not count:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(self._file(file), dtype=dtype, mode='r', shape=(count,))
+
+    def move_codes(self):
+        size = os.path.getsize(self._file('moves.u16')) // 2
+        if not size:
+            return np.zeros(0, dtype='<u2')
+        return np.memmap(self._file('moves.u16'), dtype='<u2', mode='r', shape=(size,))
+
+    def append(self, moves, headers=None, start_fen=None):
+        self.extend([(moves, headers, start_fen)])
+
+    def extend(self, games):
+        # games: (moves, headers, start FEN or None) for each game. The
+        # whole batch is written with one write per file.
+        move_offset = os.path.getsize(self._file('moves.u16')) // 2
+        tags_offset = os.path.getsize(self._file('tags.jsonl'))
+        blob = []
+        tag_lines = []
+        columns = {name: [] for name in COLUMNS}
+        for moves, headers, start_fen in games:
+            codes = [encode_move(move) for move in moves]
+            tags = {name: value for name, value in (headers or {}).items() if name not in COLUMN_TAGS}
+            if start_fen and start_fen != START_FEN:
+                tags['SetUp'] = '1'
+                tags['FEN'] = start_fen
+            line = (json.dumps(tags, separators=(',', ':')) + '\n').encode()
+            columns['index'].append(move_offset)
+            columns['plies'].append(len(codes))
+            columns['result'].append(RESULT_CODES.get((headers or {}).get('Result'), UNFINISHED))
+            columns['opening'].append(opening_key(codes))
+            columns['tags'].append(tags_offset)
+            blob += codes
+            tag_lines.append(line)
+            move_offset += len(codes)
+            tags_offset += len(line)
+        with open(self._file('moves.u16'), 'ab') as f:
+            f.write(np.array(blob, dtype='<u2').tobytes())
+        with open(self._file('tags.jsonl'), 'ab') as f:
+            f.write(b''.join(tag_lines))
+        for name in WRITE_ORDER:
+            file, dtype = COLUMNS[name]
+            with open(self._file(file), 'ab') as f:
+                f.write(np.array(columns[name], dtype=dtype).tobytes())
+
+    def games(self, indices=None):
+        # (moves, headers) for each selected game, or for all of them
+        index, plies, result, tags = (self.column(name) for name in ('index', 'plies', 'result', 'tags'))
+        codes = self.move_codes()
+        with open(self._file('tags.jsonl'), 'rb') as f:
+            for i in range(len(self)) if indices is None else indices:
+                start = int(index[i])
+                moves = [decode_move(code) for code in codes[start:start + int(plies[i])].tolist()]
+                f.seek(int(tags[i]))
+                headers = json.loads(f.readline())
+                headers['Result'] = RESULT_NAMES.get(int(result[i]), '*')
+                yield moves, headers
+
+    def game(self, i):
+        return next(self.games([i]))
+
+    def select(self, result=None, opening=()):
+        # Indices of the games with this result ('1-0', '0-1', '1/2-1/2' or
+        # '*') that start with the opening moves, up to OPENING_PLIES of them
+        selected = np.ones(len(self), dtype=bool)
+        if result is not None:
+            selected &= self.column('result') == RESULT_CODES.get(result, UNFINISHED)
+        if opening:
+            if len(opening) > OPENING_PLIES:
+                raise ValueError(f'openings are matched on at most {OPENING_PLIES} moves')
+            codes = [encode_move(move) for move in opening]
+            mask = np.uint64((1 << (16 * len(codes))) - 1)
+            selected &= (self.column('opening') & mask) == np.uint64(opening_key(codes))
+            selected &= self.column('plies') >= len(codes)
+        return np.flatnonzero(selected)
+
+class ArchivedGame:
+    # The parts of a Game that game_to_pgn() writes
+    def __init__(self, start_position, moves, result):
+        self.start_position = start_position
+        self.moves = moves
+        self.result = result
+
+def pgn_to_archive(pgn_path, archive_path, batch_size=10000):
+    # Appends every game of a PGN file; returns how many were added and how
+    # many were skipped for illegal or unreadable moves
+    archive = GameArchive(archive_path)
+    batch = []
+    added = skipped = 0
+    for pgn_game in read_games(pgn_path):
+        try:
+            moves = pgn_game.moves()
+        except PgnError:
+            skipped += 1
+            continue
+        fen = pgn_game.start_position().to_fen()
+        batch.append((moves, pgn_game.headers, fen))
+        if len(batch) >= batch_size:
+            archive.extend(batch)
+            added += len(batch)
+            batch = []
+    archive.extend(batch)
+    return added + len(batch), skipped
+
+def archive_to_pgn(archive_path, pgn_path, indices=None):
+    archive = GameArchive(archive_path)
+    with open(pgn_path, 'a') as f:
+        for moves, headers in archive.games(indices):
+            fen = headers.get('FEN') if headers.get('SetUp') == '1' else None
+            game = ArchivedGame(Position.from_fen(fen or START_FEN), moves, headers['Result'])
+            f.write(game_to_pgn(game, headers))
+
+def benchmark(archive_path, result=None, opening=(), pgn_path=None, repeat=5):
+    archive = GameArchive(archive_path)
+    count = len(archive)
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        selected = archive.select(result, opening)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f'{count:,} games, {len(selected):,} match; filtered {count / best:,.0f} games/sec')
+
+    # Decoding the matching games' moves back out of the blob
+    sample = selected[:100000]
+    start = time.perf_counter()
+    moves = sum(len(game_moves) for game_moves, _ in archive.games(sample))
+    elapsed = time.perf_counter() - start
+    if len(sample):
+        print(f'decoded {len(sample):,} matching games, {moves:,} moves: {len(sample) / elapsed:,.0f} games/sec')
+
+    if pgn_path:
+        # The same filter over a PGN file, for comparison
+        start = time.perf_counter()
+        scanned = matched = 0
+        for pgn_game in read_games(pgn_path):
+            scanned += 1
+            if result is not None and pgn_game.headers.get('Result', '*') != result:
+                continue
+            if opening and pgn_game.moves()[:len(opening)] != list(opening):
+                continue
+            matched += 1
+        elapsed = time.perf_counter() - start
+        print(f'PGN: {scanned:,} games, {matched:,} match; filtered {scanned / elapsed:,.0f} games/sec')
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert, export and scan binary game archives')
+    commands = parser.add_subparsers(dest='command', required=True)
+    convert = commands.add_parser('import', help='append the games of PGN files to an archive')
+    convert.add_argument('pgn', nargs='+')
+    convert.add_argument('-o', '--output', required=True, help='archive directory')
+    export = commands.add_parser('export', help='write an archive, or the selected games, as PGN')
+    export.add_argument('archive')
+    export.add_argument('-o', '--output', required=True, help='PGN file to append to')
+    bench = commands.add_parser('bench', help='time a filtered scan of an archive')
+    bench.add_argument('archive')
+    bench.add_argument('--pgn', help='also time the same filter over this PGN file')
+    for command in (export, bench):
+        command.add_argument('--result', choices=['1-0', '0-1', '1/2-1/2', '*'])
+        command.add_argument('--opening', nargs='+', default=[], metavar='UCI',
+                             help=f'first moves, at most {OPENING_PLIES}, e.g. e2e4 c7c5')
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        for path in args.pgn:
+            added, skipped = pgn_to_archive(path, args.output)
+            print(f'{path}: {added} games added, {skipped} skipped')
+        return
+    if len(args.opening) > OPENING_PLIES:
+        parser.error(f'--opening takes at most {OPENING_PLIES} moves')
+    opening = [move_from_uci(text) for text in args.opening]
+    if args.command == 'export':
+        indices = GameArchive(args.archive).select(args.result, opening)
+        archive_to_pgn(args.archive, args.output, indices)
+        print(f'{len(indices)} games written to {args.output}')
+    else:
+        benchmark(args.archive, args.result, opening, args.pgn)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+import argparse
+import random
+import time
+
+import numpy as np
+
+from bitboard import PIECES, Position, START_FEN
+from evaluate import (DOUBLED_PAWN, FILE_MASKS, ISOLATED_PAWN, MOBILITY_WEIGHTS, PASSED_PAWN_BONUS,
+                      PIECE_SQUARE_TABLES, PIECE_VALUES, evaluate)
+from movegen import generate_moves
+
+# Batches are (N, 12, 8, 8) planes, one per piece in PIECES order, with
+# plane[row, col] set where that piece stands (row 0 is black's back rank),
+# or (N, 12) packed uint64 bitboards in the same order with square
+# row * 8 + col in bit row * 8 + col. Planes are packed into bitboards and
+# every term is computed with whole-array bitboard operations, so the work
+# per position is a few hundred vectorized word operations.
+#
+# evaluate_batch() returns exactly what evaluate() returns for each
+# position; evaluate() stays the fast path for one position in the search.
+PIECE_TYPES = 'pnbrqk'
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN = range(5)
+WHITE, BLACK = slice(0, 6), slice(6, 12)
+
+KNIGHT_STEPS = [(2, 1), (1, 2), (-1, 2), (-2, 1), (-2, -1), (-1, -2), (1, -2), (2, -1)]
+ORTHOGONAL = [(1, 0), (0, 1), (-1, 0), (0, -1)]
+DIAGONAL = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+
+def _row_tables():
+    # ROW_TABLES[piece type, row, byte] is the material and placement of the
+    # white pieces that byte puts on that row
+    tables = np.zeros((6, 8, 256), dtype=np.int32)
+    for t, piece_type in enumerate(PIECE_TYPES):
+        scores = np.add(PIECE_SQUARE_TABLES[piece_type], PIECE_VALUES[piece_type]).reshape(8, 8)
+        for byte in range(256):
+            cols = [col for col in range(8) if byte >> col & 1]
+            tables[t, :, byte] = scores[:, cols].sum(axis=1)
+    return tables
+
+ROW_TABLES = _row_tables()
+ROWS = np.arange(8)
+
+FILES = np.array(FILE_MASKS, dtype=np.uint64)
+ROW_MASKS = np.array([0xFF << (row * 8) for row in range(8)], dtype=np.uint64)
+# What survives a shift of dc columns without wrapping onto the next row
+KEEP_COLUMNS = {dc: np.uint64(sum(FILE_MASKS[col] for col in range(8) if 0 <= col - dc < 8))
+                for dc in range(-2, 3)}
+# PASSED_PAWN_BONUS by board row for a white pawn
+PASSED_BY_ROW = np.array(PASSED_PAWN_BONUS[::-1], dtype=np.int64)
+
+def positions_to_planes(positions):
+    planes = np.zeros((len(positions), 12, 64), dtype=np.uint8)
+    index = {piece: i for i, piece in enumerate(PIECES)}
+    for n, position in enumerate(positions):
+        for sq, piece in enumerate(position.squares):
+            if piece:
+                planes[n, index[piece], sq] = 1
+    return planes.reshape(-1, 12, 8, 8)
+
+def positions_to_bitboards(positions):
+    return np.array([[position.bitboards[piece] for piece in PIECES] for position in positions],
+                    dtype=np.uint64).reshape(-1, 12)
+
+def pack_planes(planes):
+    # (N, 12, 8, 8) planes -> (N, 12) uint64 bitboards
+    packed = np.packbits(np.asarray(planes, dtype=bool).reshape(-1, 12, 64), axis=-1, bitorder='little')
+    return packed.view('<u8').reshape(-1, 12).astype(np.uint64)
+
+def unpack_bitboards(bitboards):
+    # (N, 12) uint64 bitboards -> (N, 12, 8, 8) uint8 planes
+    as_bytes = np.ascontiguousarray(bitboards, dtype='<u8').view(np.uint8).reshape(-1, 12, 8)
+    return np.unpackbits(as_bytes, axis=-1, bitorder='little').reshape(-1, 12, 8, 8)
+
+def _shift(bb, dr, dc):
+    # Moves every piece in the bitboards by (dr, dc); what leaves the board
+    # is dropped
+    amount = dr * 8 + dc
+    moved = bb << np.uint64(amount) if amount > 0 else bb >> np.uint64(-amount)
+    return moved & KEEP_COLUMNS[dc]
+
+def _count(bb):
+    return np.bitwise_count(bb).astype(np.int64)
+
+def _slides(pieces, empty, free, directions):
+    # Squares reached along each direction, summed over all the pieces
+    count = 0
+    for dr, dc in directions:
+        ray = pieces
+        for _ in range(7):
+            ray = _shift(ray, dr, dc)
+            count = count + _count(ray & free)
+            ray = ray & empty
+            if not ray.any():
+                break
+    return count
+
+def _side_score(own, enemy):
+    # Score of one side from its own point of view, on a board turned so
+    # that it plays up the board like white. own and enemy are (N, 6)
+    # bitboards in PIECE_TYPES order.
+    rows = np.ascontiguousarray(own, dtype='<u8').view(np.uint8).reshape(-1, 6, 8)
+    score = ROW_TABLES[np.arange(6)[:, None], ROWS, rows].sum(axis=(1, 2), dtype=np.int64)
+
+    own_all = np.bitwise_or.reduce(own, axis=1)
+    free = ~own_all
+    empty = ~(own_all | np.bitwise_or.reduce(enemy, axis=1))
+    knights = own[:, KNIGHT]
+    knight_moves = 0
+    for dr, dc in KNIGHT_STEPS:
+        knight_moves = knight_moves + _count(_shift(knights, dr, dc) & free)
+    score += MOBILITY_WEIGHTS['n'] * knight_moves
+    score += MOBILITY_WEIGHTS['b'] * _slides(own[:, BISHOP], empty, free, DIAGONAL)
+    score += MOBILITY_WEIGHTS['r'] * _slides(own[:, ROOK], empty, free, ORTHOGONAL)
+    score += MOBILITY_WEIGHTS['q'] * _slides(own[:, QUEEN], empty, free, ORTHOGONAL + DIAGONAL)
+
+    pawns = own[:, PAWN]
+    per_file = _count(pawns[:, None] & FILES)
+    score += DOUBLED_PAWN * np.maximum(per_file - 1, 0).sum(axis=1)
+    has_pawn = per_file > 0
+    neighbours = np.zeros_like(has_pawn)
+    neighbours[:, 1:] |= has_pawn[:, :-1]
+    neighbours[:, :-1] |= has_pawn[:, 1:]
+    score += ISOLATED_PAWN * (per_file * ~neighbours).sum(axis=1)
+    # An enemy pawn stops a pawn if it stands on a higher row of the same or
+    # a neighbouring file; fill the stoppers down the board to find them
+    enemy_pawns = enemy[:, PAWN]
+    stopped = enemy_pawns | _shift(enemy_pawns, 0, 1) | _shift(enemy_pawns, 0, -1)
+    for amount in (8, 16, 32):
+        stopped |= stopped << np.uint64(amount)
+    passed = pawns & ~(stopped << np.uint64(8))
+    score += (_count(passed[:, None] & ROW_MASKS) * PASSED_BY_ROW).sum(axis=1)
+    return score
+
+def evaluate_batch(boards, white_to_move=None):
+    # Scores for a batch of (N, 12, 8, 8) planes or (N, 12) bitboards, in
+    # centipawns. With white_to_move, a boolean array, each score is from
+    # the side to move's point of view like evaluate(); without it they are
+    # all from white's.
+    boards = np.asarray(boards)
+    boards = pack_planes(boards) if boards.ndim == 4 else boards.astype(np.uint64)
+    white, black = boards[:, WHITE], boards[:, BLACK]
+    # Black is scored on the board flipped top to bottom, which reverses
+    # the bytes of a bitboard
+    scores = _side_score(white, black) - _side_score(black.byteswap(), white.byteswap())
+    if white_to_move is not None:
+        scores = np.where(white_to_move, scores, -scores)
+    return scores.astype(np.int32)
+
+def sample_positions(count, seed=1, max_plies=120):
+    # Every position of random games, for benchmarking
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        position = Position.from_fen(START_FEN)
+        for _ in range(max_plies):
+            moves = generate_moves(position)
+            if not moves or len(positions) >= count:
+                break
+            position.make_move(rng.choice(moves))
+            positions.append(position.copy())
+    return positions
+
+def benchmark(count, seed, batch_size):
+    positions = sample_positions(count, seed)
+    white_to_move = np.array([position.turn == 'w' for position in positions])
+    print(f'{count} positions from random games, batches of {batch_size}')
+
+    start = time.perf_counter()
+    expected = [evaluate(position) for position in positions]
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    bitboards = positions_to_bitboards(positions)
+    packing = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scores = np.concatenate([evaluate_batch(bitboards[i:i + batch_size], white_to_move[i:i + batch_size])
+                             for i in range(0, count, batch_size)])
+    batch = time.perf_counter() - start
+
+    if scores.tolist() != expected:
+        mismatches = sum(a != b for a, b in zip(scores.tolist(), expected))
+        raise SystemExit(f'batch scores differ from evaluate() for {mismatches} positions')
+    print(f'evaluate():       {count / single:>12,.0f} positions/sec')
+    print(f'evaluate_batch(): {count / batch:>12,.0f} positions/sec '
+          f'({single / batch:.1f}x, packing bitboards {count / packing:,.0f} positions/sec)')
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare batch and per-position evaluation speed')
+    parser.add_argument('--positions', type=int, default=20000)
+    parser.add_argument('--batch-size', type=int, default=4096)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    benchmark(args.positions, args.seed, args.batch_size)
+
+if __name__ == "__main__":
+    main()
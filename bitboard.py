@@ -0,0 +1,506 @@
+from zobrist import PIECE_KEYS, SIDE_KEY, CASTLING_KEYS, EN_PASSANT_KEYS
+
+ROWS, COLS = 8, 8
+
+# Squares are numbered row * 8 + col, using the same rows and columns as the
+# list-of-lists board: row 0 is black's back rank, row 7 is white's.
+
+PIECES = ['wp', 'wn', 'wb', 'wr', 'wq', 'wk',
+          'bp', 'bn', 'bb', 'br', 'bq', 'bk']
+PROMOTION_PIECES = ['q', 'r', 'b', 'n']
+
+# Castling rights bits
+WHITE_KINGSIDE = 1
+WHITE_QUEENSIDE = 2
+BLACK_KINGSIDE = 4
+BLACK_QUEENSIDE = 8
+
+HAS_MOVED_RIGHTS = {
+    'w_king': WHITE_KINGSIDE | WHITE_QUEENSIDE,
+    'w_rook_ks': WHITE_KINGSIDE,
+    'w_rook_qs': WHITE_QUEENSIDE,
+    'b_king': BLACK_KINGSIDE | BLACK_QUEENSIDE,
+    'b_rook_ks': BLACK_KINGSIDE,
+    'b_rook_qs': BLACK_QUEENSIDE
+}
+
+def square(row, col):
+    return row * 8 + col
+
+def row_col(sq):
+    return divmod(sq, 8)
+
+def lsb(bb):
+    return (bb & -bb).bit_length() - 1
+
+def msb(bb):
+    return bb.bit_length() - 1
+
+def iter_bits(bb):
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+def popcount(bb):
+    return bin(bb).count('1')
+
+def _step_attacks(offsets):
+    table = []
+    for sq in range(64):
+        row, col = row_col(sq)
+        bb = 0
+        for dr, dc in offsets:
+            r, c = row + dr, col + dc
+            if 0 <= r < ROWS and 0 <= c < COLS:
+                bb |= 1 << square(r, c)
+        table.append(bb)
+    return table
+
+KNIGHT_ATTACKS = _step_attacks([(2, 1), (1, 2), (-1, 2), (-2, 1),
+                                (-2, -1), (-1, -2), (1, -2), (2, -1)])
+KING_ATTACKS = _step_attacks([(1, 0), (1, 1), (0, 1), (-1, 1),
+                              (-1, 0), (-1, -1), (0, -1), (1, -1)])
+PAWN_ATTACKS = {
+    'w': _step_attacks([(-1, -1), (-1, 1)]),
+    'b': _step_attacks([(1, -1), (1, 1)])
+}
+
+# Ray directions as (dr, dc). Rays going towards higher square numbers find
+# their first blocker with lsb, the others with msb.
+ORTHOGONAL = [(1, 0), (0, 1), (-1, 0), (0, -1)]
+DIAGONAL = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+
+def _ray_table(dr, dc):
+    table = []
+    for sq in range(64):
+        row, col = row_col(sq)
+        bb = 0
+        r, c = row + dr, col + dc
+        while 0 <= r < ROWS and 0 <= c < COLS:
+            bb |= 1 << square(r, c)
+            r += dr
+            c += dc
+        table.append(bb)
+    return table
+
+def _positive(dr, dc):
+    return dr * 8 + dc > 0
+
+RAYS = {direction: _ray_table(*direction) for direction in ORTHOGONAL + DIAGONAL}
+ORTHOGONAL_RAYS = [(RAYS[d], _positive(*d)) for d in ORTHOGONAL]
+DIAGONAL_RAYS = [(RAYS[d], _positive(*d)) for d in DIAGONAL]
+
+def _sliding_attacks(rays, sq, occupied):
+    attacks = 0
+    for table, positive in rays:
+        ray = table[sq]
+        blockers = ray & occupied
+        if blockers:
+            blocker = lsb(blockers) if positive else msb(blockers)
+            ray ^= table[blocker]
+        attacks |= ray
+    return attacks
+
+def _between_table():
+    table = [[0] * 64 for _ in range(64)]
+    for sq in range(64):
+        for dr, dc in ORTHOGONAL + DIAGONAL:
+            row, col = row_col(sq)
+            bb = 0
+            r, c = row + dr, col + dc
+            while 0 <= r < ROWS and 0 <= c < COLS:
+                table[sq][square(r, c)] = bb
+                bb |= 1 << square(r, c)
+                r += dr
+                c += dc
+    return table
+
+# BETWEEN[a][b] holds the squares strictly between a and b when they share a
+# line, and 0 otherwise.
+BETWEEN = _between_table()
+
+def rook_attacks(sq, occupied):
+    return _sliding_attacks(ORTHOGONAL_RAYS, sq, occupied)
+
+def bishop_attacks(sq, occupied):
+    return _sliding_attacks(DIAGONAL_RAYS, sq, occupied)
+
+def queen_attacks(sq, occupied):
+    return _sliding_attacks(ORTHOGONAL_RAYS, sq, occupied) | _sliding_attacks(DIAGONAL_RAYS, sq, occupied)
+
+def piece_attacks(piece, sq, occupied):
+    piece_type = piece[1]
+    if piece_type == 'p':
+        return PAWN_ATTACKS[piece[0]][sq]
+    if piece_type == 'n':
+        return KNIGHT_ATTACKS[sq]
+    if piece_type == 'b':
+        return bishop_attacks(sq, occupied)
+    if piece_type == 'r':
+        return rook_attacks(sq, occupied)
+    if piece_type == 'q':
+        return queen_attacks(sq, occupied)
+    return KING_ATTACKS[sq]
+
+# Rights lost when a move touches a king or rook home square
+CASTLING_MASK = [15] * 64
+CASTLING_MASK[square(7, 4)] &= ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
+CASTLING_MASK[square(7, 7)] &= ~WHITE_KINGSIDE
+CASTLING_MASK[square(7, 0)] &= ~WHITE_QUEENSIDE
+CASTLING_MASK[square(0, 4)] &= ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
+CASTLING_MASK[square(0, 7)] &= ~BLACK_KINGSIDE
+CASTLING_MASK[square(0, 0)] &= ~BLACK_QUEENSIDE
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+FEN_CASTLING = {'K': WHITE_KINGSIDE, 'Q': WHITE_QUEENSIDE,
+                'k': BLACK_KINGSIDE, 'q': BLACK_QUEENSIDE}
+
+def fen_piece(char):
+    return ('w' if char.isupper() else 'b') + char.lower()
+
+def parse_square(name):
+    return square(8 - int(name[1]), ord(name[0]) - ord('a'))
+
+def square_name(sq):
+    row, col = row_col(sq)
+    return 'abcdefgh'[col] + str(8 - row)
+
+def castling_from_has_moved(has_moved):
+    rights = WHITE_KINGSIDE | WHITE_QUEENSIDE | BLACK_KINGSIDE | BLACK_QUEENSIDE
+    for key, mask in HAS_MOVED_RIGHTS.items():
+        if has_moved.get(key):
+            rights &= ~mask
+    return rights
+
+class BoardRow:
+    # Lets code written for the list-of-lists board index a Position as
+    # position[row][col], both for reading and for assignment.
+    __slots__ = ('position', 'row')
+
+    def __init__(self, position, row):
+        self.position = position
+        self.row = row
+
+    def __getitem__(self, col):
+        return self.position.squares[self.row * 8 + col]
+
+    def __setitem__(self, col, piece):
+        self.position.set_piece(self.row * 8 + col, piece)
+
+    def __iter__(self):
+        start = self.row * 8
+        return iter(self.position.squares[start:start + 8])
+
+    def __len__(self):
+        return COLS
+
+# Snapshot piece codes: 0 is an empty square
+SNAPSHOT_CODES = {piece: i + 1 for i, piece in enumerate(PIECES)}
+SNAPSHOT_PIECES = [None] + PIECES
+SNAPSHOT_SIZE = 37
+
+class Position:
+    __slots__ = ('bitboards', 'occupied', 'squares', 'turn', 'en_passant', 'castling',
+                 'halfmove_clock', 'fullmove_number', 'hash')
+
+    def __init__(self):
+        self.bitboards = dict.fromkeys(PIECES, 0)
+        self.occupied = {'w': 0, 'b': 0}
+        self.squares = [None] * 64
+        self.turn = 'w'
+        self.en_passant = None
+        self.castling = 0
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+        # Zobrist hash, kept up to date by set_piece and make_move. Call
+        # compute_hash() after setting turn, castling or en_passant directly.
+        self.hash = 0
+
+    @classmethod
+    def from_board(cls, board, turn='w', en_passant_target=None, has_moved=None):
+        position = cls()
+        for row in range(ROWS):
+            for col in range(COLS):
+                piece = board[row][col]
+                if piece:
+                    position.set_piece(square(row, col), piece)
+        position.turn = turn
+        if en_passant_target:
+            position.en_passant = square(*en_passant_target)
+        position.castling = castling_from_has_moved(has_moved or {})
+        position.hash = position.compute_hash()
+        return position
+
+    @classmethod
+    def from_fen(cls, fen):
+        fields = fen.split()
+        position = cls()
+        for row, rank in enumerate(fields[0].split('/')):
+            col = 0
+            for char in rank:
+                if char.isdigit():
+                    col += int(char)
+                else:
+                    position.set_piece(square(row, col), fen_piece(char))
+                    col += 1
+        position.turn = fields[1] if len(fields) > 1 else 'w'
+        if len(fields) > 2:
+            for char in fields[2]:
+                position.castling |= FEN_CASTLING.get(char, 0)
+        if len(fields) > 3 and fields[3] != '-':
+            position.en_passant = parse_square(fields[3])
+        if len(fields) > 5:
+            position.halfmove_clock = int(fields[4])
+            position.fullmove_number = int(fields[5])
+        position.hash = position.compute_hash()
+        return position
+
+    def to_fen(self):
+        ranks = []
+        for row in range(ROWS):
+            rank = ''
+            empty = 0
+            for piece in self.squares[row * 8:row * 8 + 8]:
+                if piece is None:
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += piece[1].upper() if piece[0] == 'w' else piece[1]
+            ranks.append(rank + (str(empty) if empty else ''))
+        castling = ''.join(char for char, right in FEN_CASTLING.items() if self.castling & right)
+        ep = square_name(self.en_passant) if self.en_passant is not None else '-'
+        return f"{'/'.join(ranks)} {self.turn} {castling or '-'} {ep} {self.halfmove_clock} {self.fullmove_number}"
+
+    def snapshot(self):
+        # Immutable 37-byte copy of the position: two squares per byte, then
+        # side to move and castling rights, en passant square (255 for
+        # none), halfmove clock and a 16-bit fullmove number.
+        codes = [SNAPSHOT_CODES[piece] if piece else 0 for piece in self.squares]
+        packed = bytearray(codes[i] << 4 | codes[i + 1] for i in range(0, 64, 2))
+        packed.append((self.turn == 'b') | self.castling << 1)
+        packed.append(255 if self.en_passant is None else self.en_passant)
+        packed.append(min(self.halfmove_clock, 255))
+        packed += self.fullmove_number.to_bytes(2, 'little')
+        return bytes(packed)
+
+    @classmethod
+    def from_snapshot(cls, data):
+        position = cls()
+        for i in range(32):
+            high, low = data[i] >> 4, data[i] & 15
+            if high:
+                position.set_piece(2 * i, SNAPSHOT_PIECES[high])
+            if low:
+                position.set_piece(2 * i + 1, SNAPSHOT_PIECES[low])
+        position.turn = 'b' if data[32] & 1 else 'w'
+        position.castling = data[32] >> 1
+        position.en_passant = None if data[33] == 255 else data[33]
+        position.halfmove_clock = data[34]
+        position.fullmove_number = int.from_bytes(data[35:37], 'little')
+        position.hash = position.compute_hash()
+        return position
+
+    def to_board(self):
+        return [self.squares[row * 8:row * 8 + 8] for row in range(ROWS)]
+
+    def copy(self):
+        position = Position.__new__(Position)
+        position.bitboards = dict(self.bitboards)
+        position.occupied = dict(self.occupied)
+        position.squares = list(self.squares)
+        position.turn = self.turn
+        position.en_passant = self.en_passant
+        position.castling = self.castling
+        position.halfmove_clock = self.halfmove_clock
+        position.fullmove_number = self.fullmove_number
+        position.hash = self.hash
+        return position
+
+    def __getitem__(self, row):
+        return BoardRow(self, row)
+
+    def __iter__(self):
+        return (BoardRow(self, row) for row in range(ROWS))
+
+    def __len__(self):
+        return ROWS
+
+    @property
+    def all_occupied(self):
+        return self.occupied['w'] | self.occupied['b']
+
+    @property
+    def has_moved(self):
+        # The has_moved dict main() used to keep, derived from the castling rights
+        return {key: not self.castling & mask for key, mask in HAS_MOVED_RIGHTS.items()}
+
+    @property
+    def en_passant_target(self):
+        return row_col(self.en_passant) if self.en_passant is not None else None
+
+    def set_piece(self, sq, piece):
+        old = self.squares[sq]
+        bit = 1 << sq
+        if old:
+            self.bitboards[old] ^= bit
+            self.occupied[old[0]] ^= bit
+            self.hash ^= PIECE_KEYS[old][sq]
+        if piece:
+            self.bitboards[piece] |= bit
+            self.occupied[piece[0]] |= bit
+            self.hash ^= PIECE_KEYS[piece][sq]
+        self.squares[sq] = piece
+
+    def compute_hash(self):
+        h = 0
+        for sq, piece in enumerate(self.squares):
+            if piece:
+                h ^= PIECE_KEYS[piece][sq]
+        if self.turn == 'b':
+            h ^= SIDE_KEY
+        return h ^ CASTLING_KEYS[self.castling] ^ self._en_passant_hash()
+
+    def _en_passant_hash(self):
+        # The en passant file is only hashed when the side to move has a pawn
+        # that can take, so an unusable en passant square does not stop a
+        # position from counting as a repetition.
+        ep = self.en_passant
+        if ep is None:
+            return 0
+        mover = 'b' if self.turn == 'w' else 'w'
+        if PAWN_ATTACKS[mover][ep] & self.bitboards[self.turn + 'p']:
+            return EN_PASSANT_KEYS[ep & 7]
+        return 0
+
+    def make_move(self, move):
+        # Applies a (from_sq, to_sq, promotion) move and returns what
+        # unmake_move needs to take it back.
+        from_sq, to_sq, promotion = move
+        squares = self.squares
+        piece = squares[from_sq]
+        color = piece[0]
+        captured = squares[to_sq]
+        captured_sq = to_sq
+        undo = (captured, captured_sq, self.en_passant, self.castling, self.halfmove_clock, self.hash)
+        self.hash ^= self._en_passant_hash() ^ CASTLING_KEYS[self.castling] ^ SIDE_KEY
+
+        self.halfmove_clock += 1
+        self.en_passant = None
+        if piece[1] == 'p':
+            self.halfmove_clock = 0
+            if to_sq == undo[2]:
+                captured_sq = to_sq + 8 if color == 'w' else to_sq - 8
+                captured = squares[captured_sq]
+                undo = (captured, captured_sq) + undo[2:]
+                self.set_piece(captured_sq, None)
+            elif abs(to_sq - from_sq) == 16:
+                self.en_passant = (from_sq + to_sq) // 2
+        elif piece[1] == 'k' and abs(to_sq - from_sq) == 2:
+            if to_sq > from_sq:
+                self.set_piece(from_sq + 1, squares[from_sq + 3])
+                self.set_piece(from_sq + 3, None)
+            else:
+                self.set_piece(from_sq - 1, squares[from_sq - 4])
+                self.set_piece(from_sq - 4, None)
+        if captured:
+            self.halfmove_clock = 0
+
+        self.set_piece(from_sq, None)
+        self.set_piece(to_sq, color + promotion if promotion else piece)
+        self.castling &= CASTLING_MASK[from_sq] & CASTLING_MASK[to_sq]
+        if color == 'b':
+            self.fullmove_number += 1
+        self.turn = 'b' if color == 'w' else 'w'
+        self.hash ^= CASTLING_KEYS[self.castling] ^ self._en_passant_hash()
+        return undo
+
+    def unmake_move(self, move, undo):
+        from_sq, to_sq, promotion = move
+        captured, captured_sq, self.en_passant, self.castling, self.halfmove_clock, old_hash = undo
+        piece = self.squares[to_sq]
+        color = piece[0]
+        if promotion:
+            piece = color + 'p'
+        self.set_piece(to_sq, None)
+        self.set_piece(from_sq, piece)
+        if captured:
+            self.set_piece(captured_sq, captured)
+        if piece[1] == 'k' and abs(to_sq - from_sq) == 2:
+            if to_sq > from_sq:
+                self.set_piece(from_sq + 3, self.squares[from_sq + 1])
+                self.set_piece(from_sq + 1, None)
+            else:
+                self.set_piece(from_sq - 4, self.squares[from_sq - 1])
+                self.set_piece(from_sq - 1, None)
+        if color == 'b':
+            self.fullmove_number -= 1
+        self.turn = color
+        self.hash = old_hash
+
+    def king_square(self, color):
+        king = self.bitboards[color + 'k']
+        return lsb(king) if king else None
+
+    def is_square_attacked(self, sq, by_color):
+        bb = self.bitboards
+        defender = 'b' if by_color == 'w' else 'w'
+        if PAWN_ATTACKS[defender][sq] & bb[by_color + 'p']:
+            return True
+        if KNIGHT_ATTACKS[sq] & bb[by_color + 'n']:
+            return True
+        if KING_ATTACKS[sq] & bb[by_color + 'k']:
+            return True
+        occupied = self.all_occupied
+        queens = bb[by_color + 'q']
+        if bishop_attacks(sq, occupied) & (bb[by_color + 'b'] | queens):
+            return True
+        if rook_attacks(sq, occupied) & (bb[by_color + 'r'] | queens):
+            return True
+        return False
+
+    def is_valid_move(self, piece, start, end, en_passant_target, has_moved):
+        # Same rules as PyMain.is_valid_move, answered with bitboard lookups.
+        color = piece[0]
+        piece_type = piece[1]
+        from_sq = square(*start)
+        to_sq = square(*end)
+        to_bit = 1 << to_sq
+
+        if self.occupied[color] & to_bit:
+            return False
+
+        if piece_type == 'p':
+            enemy = self.occupied['b' if color == 'w' else 'w']
+            if PAWN_ATTACKS[color][from_sq] & to_bit:
+                if enemy & to_bit:
+                    return True
+                return en_passant_target is not None and square(*en_passant_target) == to_sq
+            occupied = self.all_occupied
+            step = -8 if color == 'w' else 8
+            if to_sq == from_sq + step:
+                return not occupied & to_bit
+            home_row = 6 if color == 'w' else 1
+            if to_sq == from_sq + 2 * step and start[0] == home_row:
+                return not occupied & (to_bit | 1 << (from_sq + step))
+            return False
+
+        if piece_type == 'k':
+            if KING_ATTACKS[from_sq] & to_bit:
+                return True
+            dc = end[1] - start[1]
+            if end[0] != start[0] or abs(dc) != 2:
+                return False
+            rook_sq = square(start[0], 7 if dc > 0 else 0)
+            if self.squares[rook_sq] != color + 'r':
+                return False
+            # The rook sits on the edge, so the ray towards it ends on it
+            between = RAYS[(0, 1 if dc > 0 else -1)][from_sq] ^ (1 << rook_sq)
+            if self.all_occupied & between:
+                return False
+            side = 'ks' if dc > 0 else 'qs'
+            return not has_moved[f'{color}_king'] and not has_moved[f'{color}_rook_{side}']
+
+        return bool(piece_attacks(piece, from_sq, self.all_occupied) & to_bit)
@@ -0,0 +1,185 @@
+import argparse
+import mmap
+import os
+import random
+import struct
+
+from bitboard import Position, START_FEN
+from movegen import generate_moves, move_to_uci
+
+# Records use the Polyglot .bin layout: 16 bytes, big-endian, sorted by key.
+#   key    u64  Position.hash
+#   move   u16  to file, to rank, from file, from rank (3 bits each, rank 0 is
+#               white's back rank), then promotion (1 n, 2 b, 3 r, 4 q);
+#               castling is written as the king taking its own rook
+#   weight u16  how good the move is, higher is better
+#   learn  u32  free for the writer; endgame tables keep the distance to
+#               mate in plies here
+# The keys are this repo's Zobrist keys rather than Polyglot's fixed
+# Random64 table, so books must be built with build_book() here.
+ENTRY = struct.Struct('>QHHI')
+ENTRY_BYTES = ENTRY.size
+KEY = struct.Struct('>Q')
+
+POLYGLOT_PROMOTIONS = {None: 0, 'n': 1, 'b': 2, 'r': 3, 'q': 4}
+PROMOTIONS_FROM_POLYGLOT = {code: piece for piece, code in POLYGLOT_PROMOTIONS.items()}
+
+def _polyglot_square(sq):
+    row, col = divmod(sq, 8)
+    return (7 - row) * 8 + col
+
+def polyglot_code(move):
+    from_sq, to_sq, promotion = move
+    return (_polyglot_square(to_sq)
+            | _polyglot_square(from_sq) << 6
+            | POLYGLOT_PROMOTIONS[promotion] << 12)
+
+def polyglot_move(code):
+    # The move a code names, without the castling translation
+    return (_polyglot_square(code >> 6 & 63), _polyglot_square(code & 63),
+            PROMOTIONS_FROM_POLYGLOT.get(code >> 12 & 7))
+
+def encode_polyglot_move(position, move):
+    from_sq, to_sq, promotion = move
+    if position.squares[from_sq][1] == 'k' and abs(to_sq - from_sq) == 2:
+        to_sq = from_sq + 3 if to_sq > from_sq else from_sq - 4
+    return polyglot_code((from_sq, to_sq, promotion))
+
+def decode_polyglot_move(position, code):
+    from_sq, to_sq, promotion = polyglot_move(code)
+    piece = position.squares[from_sq]
+    rook = position.squares[to_sq]
+    if piece and piece[1] == 'k' and rook == piece[0] + 'r':
+        to_sq = from_sq + 2 if to_sq > from_sq else from_sq - 2
+    return (from_sq, to_sq, promotion)
+
+def write_book(path, entries):
+    # entries: iterable of (key, move code, weight, learn)
+    with open(path, 'wb') as f:
+        for entry in sorted(entries):
+            f.write(ENTRY.pack(*entry))
+
+class Book:
+    # Read-only view of a book file through mmap. Opening costs nothing;
+    # lookups binary search the sorted records and the OS page cache keeps
+    # the parts that get used.
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        size = os.path.getsize(path)
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self.count = size // ENTRY_BYTES
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        if self.map:
+            self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _key_at(self, i):
+        return KEY.unpack_from(self.map, i * ENTRY_BYTES)[0]
+
+    def find(self, key):
+        # All (move code, weight, learn) records stored for key
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        records = []
+        while lo < self.count:
+            entry_key, move, weight, learn = ENTRY.unpack_from(self.map, lo * ENTRY_BYTES)
+            if entry_key != key:
+                break
+            records.append((move, weight, learn))
+            lo += 1
+        return records
+
+    def moves(self, position):
+        # Legal (move, weight, learn) records for position
+        records = self.find(position.hash)
+        if not records:
+            return []
+        legal = generate_moves(position)
+        found = []
+        for code, weight, learn in records:
+            move = decode_polyglot_move(position, code)
+            if move in legal:
+                found.append((move, weight, learn))
+        return found
+
+    def probe(self, position, rng=None):
+        # Picks a book move at random in proportion to its weight
+        records = [(move, weight) for move, weight, _ in self.moves(position) if weight]
+        if not records:
+            return None
+        rng = rng or random
+        pick = rng.randrange(sum(weight for _, weight in records))
+        for move, weight in records:
+            pick -= weight
+            if pick < 0:
+                return move
+        return records[-1][0]
+
+def probe_books(books, position, rng=None):
+    # The first book or endgame table that knows the position answers
+    for book in books or ():
+        move = book.probe(position, rng)
+        if move:
+            return move
+    return None
+
+def build_book(pgn_paths, path, max_plies=20, min_games=2):
+    # Counts how often each move was played in the first max_plies of the
+    # games and keeps moves seen in at least min_games games.
+    from pgn import read_games, PgnError
+    counts = {}
+    for pgn_path in pgn_paths:
+        for pgn_game in read_games(pgn_path):
+            try:
+                moves = pgn_game.moves()[:max_plies]
+            except PgnError:
+                continue
+            position = pgn_game.start_position()
+            for move in moves:
+                entry = (position.hash, encode_polyglot_move(position, move))
+                counts[entry] = counts.get(entry, 0) + 1
+                position.make_move(move)
+    entries = [(key, code, min(count, 65535), 0)
+               for (key, code), count in counts.items() if count >= min_games]
+    write_book(path, entries)
+    return len(entries)
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or query an opening book')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='build a book from PGN files')
+    build.add_argument('pgn', nargs='+')
+    build.add_argument('-o', '--output', default='book.bin')
+    build.add_argument('--plies', type=int, default=20)
+    build.add_argument('--min-games', type=int, default=2)
+    probe = commands.add_parser('probe', help='list book moves for a position')
+    probe.add_argument('book')
+    probe.add_argument('--fen', default=START_FEN)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        count = build_book(args.pgn, args.output, args.plies, args.min_games)
+        print(f'{count} entries written to {args.output}')
+        return
+    with Book(args.book) as book:
+        for move, weight, learn in book.moves(Position.from_fen(args.fen)):
+            print(f'{move_to_uci(move)} weight {weight} learn {learn}')
+
+if __name__ == "__main__":
+    main()
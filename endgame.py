@@ -0,0 +1,182 @@
+import argparse
+import os
+import time
+
+from bitboard import KING_ATTACKS, iter_bits, popcount, queen_attacks, rook_attacks
+from book import Book, polyglot_code, polyglot_move, write_book
+from movegen import generate_moves
+from zobrist import CASTLING_KEYS, PIECE_KEYS, SIDE_KEY
+
+# King and one major piece against a lone king. The tables are solved with
+# white as the strong side; positions where black has the piece are looked
+# up colour-flipped.
+TABLES = {'kqk': 'q', 'krk': 'r'}
+SLIDER_ATTACKS = {'q': queen_attacks, 'r': rook_attacks}
+
+def _index(wk, piece, bk):
+    return wk << 12 | piece << 6 | bk
+
+def _unpack(index):
+    return index >> 12, index >> 6 & 63, index & 63
+
+def table_key(piece_type, wk, piece, bk, turn):
+    # Position.hash of the three-piece position, with no castling rights and
+    # no en passant square
+    key = PIECE_KEYS['wk'][wk] ^ PIECE_KEYS['w' + piece_type][piece] ^ PIECE_KEYS['bk'][bk] ^ CASTLING_KEYS[0]
+    return key ^ SIDE_KEY if turn == 'b' else key
+
+def solve(piece_type):
+    # Retrograde analysis. Every checkmate with black to move is found
+    # first; from each newly lost black position the white moves that lead
+    # into it are taken back to find positions white wins one ply further
+    # from mate, and from each of those the black king moves are taken back.
+    # A black position is lost once every one of its moves leads to a white
+    # win. Returns (white wins, black losses) as {index: (move, plies)}:
+    # the fastest mate for white and the longest defence for black.
+    attacks = SLIDER_ATTACKS[piece_type]
+    moves_left = bytearray(1 << 18)
+    white = {}
+    black = {}
+
+    frontier = []
+    for wk in range(64):
+        for piece in range(64):
+            if piece == wk:
+                continue
+            # The black king does not block the squares it moves along
+            guarded = KING_ATTACKS[wk] | attacks(piece, 1 << wk)
+            for bk in range(64):
+                if bk == wk or bk == piece or KING_ATTACKS[wk] >> bk & 1:
+                    continue
+                count = popcount(KING_ATTACKS[bk] & ~guarded)
+                index = _index(wk, piece, bk)
+                if count:
+                    moves_left[index] = count
+                elif guarded >> bk & 1:
+                    black[index] = (None, 0)
+                    frontier.append(index)
+
+    plies = 0
+    while frontier:
+        wins = []
+        for index in frontier:
+            wk, piece, bk = _unpack(index)
+            occupied = 1 << wk | 1 << piece | 1 << bk
+            # Take back a white king move
+            for from_sq in iter_bits(KING_ATTACKS[wk] & ~occupied & ~KING_ATTACKS[bk]):
+                before = _index(from_sq, piece, bk)
+                if before in white or attacks(piece, 1 << from_sq) >> bk & 1:
+                    continue
+                white[before] = ((from_sq, wk, None), plies + 1)
+                wins.append(before)
+            # Take back a move of the piece
+            for from_sq in iter_bits(attacks(piece, occupied) & ~occupied):
+                before = _index(wk, from_sq, bk)
+                if before in white or attacks(from_sq, 1 << wk) >> bk & 1:
+                    continue
+                white[before] = ((from_sq, piece, None), plies + 1)
+                wins.append(before)
+
+        frontier = []
+        for index in wins:
+            wk, piece, bk = _unpack(index)
+            occupied = 1 << wk | 1 << piece | 1 << bk
+            for from_sq in iter_bits(KING_ATTACKS[bk] & ~occupied & ~KING_ATTACKS[wk]):
+                before = _index(wk, piece, from_sq)
+                if not moves_left[before]:
+                    continue
+                moves_left[before] -= 1
+                if not moves_left[before]:
+                    # Wins are found in order of distance, so the move that
+                    # resolved last is the one that holds out longest
+                    black[before] = ((from_sq, bk, None), plies + 2)
+                    frontier.append(before)
+        plies += 2
+
+    return white, black
+
+def table_entries(piece_type, white, black):
+    for results, turn in ((white, 'w'), (black, 'b')):
+        for index, (move, plies) in results.items():
+            if move:
+                yield (table_key(piece_type, *_unpack(index), turn), polyglot_code(move), 1, plies)
+
+def generate(name, path):
+    piece_type = TABLES[name]
+    white, black = solve(piece_type)
+    write_book(path, table_entries(piece_type, white, black))
+    longest = max(plies for _, plies in white.values())
+    return len(white), len(black), longest
+
+class EndgameTable(Book):
+    # An endgame table file in the book format, with one record per solved
+    # position: the best move, and the distance to mate in plies as learn.
+    def __init__(self, path, name):
+        super().__init__(path)
+        self.name = name
+        self.piece_type = TABLES[name]
+
+    def lookup(self, position):
+        # (best move, plies to mate) when position is in this table. Only
+        # three-piece boards qualify; counting squares rather than piece
+        # names keeps KQQK or KRRK from passing for KQK or KRK.
+        occupied = position.all_occupied
+        if popcount(occupied) != 3:
+            return None
+        pieces = {position.squares[sq]: sq for sq in iter_bits(occupied)}
+        if len(pieces) != 3 or 'wk' not in pieces or 'bk' not in pieces:
+            return None
+        strong = 'w' if 'w' + self.piece_type in pieces else 'b' if 'b' + self.piece_type in pieces else None
+        if strong is None:
+            return None
+        if strong == 'w':
+            flip = 0
+            wk, piece, bk = pieces['wk'], pieces['w' + self.piece_type], pieces['bk']
+            turn = position.turn
+        else:
+            # Mirror the board top to bottom and swap the colours
+            flip = 56
+            wk, piece, bk = pieces['bk'] ^ 56, pieces['b' + self.piece_type] ^ 56, pieces['wk'] ^ 56
+            turn = 'w' if position.turn == 'b' else 'b'
+        records = self.find(table_key(self.piece_type, wk, piece, bk, turn))
+        if not records:
+            return None
+        code, _, plies = records[0]
+        from_sq, to_sq, _ = polyglot_move(code)
+        move = (from_sq ^ flip, to_sq ^ flip, None)
+        if move not in generate_moves(position):
+            return None
+        return move, plies
+
+    def probe(self, position, rng=None):
+        found = self.lookup(position)
+        return found[0] if found else None
+
+def load_tables(directory):
+    # The tables generated into directory, as <name>.bin
+    tables = []
+    for name in TABLES:
+        path = os.path.join(directory, name + '.bin')
+        if os.path.exists(path):
+            tables.append(EndgameTable(path, name))
+    return tables
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate endgame tables by retrograde analysis')
+    parser.add_argument('tables', nargs='*', help=f'any of {", ".join(TABLES)} (default: all)')
+    parser.add_argument('--output-dir', default='.', help='tables are written here as <name>.bin')
+    args = parser.parse_args()
+    for name in args.tables:
+        if name not in TABLES:
+            parser.error(f'unknown table: {name}')
+
+    for name in args.tables or TABLES:
+        start = time.perf_counter()
+        path = os.path.join(args.output_dir, name + '.bin')
+        wins, losses, longest = generate(name, path)
+        elapsed = time.perf_counter() - start
+        print(f'{name}: {wins} wins, {losses} losses, longest mate {longest} plies, '
+              f'{elapsed:.1f}s -> {path}')
+
+if __name__ == "__main__":
+    main()
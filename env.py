@@ -0,0 +1,334 @@
+import argparse
+import multiprocessing
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from batcheval import unpack_bitboards
+from bitboard import PIECES, Position, START_FEN
+from game import Game
+from movegen import decode_move, encode_move
+
+# Environments for training agents on the rules in game.py.
+#
+# Actions are the 16-bit move codes of movegen.encode_move(): from square,
+# to square << 6, promotion piece << 12 (1 queen, 2 rook, 3 bishop,
+# 4 knight), so there are ACTIONS of them and the same numbers are used
+# by the game archive. Castling is the king's two-square move.
+#
+# Observations are PLANES 8x8 uint8 planes, rows as on the board (row 0 is
+# black's back rank): one per piece in PIECES order, then side to move
+# (all ones for white), the four castling rights (white kingside, white
+# queenside, black kingside, black queenside) and the en passant square.
+#
+# A step plays the action for the side to move. The reward, for that side,
+# is 1 for a checkmate and 0 otherwise. Episodes end at checkmate or a
+# draw by the rules (terminated), or after max_plies (truncated).
+ACTIONS = 5 * 4096
+PLANES = 18
+OBSERVATION_SHAPE = (PLANES, 8, 8)
+MAX_LEGAL_MOVES = 256  # the most any position has is 218
+
+def observations(bitboards, turn, castling, en_passant):
+    # Observation planes for a batch of states held in arrays: (N, 12)
+    # bitboards, turn 0 for white and 1 for black, castling rights bits,
+    # and the en passant square or -1
+    count = len(turn)
+    planes = np.zeros((count,) + OBSERVATION_SHAPE, dtype=np.uint8)
+    planes[:, :12] = unpack_bitboards(bitboards)
+    planes[:, 12] = (turn == 0)[:, None, None]
+    for bit in range(4):
+        planes[:, 13 + bit] = (castling >> bit & 1)[:, None, None]
+    rows = np.flatnonzero(en_passant >= 0)
+    squares = en_passant[rows]
+    planes[rows, 17, squares // 8, squares % 8] = 1
+    return planes
+
+def legal_action_masks(legal_codes, legal_counts):
+    # (N, ACTIONS) booleans from the first legal_counts[i] codes of each row
+    count = len(legal_counts)
+    masks = np.zeros((count, ACTIONS), dtype=bool)
+    valid = np.arange(legal_codes.shape[1]) < legal_counts[:, None]
+    rows = np.broadcast_to(np.arange(count)[:, None], legal_codes.shape)
+    masks[rows[valid], legal_codes[valid]] = True
+    return masks
+
+def _position_state(position):
+    bitboards = [position.bitboards[piece] for piece in PIECES]
+    en_passant = -1 if position.en_passant is None else position.en_passant
+    return bitboards, int(position.turn == 'b'), position.castling, en_passant
+
+def _terminal_reward(game):
+    # For the side that just moved
+    return 1.0 if game.winner and game.result != '1/2-1/2' else 0.0
+
+class ChessEnv:
+    # One game with a Gym-style API. reset() returns (observation, info) and
+    # step(action) returns (observation, reward, terminated, truncated,
+    # info); info holds the legal actions for the new position. Everything
+    # is deterministic: the same actions always give the same episode.
+    def __init__(self, max_plies=512, fen=START_FEN):
+        self.max_plies = max_plies
+        self.fen = fen
+        self.game = None
+        self.legal = {}
+
+    def reset(self, seed=None, fen=None):
+        # seed is accepted for API compatibility; nothing here is random
+        self.game = Game(Position.from_fen(fen or self.fen))
+        self._update_legal()
+        return self.observation(), self._info()
+
+    def _update_legal(self):
+        self.legal = {encode_move(move): move for move in self.game.legal_moves()} if not self.game.winner else {}
+
+    def _info(self):
+        return {'legal_actions': np.fromiter(self.legal, dtype=np.uint16, count=len(self.legal)),
+                'result': self.game.result}
+
+    def observation(self):
+        bitboards, turn, castling, en_passant = _position_state(self.game.position)
+        return observations(np.array([bitboards], dtype=np.uint64), np.array([turn]),
+                            np.array([castling]), np.array([en_passant]))[0]
+
+    def legal_action_mask(self):
+        mask = np.zeros(ACTIONS, dtype=bool)
+        mask[list(self.legal)] = True
+        return mask
+
+    def step(self, action):
+        move = self.legal.get(int(action))
+        if move is None:
+            raise ValueError(f'illegal action {action} ({decode_move(int(action))})')
+        self.game.play(move)
+        self._update_legal()
+        terminated = bool(self.game.winner)
+        truncated = not terminated and len(self.game.moves) >= self.max_plies
+        reward = _terminal_reward(self.game) if terminated else 0.0
+        return self.observation(), reward, terminated, truncated, self._info()
+
+# The state of every environment of a VecEnv, one row each
+STATE_ARRAYS = {
+    'bitboards': ((12,), np.uint64),
+    'turn': ((), np.uint8),
+    'castling': ((), np.uint8),
+    'en_passant': ((), np.int8),
+    'plies': ((), np.uint16),
+    'legal_codes': ((MAX_LEGAL_MOVES,), np.uint16),
+    'legal_counts': ((), np.uint16),
+    'actions': ((), np.uint16),
+    'rewards': ((), np.float32),
+    'terminated': ((), np.bool_),
+    'truncated': ((), np.bool_),
+}
+
+class _Shard:
+    # Steps the environments start..stop, reading actions from and writing
+    # results to the shared state arrays
+    def __init__(self, arrays, start, stop, max_plies, fen):
+        self.arrays = arrays
+        self.start = start
+        self.stop = stop
+        self.max_plies = max_plies
+        self.fen = fen
+        self.games = [None] * (stop - start)
+        self.legal = [None] * (stop - start)
+
+    def reset(self):
+        for i in range(self.start, self.stop):
+            self._new_game(i)
+
+    def _new_game(self, i):
+        game = Game(Position.from_fen(self.fen))
+        self.games[i - self.start] = game
+        self.arrays['plies'][i] = 0
+        self._store(i, game)
+
+    def _store(self, i, game):
+        arrays = self.arrays
+        bitboards, turn, castling, en_passant = _position_state(game.position)
+        arrays['bitboards'][i] = bitboards
+        arrays['turn'][i] = turn
+        arrays['castling'][i] = castling
+        arrays['en_passant'][i] = en_passant
+        moves = game.legal_moves() if not game.winner else []
+        codes = [encode_move(move) for move in moves]
+        self.legal[i - self.start] = dict(zip(codes, moves))
+        arrays['legal_codes'][i, :len(codes)] = codes
+        arrays['legal_counts'][i] = len(codes)
+
+    def step(self):
+        arrays = self.arrays
+        actions = arrays['actions']
+        for i in range(self.start, self.stop):
+            game = self.games[i - self.start]
+            game.play(self.legal[i - self.start][int(actions[i])])
+            plies = len(game.moves)
+            terminated = bool(game.winner)
+            truncated = not terminated and plies >= self.max_plies
+            arrays['rewards'][i] = _terminal_reward(game) if terminated else 0.0
+            arrays['terminated'][i] = terminated
+            arrays['truncated'][i] = truncated
+            if terminated or truncated:
+                self._new_game(i)
+            else:
+                arrays['plies'][i] = plies
+                self._store(i, game)
+
+def _attach(specs):
+    # Shared memory blocks and array views on them, from (name, block name,
+    # shape, dtype) specs
+    blocks, arrays = [], {}
+    for name, block_name, shape, dtype in specs:
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+    return blocks, arrays
+
+def _worker(conn, specs, start, stop, max_plies, fen):
+    blocks, arrays = _attach(specs)
+    shard = _Shard(arrays, start, stop, max_plies, fen)
+    while True:
+        command = conn.recv()
+        if command == 'close':
+            break
+        getattr(shard, command)()
+        conn.send(None)
+    del arrays, shard
+    for block in blocks:
+        block.close()
+
+class VecEnv:
+    # num_envs games stepped together. Their state lives in NumPy arrays,
+    # one row per game, so observations and action masks for the whole
+    # batch are built with array operations, and with workers > 1 the
+    # arrays sit in shared memory and each worker process steps its own
+    # slice of the games in place; nothing is pickled per step.
+    #
+    # step(actions) takes one action per game and returns (observations,
+    # rewards, terminated, truncated, info). A finished game is reset at
+    # once, so its row then shows the start of the next episode.
+    # legal_codes[i, :legal_counts[i]] are the legal actions of game i.
+    def __init__(self, num_envs, workers=1, max_plies=512, fen=START_FEN):
+        self.num_envs = num_envs
+        self.blocks = []
+        self.arrays = {}
+        specs = []
+        for name, (shape, dtype) in STATE_ARRAYS.items():
+            shape = (num_envs,) + shape
+            if workers > 1:
+                size = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+                block = shared_memory.SharedMemory(create=True, size=size)
+                self.blocks.append(block)
+                self.arrays[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+                specs.append((name, block.name, shape, dtype))
+            else:
+                self.arrays[name] = np.zeros(shape, dtype=dtype)
+        self.shards = []
+        self.processes = []
+        if workers > 1:
+            bounds = np.linspace(0, num_envs, workers + 1).astype(int)
+            for start, stop in zip(bounds, bounds[1:]):
+                parent, child = multiprocessing.Pipe()
+                process = multiprocessing.Process(target=_worker, daemon=True,
+                                                  args=(child, specs, int(start), int(stop), max_plies, fen))
+                process.start()
+                self.processes.append((process, parent))
+        else:
+            self.shards.append(_Shard(self.arrays, 0, num_envs, max_plies, fen))
+
+    def __getattr__(self, name):
+        arrays = self.__dict__.get('arrays', {})
+        if name in arrays:
+            return arrays[name]
+        raise AttributeError(name)
+
+    def _run(self, command):
+        for shard in self.shards:
+            getattr(shard, command)()
+        for _, conn in self.processes:
+            conn.send(command)
+        for _, conn in self.processes:
+            conn.recv()
+
+    def reset(self, seed=None):
+        self._run('reset')
+        return self.observation(), {}
+
+    def observation(self):
+        arrays = self.arrays
+        return observations(arrays['bitboards'], arrays['turn'], arrays['castling'], arrays['en_passant'])
+
+    def legal_action_mask(self):
+        return legal_action_masks(self.arrays['legal_codes'], self.arrays['legal_counts'])
+
+    def step(self, actions):
+        actions = np.asarray(actions, dtype=np.uint16)
+        arrays = self.arrays
+        valid = np.arange(MAX_LEGAL_MOVES) < arrays['legal_counts'][:, None]
+        legal = ((arrays['legal_codes'] == actions[:, None]) & valid).any(axis=1)
+        if not legal.all():
+            raise ValueError(f'illegal actions for environments {np.flatnonzero(~legal)[:10].tolist()}')
+        arrays['actions'][:] = actions
+        self._run('step')
+        return (self.observation(), arrays['rewards'].copy(), arrays['terminated'].copy(),
+                arrays['truncated'].copy(), {})
+
+    def random_actions(self, rng):
+        # A uniformly random legal action for every game
+        counts = self.arrays['legal_counts']
+        picks = (rng.random(self.num_envs) * counts).astype(np.int64)
+        return self.arrays['legal_codes'][np.arange(self.num_envs), picks]
+
+    def close(self):
+        for process, conn in self.processes:
+            conn.send('close')
+            process.join()
+        self.processes = []
+        self.arrays = {}
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def benchmark(num_envs, steps, worker_counts, seed=1):
+    rng = np.random.default_rng(seed)
+    env = ChessEnv()
+    _, info = env.reset()
+    count = 0
+    start = time.perf_counter()
+    while count < steps * 8:
+        _, _, terminated, truncated, info = env.step(rng.choice(info['legal_actions']))
+        count += 1
+        if terminated or truncated:
+            _, info = env.reset()
+    elapsed = time.perf_counter() - start
+    print(f'ChessEnv:                         {count / elapsed:>10,.0f} steps/sec')
+
+    for workers in worker_counts:
+        with VecEnv(num_envs, workers) as vec:
+            vec.reset()
+            start = time.perf_counter()
+            for _ in range(steps):
+                vec.step(vec.random_actions(rng))
+            elapsed = time.perf_counter() - start
+        print(f'VecEnv {num_envs} envs, {workers} workers: {num_envs * steps / elapsed:>10,.0f} steps/sec')
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the training environments')
+    parser.add_argument('--envs', type=int, default=1024, help='games in the vectorized environment')
+    parser.add_argument('--steps', type=int, default=50, help='batched steps to time')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, multiprocessing.cpu_count()],
+                        help='worker process counts to compare')
+    args = parser.parse_args()
+    benchmark(args.envs, args.steps, sorted(set(args.workers)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+from bitboard import KNIGHT_ATTACKS, bishop_attacks, iter_bits, popcount, queen_attacks, rook_attacks
+
+PIECE_VALUES = {'p': 100, 'n': 320, 'b': 330, 'r': 500, 'q': 900, 'k': 0}
+
+# Piece-square tables from white's point of view, laid out like the board:
+# the first row is black's back rank.
+PIECE_SQUARE_TABLES = {
+    'p': [0, 0, 0, 0, 0, 0, 0, 0,
+          50, 50, 50, 50, 50, 50, 50, 50,
+          10, 10, 20, 30, 30, 20, 10, 10,
+          5, 5, 10, 25, 25, 10, 5, 5,
+          0, 0, 0, 20, 20, 0, 0, 0,
+          5, -5, -10, 0, 0, -10, -5, 5,
+          5, 10, 10, -20, -20, 10, 10, 5,
+          0, 0, 0, 0, 0, 0, 0, 0],
+    'n': [-50, -40, -30, -30, -30, -30, -40, -50,
+          -40, -20, 0, 0, 0, 0, -20, -40,
+          -30, 0, 10, 15, 15, 10, 0, -30,
+          -30, 5, 15, 20, 20, 15, 5, -30,
+          -30, 0, 15, 20, 20, 15, 0, -30,
+          -30, 5, 10, 15, 15, 10, 5, -30,
+          -40, -20, 0, 5, 5, 0, -20, -40,
+          -50, -40, -30, -30, -30, -30, -40, -50],
+    'b': [-20, -10, -10, -10, -10, -10, -10, -20,
+          -10, 0, 0, 0, 0, 0, 0, -10,
+          -10, 0, 5, 10, 10, 5, 0, -10,
+          -10, 5, 5, 10, 10, 5, 5, -10,
+          -10, 0, 10, 10, 10, 10, 0, -10,
+          -10, 10, 10, 10, 10, 10, 10, -10,
+          -10, 5, 0, 0, 0, 0, 5, -10,
+          -20, -10, -10, -10, -10, -10, -10, -20],
+    'r': [0, 0, 0, 0, 0, 0, 0, 0,
+          5, 10, 10, 10, 10, 10, 10, 5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          0, 0, 0, 5, 5, 0, 0, 0],
+    'q': [-20, -10, -10, -5, -5, -10, -10, -20,
+          -10, 0, 0, 0, 0, 0, 0, -10,
+          -10, 0, 5, 5, 5, 5, 0, -10,
+          -5, 0, 5, 5, 5, 5, 0, -5,
+          0, 0, 5, 5, 5, 5, 0, -5,
+          -10, 5, 5, 5, 5, 5, 0, -10,
+          -10, 0, 5, 0, 0, 0, 0, -10,
+          -20, -10, -10, -5, -5, -10, -10, -20],
+    'k': [-30, -40, -40, -50, -50, -40, -40, -30,
+          -30, -40, -40, -50, -50, -40, -40, -30,
+          -30, -40, -40, -50, -50, -40, -40, -30,
+          -30, -40, -40, -50, -50, -40, -40, -30,
+          -20, -30, -30, -40, -40, -30, -30, -20,
+          -10, -20, -20, -20, -20, -20, -20, -10,
+          20, 20, 0, 0, 0, 0, 20, 20,
+          20, 30, 10, 0, 0, 10, 30, 20]
+}
+
+def _square_scores():
+    # Material plus placement for every piece and square, signed so that
+    # white pieces count positive and black pieces negative. Black reads the
+    # white table upside down (sq ^ 56 flips the row).
+    scores = {}
+    for piece_type, table in PIECE_SQUARE_TABLES.items():
+        value = PIECE_VALUES[piece_type]
+        scores['w' + piece_type] = [value + table[sq] for sq in range(64)]
+        scores['b' + piece_type] = [-(value + table[sq ^ 56]) for sq in range(64)]
+    return scores
+
+SQUARE_SCORES = _square_scores()
+
+# Centipawns per square a piece attacks that is not taken by its own side
+MOBILITY_WEIGHTS = {'n': 4, 'b': 5, 'r': 2, 'q': 1}
+DOUBLED_PAWN = -15  # for every pawn beyond the first on a file
+ISOLATED_PAWN = -12  # for every pawn with no friendly pawn on a neighbouring file
+# Passed pawn bonus by rank counted from the pawn's own side, 1st rank first
+PASSED_PAWN_BONUS = [0, 5, 10, 20, 35, 60, 100, 0]
+
+FILE_MASKS = [sum(1 << (row * 8 + col) for row in range(8)) for col in range(8)]
+ADJACENT_FILES = [(FILE_MASKS[col - 1] if col > 0 else 0) | (FILE_MASKS[col + 1] if col < 7 else 0)
+                  for col in range(8)]
+
+def _passed_masks(color):
+    # The squares ahead of a pawn, on its file and the neighbouring ones,
+    # that an enemy pawn would have to stand on to stop it
+    masks = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        ahead = range(row) if color == 'w' else range(row + 1, 8)
+        rows = sum(0xFF << (r * 8) for r in ahead)
+        masks.append(rows & (FILE_MASKS[col] | ADJACENT_FILES[col]))
+    return masks
+
+PASSED_MASKS = {'w': _passed_masks('w'), 'b': _passed_masks('b')}
+
+def pawn_structure(pawns, enemy_pawns, color):
+    # Doubled, isolated and passed pawn terms for one side. evaluate() goes
+    # through pawn_score(), which caches both sides together.
+    score = 0
+    for col in range(8):
+        count = popcount(pawns & FILE_MASKS[col])
+        if count:
+            score += DOUBLED_PAWN * (count - 1)
+            if not pawns & ADJACENT_FILES[col]:
+                score += ISOLATED_PAWN * count
+    masks = PASSED_MASKS[color]
+    for sq in iter_bits(pawns):
+        if not masks[sq] & enemy_pawns:
+            score += PASSED_PAWN_BONUS[7 - sq // 8 if color == 'w' else sq // 8]
+    return score
+
+# Pawns move rarely, so the same pawn structure comes up again and again
+# within a search
+PAWN_CACHE_SIZE = 1 << 16
+_pawn_cache = {}
+
+def pawn_score(white_pawns, black_pawns):
+    key = (white_pawns, black_pawns)
+    score = _pawn_cache.get(key)
+    if score is None:
+        if len(_pawn_cache) >= PAWN_CACHE_SIZE:
+            _pawn_cache.clear()
+        score = pawn_structure(white_pawns, black_pawns, 'w') - pawn_structure(black_pawns, white_pawns, 'b')
+        _pawn_cache[key] = score
+    return score
+
+def _knight_attacks(sq, occupied):
+    return KNIGHT_ATTACKS[sq]
+
+MOBILITY_ATTACKS = [('n', _knight_attacks), ('b', bishop_attacks), ('r', rook_attacks), ('q', queen_attacks)]
+
+def mobility(position, color):
+    bitboards = position.bitboards
+    occupied = position.all_occupied
+    free = ~position.occupied[color]
+    score = 0
+    for piece_type, attacks in MOBILITY_ATTACKS:
+        bb = bitboards[color + piece_type]
+        if bb:
+            weight = MOBILITY_WEIGHTS[piece_type]
+            for sq in iter_bits(bb):
+                score += weight * popcount(attacks(sq, occupied) & free)
+    return score
+
+def evaluate(position):
+    # Static score in centipawns from the side to move's point of view:
+    # material and placement, mobility and pawn structure. batcheval.py
+    # computes the same score for many positions at once with NumPy.
+    bitboards = position.bitboards
+    score = 0
+    for piece, bb in bitboards.items():
+        if bb:
+            table = SQUARE_SCORES[piece]
+            for sq in iter_bits(bb):
+                score += table[sq]
+    score += mobility(position, 'w') - mobility(position, 'b')
+    score += pawn_score(bitboards['wp'], bitboards['bp'])
+    return score if position.turn == 'w' else -score
@@ -0,0 +1,192 @@
+import argparse
+import math
+import sys
+
+import pygame
+
+from PyMain import IDLE_TIMEOUT_MS, SEARCH_DONE, coalesce_motion, draw_board, next_events
+from game import Game
+from movegen import move_from_squares
+from parallel import ROOT_SPLIT, ParallelSearch
+from renderer import DirtyRenderer
+from sprites import SpriteCache
+from worker import SearchWorker
+
+MAX_BOARDS = 16
+MARGIN = 8
+BACKGROUND = (40, 44, 52)
+RESULT_COLOR = (0, 0, 0)
+
+def grid_shape(count):
+    cols = math.ceil(math.sqrt(count))
+    return math.ceil(count / cols), cols
+
+def layout(window_size, count):
+    # Square size and the top-left corner of every board, filling the
+    # window row by row with the boards as large as fit
+    width, height = window_size
+    rows, cols = grid_shape(count)
+    board = min((width - MARGIN * (cols + 1)) // cols, (height - MARGIN * (rows + 1)) // rows)
+    square_size = max(4, board // 8)
+    board = square_size * 8
+    left = (width - cols * board - (cols - 1) * MARGIN) // 2
+    top = (height - rows * board - (rows - 1) * MARGIN) // 2
+    origins = [(left + (i % cols) * (board + MARGIN), top + (i // cols) * (board + MARGIN))
+               for i in range(count)]
+    return square_size, origins
+
+class Board:
+    # One game of the exhibition with its own state and renderer
+    def __init__(self):
+        self.game = Game()
+        self.selected_piece = None
+        self.renderer = None
+        self.drawn_result = None
+
+    def restart(self):
+        self.game = Game()
+        self.selected_piece = None
+
+    def square_at(self, pos):
+        # (row, col) under a window position, or None when off this board
+        if not self.renderer.rect.collidepoint(pos):
+            return None
+        size = self.renderer.square_size
+        x, y = self.renderer.origin
+        return (pos[1] - y) // size, (pos[0] - x) // size
+
+def draw_result(win, rect, text, square_size):
+    font = pygame.font.SysFont('Arial', max(12, square_size * 3 // 5))
+    label = font.render(text, True, RESULT_COLOR)
+    win.blit(label, label.get_rect(center=rect.center))
+
+def main(count=4, human='w', ai_time_ms=200, size=(960, 960)):
+    # A simultaneous exhibition: count independent games in one resizable
+    # window. The human plays the same colour on every board by dragging
+    # pieces and the engine answers the boards in turn, one search at a
+    # time. With human None the engine plays both sides everywhere.
+    # Promotions are always to a queen here. Press R to restart every game.
+    pygame.init()
+    win = pygame.display.set_mode(size, pygame.RESIZABLE)
+    clock = pygame.time.Clock()
+    sprite_cache = SpriteCache('images')
+    boards = [Board() for _ in range(count)]
+    # The engine searches in its own process, so it does not hold the GIL
+    # while the boards are drawn
+    engine = ParallelSearch(1, ROOT_SPLIT, tt_mb=16)
+    worker = SearchWorker(engine, notify=lambda: pygame.event.post(pygame.event.Event(SEARCH_DONE)))
+    thinking = None  # the board the engine is searching for
+    images = None
+
+    def arrange():
+        nonlocal images
+        square_size, origins = layout(win.get_size(), count)
+        images = sprite_cache.sprites(square_size)
+        board_size = (square_size * 8, square_size * 8)
+        for board, origin in zip(boards, origins):
+            board.renderer = DirtyRenderer(board_size, square_size, draw_board, origin)
+            board.selected_piece = None
+        win.fill(BACKGROUND)
+        pygame.display.flip()
+
+    def overlay_for(board):
+        def draw(win):
+            draw_result(win, board.renderer.rect, board.game.winner, board.renderer.square_size)
+        return draw
+
+    arrange()
+    dragging = None
+    next_board = 0
+    run = True
+    while run:
+        played = False
+        rects = []
+        for board in boards:
+            if board.game.winner != board.drawn_result:
+                board.renderer.invalidate()
+                board.drawn_result = board.game.winner
+            overlay = overlay_for(board) if board.game.winner else None
+            rects += board.renderer.render(win, board.game.position, images, board.selected_piece,
+                                           overlay, update=False)
+        if rects:
+            pygame.display.update(rects)
+        pygame.display.set_caption(f'Exhibition - {count} boards, {clock.get_fps():.0f} fps')
+
+        # Answer the boards waiting for the engine in turn
+        if thinking is None:
+            for i in range(count):
+                board = boards[(next_board + i) % count]
+                if not board.game.winner and board.game.turn != human:
+                    thinking = board
+                    next_board = (boards.index(board) + 1) % count
+                    worker.start(board.game.position, ai_time_ms, board.game.repetitions)
+                    break
+        else:
+            result = worker.poll()
+            if result:
+                thinking.game.play(result['move'])
+                thinking = None
+                played = True
+
+        # Draw at full frame rate only while a piece is dragged, or to show
+        # the engine's move and start the next search; otherwise sleep until
+        # an event or a finished search wakes the loop
+        if dragging or played:
+            clock.tick(60)
+            timeout = None
+        else:
+            timeout = IDLE_TIMEOUT_MS
+        for event in coalesce_motion(next_events(timeout)):
+            if event.type == pygame.QUIT:
+                run = False
+
+            elif event.type == pygame.VIDEORESIZE:
+                win = pygame.display.get_surface()
+                dragging = None
+                arrange()
+
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_r:
+                worker.cancel()
+                thinking = dragging = None
+                for board in boards:
+                    board.restart()
+
+            elif event.type == pygame.MOUSEBUTTONDOWN:
+                for board in boards:
+                    square = board.square_at(event.pos)
+                    if square is None or board.game.winner or board.game.turn != human:
+                        continue
+                    piece = board.game.position[square[0]][square[1]]
+                    if piece and piece[0] == human:
+                        board.selected_piece = {'piece': piece, 'pos': square, 'mouse_pos': event.pos}
+                        dragging = board
+                    break
+
+            elif event.type == pygame.MOUSEMOTION and dragging:
+                dragging.selected_piece['mouse_pos'] = event.pos
+
+            elif event.type == pygame.MOUSEBUTTONUP and dragging:
+                start = dragging.selected_piece['pos']
+                end = dragging.square_at(event.pos)
+                if end and dragging.game.is_valid_move(start, end):
+                    promotion = 'q' if dragging.selected_piece['piece'][1] == 'p' and end[0] in (0, 7) else None
+                    dragging.game.play(move_from_squares(start, end, promotion))
+                dragging.selected_piece = None
+                dragging = None
+
+    worker.cancel()
+    engine.close()
+    pygame.quit()
+    sys.exit()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Play many games at once in one window')
+    parser.add_argument('--boards', type=int, default=4, help=f'number of games, 1-{MAX_BOARDS}')
+    parser.add_argument('--human', choices=['w', 'b', 'none'], default='w',
+                        help='the colour you play on every board, or none to watch')
+    parser.add_argument('--ai-time-ms', type=int, default=200, help='engine thinking time per move')
+    parser.add_argument('--size', type=int, nargs=2, default=[960, 960], metavar=('WIDTH', 'HEIGHT'))
+    args = parser.parse_args()
+    if not 1 <= args.boards <= MAX_BOARDS:
+        parser.error(f'--boards must be between 1 and {MAX_BOARDS}')
+    main(args.boards, None if args.human == 'none' else args.human, args.ai_time_ms, tuple(args.size))
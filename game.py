@@ -0,0 +1,257 @@
+from bitboard import Position, ROWS, COLS, row_col, square
+from movegen import generate_moves, is_legal, move_from_squares
+from rules import AttackMap, changed_squares, game_status, position_key
+
+# Game state and rules with no pygame dependency, so games can be played
+# headless (see selfplay.py) as well as from PyMain.main().
+
+RESULTS = {'White wins!': '1-0', 'Black wins!': '0-1'}
+
+def init_board():
+    board = [[None for _ in range(COLS)] for _ in range(ROWS)]
+
+    for i in range(COLS):
+        board[1][i] = 'bp'
+        board[6][i] = 'wp'
+
+    order = ['r', 'n', 'b', 'q', 'k', 'b', 'n', 'r']
+    for i in range(COLS):
+        board[0][i] = 'b' + order[i]
+        board[7][i] = 'w' + order[i]
+
+    return board
+
+def check_winner(board, attack_map=None, repetitions=None):
+    # attack_map saves rebuilding the attacks when the caller keeps one. A
+    # list-of-lists board, as init_board() returns, carries no side to move,
+    # so it keeps the old rule: the game is won once a king is captured.
+    if not isinstance(board, Position):
+        pieces = {piece for row in board for piece in row}
+        if 'wk' not in pieces:
+            return 'Black wins!'
+        if 'bk' not in pieces:
+            return 'White wins!'
+        return None
+    if attack_map is None:
+        attack_map = AttackMap(board)
+    status = game_status(board, attack_map, repetitions)
+    if status == 'checkmate':
+        return 'Black wins!' if board.turn == 'w' else 'White wins!'
+    if status:
+        return f'Draw by {status}!'
+    return None
+
+def path_is_clear(start, end, board):
+    r1, c1 = start
+    r2, c2 = end
+    dr = r2 - r1
+    dc = c2 - c1
+
+    step_r = (dr // abs(dr)) if dr != 0 else 0
+    step_c = (dc // abs(dc)) if dc != 0 else 0
+
+    r, c = r1 + step_r, c1 + step_c
+    while (r, c) != (r2, c2):
+        if board[r][c] is not None:
+            return False
+        r += step_r
+        c += step_c
+    return True
+
+def is_valid_move(piece, start, end, board, en_passant_target, has_moved):
+    if isinstance(board, Position):
+        if not board.is_valid_move(piece, start, end, en_passant_target, has_moved):
+            return False
+        position = board
+    else:
+        if not is_pseudo_valid_move(piece, start, end, board, en_passant_target, has_moved):
+            return False
+        position = Position.from_board(board, piece[0], en_passant_target, has_moved)
+
+    # Reject moves that leave the mover's king in check
+    return is_legal(position, move_from_squares(start, end))
+
+def is_pseudo_valid_move(piece, start, end, board, en_passant_target, has_moved):
+    piece_type = piece[1]
+    color = piece[0]
+    start_row, start_col = start
+    end_row, end_col = end
+    dr = end_row - start_row
+    dc = end_col - start_col
+
+    destination = board[end_row][end_col]
+    if destination and destination[0] == color:
+        return False
+
+    if piece_type == 'p':
+        direction = -1 if color == 'w' else 1
+        start_row_home = 6 if color == 'w' else 1
+
+        if dc == 0:
+            if dr == direction and not destination:
+                return True
+            if dr == 2 * direction and start_row == start_row_home and not board[start_row + direction][start_col] and not destination:
+                return True
+        elif abs(dc) == 1 and dr == direction:
+            if destination and destination[0] != color:
+                return True
+            if en_passant_target and (end_row, end_col) == en_passant_target and not destination:
+                return True
+
+    elif piece_type == 'r':
+        if dr == 0 or dc == 0:
+            return path_is_clear(start, end, board)
+
+    elif piece_type == 'n':
+        if (abs(dr), abs(dc)) in [(2, 1), (1, 2)]:
+            return True
+
+    elif piece_type == 'b':
+        if abs(dr) == abs(dc):
+            return path_is_clear(start, end, board)
+
+    elif piece_type == 'q':
+        if dr == 0 or dc == 0 or abs(dr) == abs(dc):
+            return path_is_clear(start, end, board)
+
+    elif piece_type == 'k':
+        if max(abs(dr), abs(dc)) == 1:
+            return True
+
+        if dr == 0 and abs(dc) == 2:
+            rook_col = 7 if dc > 0 else 0
+            rook = board[start_row][rook_col]
+            if not rook or rook[1] != 'r' or rook[0] != color:
+                return False
+
+            step = 1 if dc > 0 else -1
+            for c in range(start_col + step, rook_col, step):
+                if board[start_row][c] is not None:
+                    return False
+
+            if color == 'w':
+                if has_moved['w_king']:
+                    return False
+                if dc > 0 and has_moved['w_rook_ks']:
+                    return False
+                if dc < 0 and has_moved['w_rook_qs']:
+                    return False
+            else:
+                if has_moved['b_king']:
+                    return False
+                if dc > 0 and has_moved['b_rook_ks']:
+                    return False
+                if dc < 0 and has_moved['b_rook_qs']:
+                    return False
+
+            return True
+
+    return False
+
+class Game:
+    def __init__(self, position=None):
+        self.position = position or Position.from_board(init_board())
+        self.start_position = self.position.copy()
+        self.attack_map = AttackMap(self.position)
+        self.repetitions = {position_key(self.position): 1}
+        self.moves = []
+        # Undo records for self.moves, and moves taken back that redo() can
+        # replay. Each is a few ints, so history costs O(1) per move.
+        self.undos = []
+        self.redo_moves = []
+        self.winner = None
+        # Whether the finished game has been saved; cleared when a new move
+        # starts a different line, not when the same moves are replayed
+        self.recorded = False
+        # Legal destinations by from-square, for the position with this hash
+        self.destinations_key = None
+        self.destinations_by_square = {}
+
+    @property
+    def turn(self):
+        return self.position.turn
+
+    @property
+    def result(self):
+        # PGN-style result: '1-0', '0-1', '1/2-1/2', or '*' while in progress
+        if not self.winner:
+            return '*'
+        return RESULTS.get(self.winner, '1/2-1/2')
+
+    def legal_moves(self):
+        return generate_moves(self.position)
+
+    def destinations(self, start):
+        # The squares, as (row, col), the piece on start can legally move
+        # to. All legal moves are generated once per position and grouped by
+        # square, so later calls for the same position are lookups.
+        position = self.position
+        if self.destinations_key != position.hash:
+            by_square = {}
+            for from_sq, to_sq, _ in generate_moves(position):
+                by_square.setdefault(from_sq, set()).add(row_col(to_sq))
+            self.destinations_by_square = by_square
+            self.destinations_key = position.hash
+        return self.destinations_by_square.get(square(*start), set())
+
+    def is_valid_move(self, start, end):
+        position = self.position
+        piece = position[start[0]][start[1]]
+        if not piece or piece[0] != position.turn:
+            return False
+        return is_valid_move(piece, start, end, position, position.en_passant_target, position.has_moved)
+
+    def play(self, move):
+        # Applies a legal move and returns the winner text once the game is over.
+        # make_move handles en passant captures, the castling rook, castling
+        # rights and the en passant target.
+        self.redo_moves = []
+        self.recorded = False
+        return self._play(move)
+
+    def _play(self, move):
+        position = self.position
+        undo = position.make_move(move)
+        self.attack_map.update(position, move, undo)
+        key = position_key(position)
+        self.repetitions[key] = self.repetitions.get(key, 0) + 1
+        self.moves.append(move)
+        self.undos.append(undo)
+        self.winner = check_winner(position, self.attack_map, self.repetitions)
+        return self.winner
+
+    def undo(self):
+        # Takes back the last move; returns it, or None at the start
+        if not self.moves:
+            return None
+        position = self.position
+        move = self.moves.pop()
+        undo = self.undos.pop()
+        key = position_key(position)
+        self.repetitions[key] -= 1
+        if not self.repetitions[key]:
+            del self.repetitions[key]
+        changed = changed_squares(position, move, undo)
+        position.unmake_move(move, undo)
+        self.attack_map.update_squares(position, changed)
+        self.redo_moves.append(move)
+        # Play only went on from positions that were not game over
+        self.winner = None
+        return move
+
+    def redo(self):
+        if not self.redo_moves:
+            return None
+        move = self.redo_moves.pop()
+        self._play(move)
+        return move
+
+    def goto(self, ply):
+        # Browses the history to ply moves from the start
+        while len(self.moves) > ply and self.undo():
+            pass
+        while len(self.moves) < ply and self.redo():
+            pass
+
+    def play_squares(self, start, end, promotion=None):
+        return self.play(move_from_squares(start, end, promotion))
@@ -0,0 +1,190 @@
+import collections
+import csv
+import json
+import time
+
+import pygame
+
+OVERLAY_BG = (20, 20, 20)
+OVERLAY_TEXT = (240, 240, 240)
+OVERLAY_REFRESH_MS = 500
+FRAME_HISTORY = 600  # frames kept for the percentiles
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+class NullProfiler:
+    # Stands in when instrumentation is off. Every call returns at once, and
+    # stage() hands back one shared do-nothing context manager, so the
+    # instrumented code runs as it would without it.
+    enabled = False
+
+    def stage(self, name):
+        return _NULL_STAGE
+
+    def begin_frame(self):
+        pass
+
+    def end_frame(self):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+    def overlay(self, win, renderer, rects):
+        return []
+
+    def export(self):
+        pass
+
+NULL_PROFILER = NullProfiler()
+
+class _Stage:
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.start, time.perf_counter_ns() - self.start)
+        return False
+
+class Profiler:
+    # Times named stages of the main loop with perf_counter_ns and counts
+    # events such as move validations. overlay() draws FPS, frame-time
+    # percentiles, validations per second and the costliest stages in the
+    # window's top-left corner. With trace_path every timed stage is also
+    # kept and export() writes them there: as Chrome trace JSON (open in
+    # chrome://tracing or Perfetto) for a .json path, or as CSV otherwise.
+    enabled = True
+
+    def __init__(self, trace_path=None):
+        self.trace_path = trace_path
+        self.events = [] if trace_path else None
+        self.stages = {}
+        self.frame_start = 0
+        self.frame_times = collections.deque(maxlen=FRAME_HISTORY)
+        self.frame_starts = collections.deque(maxlen=FRAME_HISTORY)
+        self.totals = collections.Counter()  # stage -> ns since the last overlay refresh
+        self.counts = collections.Counter()
+        self.window_start = time.perf_counter_ns()
+        self.window_frames = 0
+        self.lines = []
+        self.box = None
+        self.font = None
+        self.next_refresh = 0
+
+    def stage(self, name):
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = _Stage(self, name)
+        return stage
+
+    def begin_frame(self):
+        self.frame_start = time.perf_counter_ns()
+
+    def end_frame(self):
+        # Frame time is the work between begin_frame() and here, without the
+        # wait for the next frame
+        self.record('frame', self.frame_start, time.perf_counter_ns() - self.frame_start)
+
+    def record(self, name, start, duration):
+        if name == 'frame':
+            self.frame_starts.append(start)
+            self.frame_times.append(duration)
+            self.window_frames += 1
+        else:
+            self.totals[name] += duration
+        if self.events is not None:
+            self.events.append((name, start, duration))
+
+    def count(self, name, n=1):
+        self.counts[name] += n
+
+    def summary(self):
+        # Text lines for the overlay, covering the time since the last call
+        now = time.perf_counter_ns()
+        seconds = max(1e-9, (now - self.window_start) / 1e9)
+        starts = self.frame_starts
+        fps = (len(starts) - 1) * 1e9 / (starts[-1] - starts[0]) if len(starts) > 1 else 0
+        lines = [f'{fps:.1f} fps']
+        if self.frame_times:
+            ordered = sorted(self.frame_times)
+
+            def percentile(p):
+                return ordered[min(len(ordered) - 1, int(len(ordered) * p))] / 1e6
+
+            lines.append(f'frame ms  p50 {percentile(0.5):.2f}  p95 {percentile(0.95):.2f}  '
+                         f'p99 {percentile(0.99):.2f}')
+        lines.append(f'validations/s {self.counts["validations"] / seconds:.0f}')
+        frames = max(1, self.window_frames)
+        for name, total in self.totals.most_common(4):
+            lines.append(f'{name:<10} {total / frames / 1e6:.3f} ms/frame')
+        self.window_start = now
+        self.window_frames = 0
+        self.totals.clear()
+        self.counts.clear()
+        return lines
+
+    def overlay(self, win, renderer, rects):
+        # Call after the renderer has drawn a frame, with the rects it
+        # changed; returns the rects the overlay drew over. The text is
+        # refreshed twice a second: the renderer repaints the squares under
+        # it on the next frame, and the overlay goes back on top whenever
+        # something beneath it was repainted.
+        now = pygame.time.get_ticks()
+        if now >= self.next_refresh:
+            self.next_refresh = now + OVERLAY_REFRESH_MS
+            self.lines = self.summary()
+            if self.box:
+                renderer.invalidate_rect(self.box)
+            return []
+        if not self.lines or self.box and not any(self.box.colliderect(rect) for rect in rects):
+            return []
+        if self.font is None:
+            self.font = pygame.font.SysFont('monospace', 14)
+        labels = [self.font.render(line, True, OVERLAY_TEXT) for line in self.lines]
+        width = max(label.get_width() for label in labels) + 12
+        height = sum(label.get_height() for label in labels) + 8
+        if self.box is None or self.box.width < width or self.box.height < height:
+            # Make room, and draw once the renderer has cleared it
+            box = pygame.Rect(4, 4, width, height)
+            self.box = self.box.union(box) if self.box else box
+            renderer.invalidate_rect(self.box)
+            return []
+        with self.stage('overlay'):
+            win.fill(OVERLAY_BG, self.box)
+            y = self.box.top + 4
+            for label in labels:
+                win.blit(label, (self.box.left + 6, y))
+                y += label.get_height()
+        return [self.box]
+
+    def export(self):
+        if not self.trace_path or not self.events:
+            return
+        first = min(start for _, start, _ in self.events)
+        if self.trace_path.endswith('.json'):
+            trace = [{'name': name, 'ph': 'X', 'pid': 1, 'tid': 1,
+                      'ts': (start - first) / 1000, 'dur': duration / 1000}
+                     for name, start, duration in self.events]
+            with open(self.trace_path, 'w') as f:
+                json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
+        else:
+            with open(self.trace_path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['stage', 'start_us', 'duration_us'])
+                for name, start, duration in self.events:
+                    writer.writerow([name, (start - first) / 1000, duration / 1000])
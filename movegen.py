@@ -0,0 +1,204 @@
+from bitboard import (
+    BETWEEN, KING_ATTACKS, KNIGHT_ATTACKS, PAWN_ATTACKS, PROMOTION_PIECES,
+    WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE,
+    bishop_attacks, iter_bits, queen_attacks, rook_attacks,
+    square, row_col, square_name, parse_square
+)
+
+# Moves are (from_sq, to_sq, promotion) tuples; promotion is one of
+# PROMOTION_PIECES or None.
+
+def _bits(squares):
+    bb = 0
+    for sq in squares:
+        bb |= 1 << sq
+    return bb
+
+# (right, king from, king to, rook square, squares that must be empty)
+CASTLING_MOVES = {
+    'w': [(WHITE_KINGSIDE, 60, 62, 63, _bits([61, 62])),
+          (WHITE_QUEENSIDE, 60, 58, 56, _bits([57, 58, 59]))],
+    'b': [(BLACK_KINGSIDE, 4, 6, 7, _bits([5, 6])),
+          (BLACK_QUEENSIDE, 4, 2, 0, _bits([1, 2, 3]))]
+}
+
+def move_from_squares(start, end, promotion=None):
+    return (square(*start), square(*end), promotion)
+
+def move_to_squares(move):
+    return row_col(move[0]), row_col(move[1])
+
+def move_to_uci(move):
+    from_sq, to_sq, promotion = move
+    return square_name(from_sq) + square_name(to_sq) + (promotion or '')
+
+def move_from_uci(text):
+    return (parse_square(text[:2]), parse_square(text[2:4]), text[4:5] or None)
+
+# 16-bit move codes: from square in bits 0-5, to square in bits 6-11 and the
+# promotion piece in bits 12-14 (0 for none, else index in PROMOTION_PIECES + 1).
+# Code 0 (a8 to a8) is never a real move and means "no move".
+def encode_move(move):
+    from_sq, to_sq, promotion = move
+    code = from_sq | to_sq << 6
+    if promotion:
+        code |= (PROMOTION_PIECES.index(promotion) + 1) << 12
+    return code
+
+def decode_move(code):
+    if not code:
+        return None
+    promotion = code >> 12 & 7
+    return (code & 63, code >> 6 & 63, PROMOTION_PIECES[promotion - 1] if promotion else None)
+
+def generate_pseudo_legal_moves(position):
+    moves = []
+    append = moves.append
+    color = position.turn
+    enemy_color = 'b' if color == 'w' else 'w'
+    bb = position.bitboards
+    own = position.occupied[color]
+    enemy = position.occupied[enemy_color]
+    occupied = own | enemy
+    not_own = ~own
+
+    # Pawns
+    step = -8 if color == 'w' else 8
+    home_row = 6 if color == 'w' else 1
+    last_row = 0 if color == 'w' else 7
+    pawn_attacks = PAWN_ATTACKS[color]
+    targets = enemy
+    if position.en_passant is not None:
+        targets |= 1 << position.en_passant
+    for from_sq in iter_bits(bb[color + 'p']):
+        destinations = []
+        to_sq = from_sq + step
+        if not occupied >> to_sq & 1:
+            destinations.append(to_sq)
+            if from_sq >> 3 == home_row and not occupied >> (to_sq + step) & 1:
+                append((from_sq, to_sq + step, None))
+        destinations.extend(iter_bits(pawn_attacks[from_sq] & targets))
+        for to_sq in destinations:
+            if to_sq >> 3 == last_row:
+                for promotion in PROMOTION_PIECES:
+                    append((from_sq, to_sq, promotion))
+            else:
+                append((from_sq, to_sq, None))
+
+    for from_sq in iter_bits(bb[color + 'n']):
+        for to_sq in iter_bits(KNIGHT_ATTACKS[from_sq] & not_own):
+            append((from_sq, to_sq, None))
+    for from_sq in iter_bits(bb[color + 'b']):
+        for to_sq in iter_bits(bishop_attacks(from_sq, occupied) & not_own):
+            append((from_sq, to_sq, None))
+    for from_sq in iter_bits(bb[color + 'r']):
+        for to_sq in iter_bits(rook_attacks(from_sq, occupied) & not_own):
+            append((from_sq, to_sq, None))
+    for from_sq in iter_bits(bb[color + 'q']):
+        for to_sq in iter_bits(queen_attacks(from_sq, occupied) & not_own):
+            append((from_sq, to_sq, None))
+    for from_sq in iter_bits(bb[color + 'k']):
+        for to_sq in iter_bits(KING_ATTACKS[from_sq] & not_own):
+            append((from_sq, to_sq, None))
+
+    # Castling: rights, rook on its corner and an empty path. Whether the king
+    # passes through check is left to the legality filter.
+    squares = position.squares
+    for right, king_from, king_to, rook_sq, empty in CASTLING_MOVES[color]:
+        if position.castling & right and not occupied & empty and \
+                squares[king_from] == color + 'k' and squares[rook_sq] == color + 'r':
+            append((king_from, king_to, None))
+
+    return moves
+
+def pinned_pieces(position, color):
+    king_sq = position.king_square(color)
+    if king_sq is None:
+        return 0
+    enemy_color = 'b' if color == 'w' else 'w'
+    bb = position.bitboards
+    enemy = position.occupied[enemy_color]
+    occupied = position.all_occupied
+    queens = bb[enemy_color + 'q']
+    snipers = rook_attacks(king_sq, enemy) & (bb[enemy_color + 'r'] | queens)
+    snipers |= bishop_attacks(king_sq, enemy) & (bb[enemy_color + 'b'] | queens)
+    pinned = 0
+    for sniper in iter_bits(snipers):
+        blockers = BETWEEN[king_sq][sniper] & occupied
+        if blockers and not blockers & (blockers - 1):
+            pinned |= blockers & position.occupied[color]
+    return pinned
+
+def _leaves_king_safe(position, move, color, enemy_color):
+    undo = position.make_move(move)
+    king_sq = position.king_square(color)
+    safe = king_sq is None or not position.is_square_attacked(king_sq, enemy_color)
+    position.unmake_move(move, undo)
+    return safe
+
+def _is_legal(position, move, color, enemy_color, pinned, in_check):
+    from_sq, to_sq, _ = move
+    piece = position.squares[from_sq]
+    if piece[1] == 'k' and abs(to_sq - from_sq) == 2:
+        if in_check:
+            return False
+        crossed = (from_sq + to_sq) // 2
+        if position.is_square_attacked(crossed, enemy_color):
+            return False
+        return _leaves_king_safe(position, move, color, enemy_color)
+    # A piece that is not pinned can only expose the king when the king is
+    # already in check, when the king itself moves, or through en passant,
+    # which removes two pieces from the same rank.
+    if in_check or piece[1] == 'k' or pinned >> from_sq & 1 or \
+            (piece[1] == 'p' and to_sq == position.en_passant):
+        return _leaves_king_safe(position, move, color, enemy_color)
+    return True
+
+def is_in_check(position, color=None):
+    color = color or position.turn
+    king_sq = position.king_square(color)
+    if king_sq is None:
+        return False
+    return position.is_square_attacked(king_sq, 'b' if color == 'w' else 'w')
+
+def is_legal(position, move):
+    # move must be pseudo-legal for the piece standing on its from square
+    color = position.squares[move[0]][0]
+    enemy_color = 'b' if color == 'w' else 'w'
+    return _is_legal(position, move, color, enemy_color,
+                     pinned_pieces(position, color), is_in_check(position, color))
+
+def generate_moves(position, legal=True):
+    moves = generate_pseudo_legal_moves(position)
+    if not legal:
+        return moves
+    color = position.turn
+    enemy_color = 'b' if color == 'w' else 'w'
+    pinned = pinned_pieces(position, color)
+    in_check = is_in_check(position, color)
+    return [move for move in moves
+            if _is_legal(position, move, color, enemy_color, pinned, in_check)]
+
+def has_legal_move(position, in_check=None):
+    color = position.turn
+    enemy_color = 'b' if color == 'w' else 'w'
+    pinned = pinned_pieces(position, color)
+    if in_check is None:
+        in_check = is_in_check(position, color)
+    for move in generate_pseudo_legal_moves(position):
+        if _is_legal(position, move, color, enemy_color, pinned, in_check):
+            return True
+    return False
+
+def generate_captures(position):
+    # Legal captures, en passant and promotions; the moves quiescence search looks at
+    color = position.turn
+    enemy_color = 'b' if color == 'w' else 'w'
+    squares = position.squares
+    ep = position.en_passant
+    moves = [move for move in generate_pseudo_legal_moves(position)
+             if squares[move[1]] or move[2] or (move[1] == ep and squares[move[0]][1] == 'p')]
+    pinned = pinned_pieces(position, color)
+    in_check = is_in_check(position, color)
+    return [move for move in moves
+            if _is_legal(position, move, color, enemy_color, pinned, in_check)]
@@ -0,0 +1,348 @@
+import argparse
+import asyncio
+import json
+import queue
+import random
+import re
+import threading
+import time
+
+from bitboard import PROMOTION_PIECES, row_col
+from game import Game
+from movegen import move_from_uci, move_to_uci
+
+# Network play through a relay server. Messages are JSON objects, one per
+# line, over TCP.
+#
+# client -> server
+#   {"type": "join", "game": "<id>"}   join a game by id, created if new;
+#                                      without "game", pair with whoever
+#                                      else is waiting
+#   {"type": "move", "move": "e7e8q"}  a move in UCI notation
+#
+# server -> client
+#   {"type": "joined", "game": "<id>", "color": "w"}
+#   {"type": "state", "moves": [...]}  every move so far; sent on joining
+#                                      and after a rejected move
+#   {"type": "start"}                  both players are there
+#   {"type": "move", "move": "e2e4", "by": "w"}   sent to both players
+#   {"type": "illegal", "move": "...", "reason": "..."}
+#   {"type": "result", "result": "1-0", "reason": "White wins!"}
+#   {"type": "opponent_left"}
+#   {"type": "error", "reason": "..."}
+#
+# The server keeps a Game for every table and checks each move with
+# Game.is_valid_move, the same rules the board uses, before passing it on.
+DEFAULT_PORT = 8765
+# Moves are read only in this form, so squares are always on the board
+UCI_MOVE = re.compile(r'[a-h][1-8][a-h][1-8][qrbn]?')
+
+def encode(message):
+    return (json.dumps(message, separators=(',', ':')) + '\n').encode()
+
+class RelayGame:
+    def __init__(self, game_id):
+        self.id = game_id
+        self.game = Game()
+        self.players = {}  # colour -> StreamWriter
+
+    def open_color(self):
+        for color in 'wb':
+            if color not in self.players:
+                return color
+        return None
+
+    def broadcast(self, message):
+        data = encode(message)
+        for writer in self.players.values():
+            writer.write(data)
+
+class RelayServer:
+    # Hosts any number of games in one asyncio loop. Nothing blocks between
+    # messages, so one process serves thousands of tables.
+    def __init__(self):
+        self.games = {}
+        self.waiting = None  # id of the paired game still missing a player
+        self.next_id = 1
+        self.moves_relayed = 0
+
+    def _new_game(self, game_id=None):
+        if game_id is None:
+            game_id = str(self.next_id)
+            self.next_id += 1
+        table = RelayGame(game_id)
+        self.games[game_id] = table
+        return table
+
+    def join(self, writer, game_id=None):
+        if game_id is None:
+            table = self.games.get(self.waiting) if self.waiting else None
+            if table is None or table.open_color() is None:
+                table = self._new_game()
+                self.waiting = table.id
+            else:
+                self.waiting = None
+        else:
+            table = self.games.get(game_id) or self._new_game(game_id)
+        color = table.open_color()
+        if color is None:
+            writer.write(encode({'type': 'error', 'reason': f'game {table.id} is full'}))
+            return None, None
+        table.players[color] = writer
+        writer.write(encode({'type': 'joined', 'game': table.id, 'color': color}))
+        writer.write(encode({'type': 'state', 'moves': [move_to_uci(m) for m in table.game.moves]}))
+        if len(table.players) == 2:
+            table.broadcast({'type': 'start'})
+        return table, color
+
+    def leave(self, table, color):
+        table.players.pop(color, None)
+        if table.players:
+            table.broadcast({'type': 'opponent_left'})
+        else:
+            del self.games[table.id]
+            if self.waiting == table.id:
+                self.waiting = None
+
+    def move(self, table, color, text):
+        game = table.game
+        writer = table.players[color]
+        reason = None
+        move = None
+        if isinstance(text, str) and UCI_MOVE.fullmatch(text):
+            move = move_from_uci(text)
+        else:
+            reason = 'unreadable move'
+        if reason is None:
+            reason = self._check(table, color, move)
+        if reason:
+            writer.write(encode({'type': 'illegal', 'move': text, 'reason': reason}))
+            writer.write(encode({'type': 'state', 'moves': [move_to_uci(m) for m in game.moves]}))
+            return
+        winner = game.play(move)
+        self.moves_relayed += 1
+        table.broadcast({'type': 'move', 'move': move_to_uci(move), 'by': color})
+        if winner:
+            table.broadcast({'type': 'result', 'result': game.result, 'reason': winner})
+
+    def _check(self, table, color, move):
+        game = table.game
+        if game.winner:
+            return 'the game is over'
+        if len(table.players) < 2:
+            return 'waiting for an opponent'
+        if game.turn != color:
+            return 'not your turn'
+        from_sq, to_sq, promotion = move
+        start, end = row_col(from_sq), row_col(to_sq)
+        if not game.is_valid_move(start, end):
+            return 'illegal move'
+        piece = game.position.squares[from_sq]
+        promoting = piece[1] == 'p' and end[0] in (0, 7)
+        if promoting != (promotion is not None) or promotion and promotion not in PROMOTION_PIECES:
+            return 'bad promotion'
+        return None
+
+    async def handle(self, reader, writer):
+        table = color = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                    kind = message['type']
+                except (ValueError, KeyError, TypeError):
+                    writer.write(encode({'type': 'error', 'reason': 'bad message'}))
+                    continue
+                if kind == 'join' and table is None:
+                    table, color = self.join(writer, message.get('game'))
+                elif kind == 'move' and table is not None:
+                    self.move(table, color, str(message.get('move')))
+                else:
+                    writer.write(encode({'type': 'error', 'reason': f'unexpected {kind}'}))
+                # Stop reading from a client that does not read its replies
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            if table is not None:
+                self.leave(table, color)
+            writer.close()
+
+async def serve(host='127.0.0.1', port=DEFAULT_PORT):
+    relay = RelayServer()
+    server = await asyncio.start_server(relay.handle, host, port)
+    print(f'Relay listening on {host}:{port}')
+    async with server:
+        await server.serve_forever()
+
+class NetClient:
+    # The pygame side of network play. An asyncio loop on a background
+    # thread owns the connection; send() and poll() only touch queues, so
+    # the frame loop never waits on the network. notify, if given, is called
+    # from that thread whenever a message arrives.
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, game_id=None, notify=None):
+        self.host = host
+        self.port = port
+        self.game_id = game_id
+        self.notify = notify
+        self.incoming = queue.Queue()
+        self.loop = asyncio.new_event_loop()
+        self.writer = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        self.loop.run_until_complete(self._connect())
+
+    async def _connect(self):
+        try:
+            reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            join = {'type': 'join'}
+            if self.game_id:
+                join['game'] = self.game_id
+            self.writer.write(encode(join))
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self._receive(json.loads(line))
+        except (OSError, ValueError) as error:
+            self._receive({'type': 'error', 'reason': str(error)})
+        self._receive({'type': 'disconnected'})
+
+    def _receive(self, message):
+        self.incoming.put(message)
+        if self.notify:
+            self.notify()
+
+    def _write(self, message):
+        if self.writer:
+            self.writer.write(encode(message))
+
+    def send(self, message):
+        self.loop.call_soon_threadsafe(self._write, message)
+
+    def send_move(self, move):
+        self.send({'type': 'move', 'move': move_to_uci(move)})
+
+    def poll(self):
+        # Every message received since the last call
+        messages = []
+        while True:
+            try:
+                messages.append(self.incoming.get_nowait())
+            except queue.Empty:
+                return messages
+
+    def close(self):
+        if self.writer:
+            self.loop.call_soon_threadsafe(self.writer.close)
+        self.thread.join(1)
+
+def sample_games(count, seed, max_plies):
+    # Random legal games, as UCI move lists, for the load test to replay
+    rng = random.Random(seed)
+    games = []
+    for _ in range(count):
+        game = Game()
+        while not game.winner and len(game.moves) < max_plies:
+            game.play(rng.choice(game.legal_moves()))
+        games.append([move_to_uci(move) for move in game.moves])
+    return games
+
+async def _load_player(host, port, game_id, moves, latencies):
+    # Plays whichever colour the server hands out, sending its moves from
+    # moves as soon as it is its turn
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(encode({'type': 'join', 'game': game_id}))
+    await writer.drain()
+    color = None
+    started = False
+    sent_at = None
+    ply = 0
+    while ply < len(moves):
+        line = await reader.readline()
+        if not line:
+            break
+        message = json.loads(line)
+        kind = message['type']
+        if kind == 'joined':
+            color = message['color']
+        elif kind == 'start':
+            started = True
+        elif kind == 'move':
+            if message['by'] == color and sent_at is not None:
+                latencies.append(time.perf_counter() - sent_at)
+                sent_at = None
+            ply += 1
+        elif kind in ('result', 'illegal', 'error', 'opponent_left'):
+            break
+        if started and ply < len(moves) and (ply % 2 == 0) == (color == 'w') and sent_at is None:
+            sent_at = time.perf_counter()
+            writer.write(encode({'type': 'move', 'move': moves[ply]}))
+            await writer.drain()
+    writer.close()
+    return ply
+
+async def load_test(host, port, games, seed, max_plies, concurrency):
+    # Two clients per game replay pre-generated random games as fast as the
+    # server relays them
+    samples = sample_games(min(games, 32), seed, max_plies)
+    latencies = []
+    limit = asyncio.Semaphore(concurrency)
+
+    async def play(i):
+        async with limit:
+            moves = samples[i % len(samples)]
+            game_id = f'load-{seed}-{i}'
+            plies = await asyncio.gather(_load_player(host, port, game_id, moves, latencies),
+                                         _load_player(host, port, game_id, moves, latencies))
+            return max(plies)
+
+    start = time.perf_counter()
+    plies = await asyncio.gather(*(play(i) for i in range(games)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2) if latencies else None
+
+    return {
+        'games': games,
+        'concurrent_games': min(games, concurrency),
+        'moves': sum(plies),
+        'seconds': round(elapsed, 3),
+        'moves_per_sec': round(sum(plies) / elapsed, 1),
+        'latency_ms_p50': percentile(0.5),
+        'latency_ms_p99': percentile(0.99)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Relay server for network play, and a load test for it')
+    commands = parser.add_subparsers(dest='command', required=True)
+    server = commands.add_parser('serve', help='run the relay server')
+    server.add_argument('--host', default='127.0.0.1')
+    server.add_argument('--port', type=int, default=DEFAULT_PORT)
+    load = commands.add_parser('loadtest', help='simulate many clients against a server')
+    load.add_argument('--host', default='127.0.0.1')
+    load.add_argument('--port', type=int, default=DEFAULT_PORT)
+    load.add_argument('--games', type=int, default=1000)
+    load.add_argument('--concurrency', type=int, default=1000, help='games in flight at once')
+    load.add_argument('--plies', type=int, default=60, help='longest game to replay')
+    load.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        try:
+            asyncio.run(serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+        return
+    stats = asyncio.run(load_test(args.host, args.port, args.games, args.seed, args.plies, args.concurrency))
+    print(json.dumps(stats))
+
+if __name__ == "__main__":
+    main()
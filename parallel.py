@@ -0,0 +1,175 @@
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from bitboard import Position, START_FEN
+from movegen import generate_moves, move_to_uci
+from search import MAX_PLY, Search
+from transposition import DEPTH_PREFERRED, ENTRY_BYTES, TranspositionTable
+
+ROOT_SPLIT = 'root-split'
+LAZY_SMP = 'lazy-smp'
+MODES = (ROOT_SPLIT, LAZY_SMP)
+
+# Each pool process keeps one engine between searches
+_engine = None
+_shared_memory = None
+
+def _init_worker(stop_event, shm_name, tt_mb, policy):
+    global _engine, _shared_memory
+    if shm_name:
+        # Pool processes share the parent's resource tracker, which unlinks
+        # the segment once the parent is done with it
+        _shared_memory = shared_memory.SharedMemory(name=shm_name)
+        tt = TranspositionTable(tt_mb, policy, buffer=_shared_memory.buf)
+    else:
+        tt = TranspositionTable(tt_mb, policy)
+    _engine = Search(tt, stop_event)
+
+def _run_search(position, time_ms, max_depth, game_keys, root_moves, start_depth):
+    # The final result, and the result of every completed iteration by depth
+    iterations = {}
+    result = _engine.search(position, time_ms, max_depth, game_keys,
+                            on_iteration=lambda r: iterations.__setitem__(r['depth'], r),
+                            root_moves=root_moves, start_depth=start_depth)
+    return result, iterations
+
+def _split(moves, parts):
+    return [moves[i::parts] for i in range(parts) if moves[i::parts]]
+
+class ParallelSearch:
+    # Spreads a search over a pool of processes, sidestepping the GIL.
+    #
+    # root-split: the root moves are dealt out to the workers, each searches
+    # its share with its own transposition table, and the best score wins.
+    # lazy-smp: every worker searches the whole tree, half of them starting
+    # one ply deeper, and they share one transposition table in shared
+    # memory so each benefits from the others' results.
+    #
+    # search() has the same signature and result as Search.search, so it can
+    # stand in for it, including inside a SearchWorker.
+    def __init__(self, workers=None, mode=LAZY_SMP, tt_mb=64, policy=DEPTH_PREFERRED):
+        if mode not in MODES:
+            raise ValueError(f'Unknown parallel search mode: {mode}')
+        self.workers = workers or os.cpu_count() or 1
+        self.mode = mode
+        self.stop_event = multiprocessing.Event()
+        self.shared_memory = None
+        shm_name = None
+        worker_tt_mb = max(1, tt_mb // self.workers)
+        if mode == LAZY_SMP:
+            slots = int(tt_mb * 1024 * 1024) // ENTRY_BYTES
+            self.shared_memory = shared_memory.SharedMemory(create=True, size=slots * ENTRY_BYTES)
+            shm_name = self.shared_memory.name
+            worker_tt_mb = tt_mb
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(self.stop_event, shm_name, worker_tt_mb, policy)
+        )
+
+    def stop(self):
+        self.stop_event.set()
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+        if self.shared_memory:
+            self.shared_memory.close()
+            self.shared_memory.unlink()
+            self.shared_memory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def search(self, position, time_ms=1000, max_depth=MAX_PLY, game_keys=None, on_iteration=None):
+        start = time.perf_counter()
+        self.stop_event.clear()
+        game_keys = list(game_keys or [])
+        moves = generate_moves(position)
+        if not moves:
+            return {'move': None, 'score': 0, 'depth': 0, 'nodes': 0,
+                    'time_ms': 0, 'nps': 0, 'pv': []}
+
+        if self.mode == ROOT_SPLIT:
+            jobs = [(position, time_ms, max_depth, game_keys, share, 1)
+                    for share in _split(moves, self.workers)]
+        else:
+            jobs = [(position, time_ms, max_depth, game_keys, None, 1 + i % 2)
+                    for i in range(self.workers)]
+        futures = [self.pool.submit(_run_search, *job) for job in jobs]
+        outcomes = [future.result() for future in futures]
+        results = [result for result, _ in outcomes]
+
+        if self.mode == ROOT_SPLIT:
+            # Shares are only comparable at a depth they all finished, so
+            # the best move is chosen among their results at the deepest one
+            depth = min(max(iterations, default=0) for _, iterations in outcomes)
+            if depth:
+                best = dict(max((iterations[depth] for _, iterations in outcomes), key=lambda r: r['score']))
+            else:
+                best = dict(results[0])
+        else:
+            best = dict(max(results, key=lambda r: r['depth']))
+
+        elapsed = time.perf_counter() - start
+        best['nodes'] = sum(r['nodes'] for r in results)
+        best['time_ms'] = int(elapsed * 1000)
+        best['nps'] = int(best['nodes'] / elapsed) if elapsed > 0 else 0
+        if on_iteration:
+            on_iteration(dict(best))
+        return best
+
+# Middlegame positions for the speedup benchmark
+BENCHMARK_POSITIONS = [
+    START_FEN,
+    'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+    'r1bq1rk1/pp2bppp/2n1pn2/3p4/2PP4/2N1PN2/PP2BPPP/R2QKB1R w KQ - 0 8',
+    'r2q1rk1/1b2bppp/p2ppn2/1p6/3NP3/1BN1B3/PPP2PPP/R2Q1RK1 w - - 0 11'
+]
+
+def _time_to_depth(engine, depth):
+    elapsed = 0
+    nodes = 0
+    for fen in BENCHMARK_POSITIONS:
+        start = time.perf_counter()
+        result = engine.search(Position.from_fen(fen), time_ms=10 ** 9, max_depth=depth)
+        elapsed += time.perf_counter() - start
+        nodes += result['nodes']
+    return elapsed, nodes
+
+def benchmark(worker_counts, depth, mode):
+    print(f'{len(BENCHMARK_POSITIONS)} positions to depth {depth}, mode {mode}')
+    baseline, nodes = _time_to_depth(Search(), depth)
+    print(f'single process: {baseline:7.2f}s {nodes:>9} nodes {nodes / baseline:>9.0f} nodes/sec')
+    for workers in worker_counts:
+        with ParallelSearch(workers, mode) as engine:
+            elapsed, nodes = _time_to_depth(engine, depth)
+        print(f'{workers:3} workers:    {elapsed:7.2f}s {nodes:>9} nodes {nodes / elapsed:>9.0f} nodes/sec'
+              f'  speedup {baseline / elapsed:.2f}x')
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark parallel search against a single process')
+    parser.add_argument('--workers', type=int, nargs='+', default=[os.cpu_count() or 1],
+                        help='worker counts to compare')
+    parser.add_argument('--depth', type=int, default=4, help='search depth for each position')
+    parser.add_argument('--mode', choices=MODES, default=LAZY_SMP)
+    parser.add_argument('--fen', help='search a single position and print the chosen move')
+    parser.add_argument('--time-ms', type=int, default=5000)
+    args = parser.parse_args()
+
+    if args.fen:
+        with ParallelSearch(args.workers[0], args.mode) as engine:
+            result = engine.search(Position.from_fen(args.fen), args.time_ms)
+        print(f"{move_to_uci(result['move'])} score {result['score']} depth {result['depth']} "
+              f"{result['nodes']} nodes {result['nps']} nodes/sec")
+        return
+    benchmark(args.workers, args.depth, args.mode)
+
+if __name__ == "__main__":
+    main()
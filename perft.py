@@ -0,0 +1,83 @@
+import argparse
+import time
+
+from bitboard import Position
+from game import init_board
+from movegen import generate_moves, move_to_uci
+
+# Standard perft positions with their known node counts for depths 1-5
+POSITIONS = [
+    ('initial', None,
+     [20, 400, 8902, 197281, 4865609]),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+     [48, 2039, 97862, 4085603, 193690690]),
+    ('position3', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+     [14, 191, 2812, 43238, 674624]),
+    ('position4', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+     [6, 264, 9467, 422333, 15833292]),
+    ('position5', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+     [44, 1486, 62379, 2103487, 89941194])
+]
+
+def perft(position, depth):
+    moves = generate_moves(position)
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        undo = position.make_move(move)
+        nodes += perft(position, depth - 1)
+        position.unmake_move(move, undo)
+    return nodes
+
+def divide(position, depth):
+    counts = {}
+    for move in generate_moves(position):
+        undo = position.make_move(move)
+        counts[move_to_uci(move)] = perft(position, depth - 1)
+        position.unmake_move(move, undo)
+    return counts
+
+def load_position(fen):
+    if fen is None:
+        return Position.from_board(init_board())
+    return Position.from_fen(fen)
+
+def run(names=None, max_depth=5):
+    failures = 0
+    for name, fen, expected in POSITIONS:
+        if names and name not in names:
+            continue
+        position = load_position(fen)
+        for depth in range(1, max_depth + 1):
+            start = time.perf_counter()
+            nodes = perft(position, depth)
+            elapsed = time.perf_counter() - start
+            status = 'ok' if nodes == expected[depth - 1] else f'FAIL (expected {expected[depth - 1]})'
+            if nodes != expected[depth - 1]:
+                failures += 1
+            nps = nodes / elapsed if elapsed > 0 else 0
+            print(f'{name:10} depth {depth}: {nodes:>10} nodes {elapsed:8.2f}s {nps:>10.0f} nodes/sec  {status}')
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description='Perft benchmark for the move generator')
+    parser.add_argument('--depth', type=int, default=5, help='deepest depth to run (1-5)')
+    parser.add_argument('--position', action='append', choices=[name for name, _, _ in POSITIONS],
+                        help='only run the named position (can be repeated)')
+    parser.add_argument('--divide', metavar='FEN', help='print per-move node counts for FEN (or "initial")')
+    args = parser.parse_args()
+
+    if args.divide:
+        position = load_position(None if args.divide == 'initial' else args.divide)
+        counts = divide(position, args.depth)
+        for move, nodes in sorted(counts.items()):
+            print(f'{move}: {nodes}')
+        print(f'total: {sum(counts.values())}')
+        return
+
+    failures = run(args.position, min(args.depth, 5))
+    raise SystemExit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
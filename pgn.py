@@ -0,0 +1,309 @@
+import datetime
+import mmap
+import os
+import re
+from array import array
+
+from bitboard import Position, START_FEN, parse_square, square_name
+from game import Game
+from movegen import generate_moves, is_in_check
+
+RESULT_TOKENS = ('1-0', '0-1', '1/2-1/2', '*')
+SEVEN_TAG_ROSTER = ['Event', 'Site', 'Date', 'Round', 'White', 'Black', 'Result']
+
+TAG_RE = re.compile(r'\[(\w+)\s+"((?:[^"\\]|\\.)*)"\]')
+# Comments and variations are removed before tokenizing
+MOVETEXT_TOKEN_RE = re.compile(r'\$\d+|\d+\.+|[^\s]+')
+SAN_RE = re.compile(r'^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQnbrq]))?$')
+
+class PgnError(ValueError):
+    pass
+
+def move_to_san(position, move, legal_moves=None):
+    # SAN for a legal move in position; position is left unchanged
+    from_sq, to_sq, promotion = move
+    piece = position.squares[from_sq]
+    piece_type = piece[1]
+    if piece_type == 'k' and abs(to_sq - from_sq) == 2:
+        san = 'O-O' if to_sq > from_sq else 'O-O-O'
+    else:
+        capture = position.squares[to_sq] is not None or (piece_type == 'p' and to_sq == position.en_passant)
+        if piece_type == 'p':
+            san = square_name(from_sq)[0] + 'x' if capture else ''
+        else:
+            san = piece_type.upper()
+            if legal_moves is None:
+                legal_moves = generate_moves(position)
+            rivals = [m[0] for m in legal_moves
+                      if m[1] == to_sq and m[0] != from_sq and position.squares[m[0]] == piece]
+            if rivals:
+                name = square_name(from_sq)
+                if all(sq % 8 != from_sq % 8 for sq in rivals):
+                    san += name[0]
+                elif all(sq // 8 != from_sq // 8 for sq in rivals):
+                    san += name[1]
+                else:
+                    san += name
+            if capture:
+                san += 'x'
+        san += square_name(to_sq)
+        if promotion:
+            san += '=' + promotion.upper()
+
+    undo = position.make_move(move)
+    if is_in_check(position):
+        san += '#' if not generate_moves(position) else '+'
+    position.unmake_move(move, undo)
+    return san
+
+def parse_san(position, san, legal_moves=None):
+    # Returns the legal move that san names in position
+    if legal_moves is None:
+        legal_moves = generate_moves(position)
+    text = san.rstrip('+#!?')
+    squares = position.squares
+
+    if text in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+        kingside = len(text) == 3
+        for move in legal_moves:
+            if squares[move[0]][1] == 'k' and move[1] - move[0] == (2 if kingside else -2):
+                return move
+        raise PgnError(f'Illegal castling: {san}')
+
+    match = SAN_RE.match(text)
+    if not match:
+        raise PgnError(f'Unreadable SAN: {san}')
+    piece_letter, from_file, from_rank, target, promotion = match.groups()
+    piece_type = piece_letter.lower() if piece_letter else 'p'
+    to_sq = parse_square(target)
+    promotion = promotion.lower() if promotion else None
+
+    candidates = []
+    for move in legal_moves:
+        from_sq = move[0]
+        if move[1] != to_sq or move[2] != promotion or squares[from_sq][1] != piece_type:
+            continue
+        name = square_name(from_sq)
+        if from_file and name[0] != from_file:
+            continue
+        if from_rank and name[1] != from_rank:
+            continue
+        candidates.append(move)
+    if len(candidates) != 1:
+        raise PgnError(f'{"Ambiguous" if candidates else "Illegal"} move: {san}')
+    return candidates[0]
+
+def _strip_movetext(text):
+    # Drops {comments}, ; comments and (variations), which may nest
+    out = []
+    depth = 0
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char == '{':
+            end = text.find('}', i)
+            i = len(text) if end < 0 else end + 1
+            continue
+        if char == ';':
+            end = text.find('\n', i)
+            i = len(text) if end < 0 else end + 1
+            continue
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth = max(0, depth - 1)
+        elif not depth:
+            out.append(char)
+        i += 1
+    return ''.join(out)
+
+def san_tokens(movetext):
+    for token in MOVETEXT_TOKEN_RE.findall(_strip_movetext(movetext)):
+        if token[0] == '$' or token[0].isdigit() and token.rstrip('.').isdigit():
+            continue
+        if token in RESULT_TOKENS:
+            continue
+        # "12.e4" written without a space
+        token = re.sub(r'^\d+\.+', '', token)
+        if token:
+            yield token
+
+class PgnGame:
+    # One game from a PGN file. Tags are parsed up front; the movetext is
+    # only parsed when moves() or game() is called.
+    def __init__(self, headers, movetext, offset=None):
+        self.headers = headers
+        self.movetext = movetext
+        self.offset = offset
+
+    def start_position(self):
+        fen = self.headers.get('FEN') if self.headers.get('SetUp', '1') == '1' else None
+        return Position.from_fen(fen or START_FEN)
+
+    def moves(self):
+        position = self.start_position()
+        moves = []
+        for san in san_tokens(self.movetext):
+            move = parse_san(position, san)
+            position.make_move(move)
+            moves.append(move)
+        return moves
+
+    def game(self):
+        game = Game(self.start_position())
+        for san in san_tokens(self.movetext):
+            game.play(parse_san(game.position, san))
+        return game
+
+def _parse_game(lines, offset):
+    headers = {}
+    movetext = []
+    for line in lines:
+        stripped = line.decode('utf-8', errors='replace').strip()
+        if stripped.startswith('[') and not movetext:
+            match = TAG_RE.match(stripped)
+            if match:
+                headers[match.group(1)] = match.group(2).replace('\\"', '"').replace('\\\\', '\\')
+        elif stripped:
+            movetext.append(stripped)
+    return PgnGame(headers, '\n'.join(movetext), offset)
+
+def _iter_raw_games(source):
+    # Yields (byte offset, raw lines) per game from a binary file-like object
+    # with readline() and tell(), so only one game is ever held in memory.
+    # A game ends where a tag line follows movetext.
+    lines = []
+    offset = 0
+    in_movetext = False
+    while True:
+        position = source.tell()
+        raw = source.readline()
+        if not raw:
+            break
+        stripped = raw.strip()
+        if not stripped:
+            continue
+        is_tag = stripped.startswith(b'[')
+        if is_tag and in_movetext:
+            yield offset, lines
+            lines = []
+            in_movetext = False
+        if not lines:
+            offset = position
+        if not is_tag:
+            in_movetext = True
+        lines.append(raw)
+    if lines:
+        yield offset, lines
+
+def read_games(path, use_mmap=False):
+    # Generator over the games in a PGN file, in constant memory however
+    # large the file is. With use_mmap the OS pages the file in on demand.
+    with open(path, 'rb') as f:
+        if use_mmap and os.path.getsize(path):
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as source:
+                for offset, lines in _iter_raw_games(source):
+                    yield _parse_game(lines, offset)
+        else:
+            for offset, lines in _iter_raw_games(f):
+                yield _parse_game(lines, offset)
+
+def build_index(path):
+    # Byte offset of every game, as a compact array of 64-bit ints
+    offsets = array('Q')
+    with open(path, 'rb') as f:
+        for offset, _ in _iter_raw_games(f):
+            offsets.append(offset)
+    return offsets
+
+class PgnDatabase:
+    # Random access to game N of a large PGN file through a byte-offset
+    # index, cached next to the file as <path>.idx.
+    def __init__(self, path, index_path=None):
+        self.path = path
+        self.index_path = index_path or path + '.idx'
+        self.offsets = self._load_index()
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path) else None
+
+    def _load_index(self):
+        if os.path.exists(self.index_path) and \
+                os.path.getmtime(self.index_path) >= os.path.getmtime(self.path):
+            offsets = array('Q')
+            with open(self.index_path, 'rb') as f:
+                offsets.frombytes(f.read())
+            return offsets
+        offsets = build_index(self.path)
+        with open(self.index_path, 'wb') as f:
+            offsets.tofile(f)
+        return offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, n):
+        offset = self.offsets[n]
+        self.map.seek(offset)
+        for _, lines in _iter_raw_games(self.map):
+            return _parse_game(lines, offset)
+        raise IndexError(n)
+
+    def close(self):
+        if self.map:
+            self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def game_to_pgn(game, headers=None):
+    tags = {
+        'Event': '?',
+        'Site': '?',
+        'Date': datetime.date.today().strftime('%Y.%m.%d'),
+        'Round': '?',
+        'White': '?',
+        'Black': '?',
+        'Result': game.result
+    }
+    tags.update(headers or {})
+    fen = game.start_position.to_fen()
+    if fen != START_FEN:
+        tags['SetUp'] = '1'
+        tags['FEN'] = fen
+
+    lines = []
+    for name in SEVEN_TAG_ROSTER + [name for name in tags if name not in SEVEN_TAG_ROSTER]:
+        value = str(tags[name]).replace('\\', '\\\\').replace('"', '\\"')
+        lines.append(f'[{name} "{value}"]')
+    lines.append('')
+
+    position = game.start_position.copy()
+    tokens = []
+    for move in game.moves:
+        if position.turn == 'w':
+            tokens.append(f'{position.fullmove_number}.')
+        elif not tokens:
+            tokens.append(f'{position.fullmove_number}...')
+        tokens.append(move_to_san(position, move))
+        position.make_move(move)
+    tokens.append(tags['Result'])
+
+    # Wrap movetext below 80 columns
+    line = ''
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > 79:
+            lines.append(line)
+            line = token
+        else:
+            line = f'{line} {token}' if line else token
+    lines.append(line)
+    return '\n'.join(lines) + '\n\n'
+
+def write_game(path, game, headers=None):
+    # Appends a game to a PGN file
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(game_to_pgn(game, headers))
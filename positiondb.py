@@ -0,0 +1,238 @@
+import argparse
+import os
+import sqlite3
+import time
+
+from archive import GameArchive
+from bitboard import Position, iter_bits, popcount, row_col, START_FEN
+from game import is_valid_move
+from pgn import PgnError, read_games
+from zobrist import PIECE_KEYS
+
+# Every position of every ingested game, in SQLite, indexed three ways:
+#   hash      the Zobrist hash, for games that reached this exact position
+#   material  a signature of the pieces on the board (material_signature)
+#   pawns     a Zobrist hash of the pawns alone, for the same pawn structure
+# Each index also holds game and ply, so lookups never touch the table.
+# SQLite integers are signed, so 64-bit keys are stored two's complement.
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sources (path TEXT PRIMARY KEY, games INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    white TEXT,
+    black TEXT,
+    result TEXT,
+    plies INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS positions (
+    game INTEGER NOT NULL,
+    ply INTEGER NOT NULL,
+    hash INTEGER NOT NULL,
+    material INTEGER NOT NULL,
+    pawns INTEGER NOT NULL,
+    PRIMARY KEY (game, ply)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS positions_by_hash ON positions (hash, game, ply);
+CREATE INDEX IF NOT EXISTS positions_by_material ON positions (material, game, ply);
+CREATE INDEX IF NOT EXISTS positions_by_pawns ON positions (pawns, game, ply);
+'''
+BATCH_ROWS = 50000  # positions inserted per transaction
+
+# Four bits per piece count, kings left out
+MATERIAL_PIECES = ['wp', 'wn', 'wb', 'wr', 'wq', 'bp', 'bn', 'bb', 'br', 'bq']
+
+def _signed(key):
+    return key - (1 << 64) if key >= 1 << 63 else key
+
+def material_signature(position):
+    signature = 0
+    for i, piece in enumerate(MATERIAL_PIECES):
+        signature |= min(popcount(position.bitboards[piece]), 15) << (4 * i)
+    return signature
+
+def parse_material(text):
+    # 'KRPkr': white pieces in capitals, black in lower case; kings optional
+    signature = 0
+    for char in text:
+        if char in 'Kk':
+            continue
+        piece = ('w' if char.isupper() else 'b') + char.lower()
+        if piece not in MATERIAL_PIECES:
+            raise ValueError(f'unknown piece {char!r} in {text!r}')
+        shift = 4 * MATERIAL_PIECES.index(piece)
+        signature += 1 << shift
+    return signature
+
+def pawn_key(position):
+    key = 0
+    for piece in ('wp', 'bp'):
+        keys = PIECE_KEYS[piece]
+        for sq in iter_bits(position.bitboards[piece]):
+            key ^= keys[sq]
+    return key
+
+def position_rows(game_id, start, moves):
+    # One row for every position of a game, checking each move with the
+    # same rules as the board before it is applied. Raises ValueError at
+    # an illegal move.
+    position = start.copy()
+    rows = [(game_id, 0, _signed(position.hash), material_signature(position), _signed(pawn_key(position)))]
+    for ply, move in enumerate(moves, 1):
+        from_sq, to_sq, _ = move
+        piece = position.squares[from_sq]
+        if not piece or piece[0] != position.turn or not is_valid_move(
+                piece, row_col(from_sq), row_col(to_sq), position, position.en_passant_target, position.has_moved):
+            raise ValueError(f'illegal move {move} at ply {ply}')
+        position.make_move(move)
+        rows.append((game_id, ply, _signed(position.hash), material_signature(position),
+                     _signed(pawn_key(position))))
+    return rows
+
+class PositionDatabase:
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _games(self, source, skip):
+        # (number, start position, moves, headers) for the games of a PGN
+        # file or a game archive directory, in file order, after the first
+        # skip. moves is None where the movetext does not parse.
+        if os.path.isdir(source):
+            archive = GameArchive(source)
+            games = archive.games(range(skip, len(archive)))
+            for number, (moves, headers) in enumerate(games, skip):
+                fen = headers.get('FEN') if headers.get('SetUp') == '1' else None
+                yield number, Position.from_fen(fen or START_FEN), moves, headers
+        else:
+            for number, pgn_game in enumerate(read_games(source)):
+                if number < skip:
+                    continue
+                try:
+                    moves = pgn_game.moves()
+                except PgnError:
+                    moves = None
+                yield number, pgn_game.start_position(), moves, pgn_game.headers
+
+    def ingest(self, source):
+        # Adds the games of source not ingested before; sources are
+        # append-only, so a later call picks up where the last one stopped.
+        # Returns (games added, games skipped for illegal moves).
+        source = os.path.abspath(source)
+        row = self.db.execute('SELECT games FROM sources WHERE path = ?', (source,)).fetchone()
+        done = row[0] if row else 0
+        game_id = self.db.execute('SELECT COALESCE(MAX(id), 0) FROM games').fetchone()[0]
+        games, positions = [], []
+        added = skipped = 0
+        # In WAL mode with synchronous NORMAL commits skip the fsync, but the
+        # file stays consistent: a crash or power loss mid-ingest loses at
+        # most the last batches, which the next ingest redoes. A large page
+        # cache keeps the index inserts in memory.
+        self.db.execute('PRAGMA journal_mode = WAL')
+        self.db.execute('PRAGMA synchronous = NORMAL')
+        self.db.execute('PRAGMA cache_size = -262144')
+
+        def flush(count):
+            with self.db:
+                self.db.executemany('INSERT INTO games VALUES (?, ?, ?, ?, ?, ?, ?)', games)
+                self.db.executemany('INSERT INTO positions VALUES (?, ?, ?, ?, ?)', positions)
+                self.db.execute('INSERT OR REPLACE INTO sources VALUES (?, ?)', (source, count))
+            games.clear()
+            positions.clear()
+
+        number = done - 1
+        for number, start, moves, headers in self._games(source, done):
+            try:
+                if moves is None:
+                    raise ValueError('unreadable movetext')
+                rows = position_rows(game_id + 1, start, moves)
+            except ValueError:
+                skipped += 1
+                continue
+            game_id += 1
+            added += 1
+            games.append((game_id, source, number, headers.get('White'), headers.get('Black'),
+                          headers.get('Result', '*'), len(moves)))
+            positions += rows
+            if len(positions) >= BATCH_ROWS:
+                flush(number + 1)
+        flush(max(done, number + 1))
+        return added, skipped
+
+    def games_with_position(self, position, limit=100):
+        # (game, ply) wherever this exact position, side to move included,
+        # came up
+        return self.db.execute('SELECT game, ply FROM positions WHERE hash = ? LIMIT ?',
+                               (_signed(position.hash), limit)).fetchall()
+
+    def positions_with_material(self, signature, limit=100):
+        return self.db.execute('SELECT game, ply FROM positions WHERE material = ? LIMIT ?',
+                               (signature, limit)).fetchall()
+
+    def positions_with_pawns(self, position, limit=100):
+        return self.db.execute('SELECT game, ply FROM positions WHERE pawns = ? LIMIT ?',
+                               (_signed(pawn_key(position)), limit)).fetchall()
+
+    def count(self, column, value):
+        # How many positions have this hash, material or pawns value
+        if column not in ('hash', 'material', 'pawns'):
+            raise ValueError(column)
+        return self.db.execute(f'SELECT COUNT(*) FROM positions WHERE {column} = ?', (value,)).fetchone()[0]
+
+    def game_info(self, game):
+        return self.db.execute('SELECT source, number, white, black, result, plies FROM games WHERE id = ?',
+                               (game,)).fetchone()
+
+def main():
+    parser = argparse.ArgumentParser(description='Index every position of a game collection for lookups')
+    parser.add_argument('database')
+    commands = parser.add_subparsers(dest='command', required=True)
+    ingest = commands.add_parser('ingest', help='add new games from PGN files or game archives')
+    ingest.add_argument('sources', nargs='+')
+    query = commands.add_parser('query', help='find positions')
+    query.add_argument('--fen', help='games that reached this exact position')
+    query.add_argument('--material', help="positions with this material, e.g. KRPkr")
+    query.add_argument('--pawns', metavar='FEN', help='positions with the pawn structure of this position')
+    query.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    with PositionDatabase(args.database) as database:
+        if args.command == 'ingest':
+            for source in args.sources:
+                start = time.perf_counter()
+                added, skipped = database.ingest(source)
+                elapsed = time.perf_counter() - start
+                print(f'{source}: {added} games added, {skipped} skipped, {elapsed:.1f}s')
+            return
+        if args.fen:
+            lookup, column, value = database.games_with_position, 'hash', Position.from_fen(args.fen)
+            key = _signed(value.hash)
+        elif args.material:
+            lookup, column, value = database.positions_with_material, 'material', parse_material(args.material)
+            key = value
+        elif args.pawns:
+            lookup, column, value = database.positions_with_pawns, 'pawns', Position.from_fen(args.pawns)
+            key = _signed(pawn_key(value))
+        else:
+            parser.error('give --fen, --material or --pawns')
+        start = time.perf_counter()
+        found = lookup(value, args.limit)
+        elapsed = time.perf_counter() - start
+        print(f'{database.count(column, key)} positions; first {len(found)} in {elapsed * 1000:.2f} ms')
+        for game, ply in found:
+            source, number, white, black, result, plies = database.game_info(game)
+            print(f'  {os.path.basename(source)} game {number} ply {ply}/{plies}: {white} - {black} {result}')
+
+if __name__ == "__main__":
+    main()
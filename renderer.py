@@ -0,0 +1,138 @@
+import pygame
+
+HIGHLIGHT = (110, 160, 90)
+
+class DirtyRenderer:
+    # Draws only what changed since the last frame. The empty board is
+    # rendered once into a cached Surface; each frame the squares whose piece
+    # changed, or that the dragged piece or an animated sprite covers now or
+    # covered last frame, are restored from it and redrawn, and only their
+    # rects are pushed to the display. Nothing at all is drawn when nothing
+    # changed. Highlighted squares (legal destinations while dragging) are
+    # marked under the pieces and repainted when the set changes.
+    #
+    # The board is drawn with its top-left corner at origin, and drawing is
+    # clipped to it, so several renderers can share one window.
+    # draw_board(surface, origin, square_size) paints the empty board.
+    def __init__(self, size, square_size, draw_board, origin=(0, 0)):
+        self.size = size
+        self.square_size = square_size
+        self.draw_board = draw_board
+        self.origin = origin
+        self.rect = pygame.Rect(origin, size)
+        self.background = None
+        self.drawn_squares = None
+        self.drawn_hidden = frozenset()
+        self.drawn_sprites = []
+        self.drawn_highlights = frozenset()
+        self.full_redraw = True
+        self.stale = set()  # squares to repaint on the next frame
+
+    def invalidate(self):
+        self.full_redraw = True
+
+    def invalidate_rect(self, rect):
+        # Repaint the squares under rect on the next frame, after something
+        # else has drawn over them
+        self.stale |= self.squares_under(rect)
+
+    def square_rect(self, sq):
+        # Where square sq is in the window
+        size = self.square_size
+        x, y = self.origin
+        return pygame.Rect(x + (sq % 8) * size, y + (sq // 8) * size, size, size)
+
+    def squares_under(self, rect):
+        size = self.square_size
+        left, top = rect.left - self.origin[0], rect.top - self.origin[1]
+        cols = range(max(0, left // size), min(8, (left + rect.width - 1) // size + 1))
+        rows = range(max(0, top // size), min(8, (top + rect.height - 1) // size + 1))
+        return {row * 8 + col for row in rows for col in cols}
+
+    def draw_highlight(self, win, rect, occupied):
+        # A dot on an empty square, a ring around a piece that can be taken
+        radius = self.square_size // 6 if not occupied else self.square_size // 2 - 2
+        width = 0 if not occupied else max(2, self.square_size // 16)
+        pygame.draw.circle(win, HIGHLIGHT, rect.center, radius, width)
+
+    def render(self, win, board, images, selected_piece, overlay=None, update=True, highlights=(),
+               sprites=(), hidden=()):
+        # overlay(win) is drawn on top after a full redraw; call invalidate()
+        # when it changes. highlights are squares to mark. sprites are
+        # (piece, rect) pairs drawn over the board, such as pieces in the
+        # middle of an animation, and the pieces on the hidden squares are
+        # left out. Returns the list of rects that changed, after pushing
+        # them to the display unless update is False.
+        if self.background is None:
+            self.background = pygame.Surface(self.size).convert()
+            self.draw_board(self.background, (0, 0), self.square_size)
+
+        squares = board.squares
+        highlights = frozenset(highlights)
+        hidden = set(hidden)
+        sprites = list(sprites)
+        if selected_piece:
+            row, col = selected_piece['pos']
+            hidden.add(row * 8 + col)
+            # The dragged piece goes on top of everything else
+            sprites.append((selected_piece['piece'],
+                            pygame.Rect(selected_piece['mouse_pos'], (self.square_size, self.square_size))))
+        hidden = frozenset(hidden)
+
+        if self.full_redraw or self.drawn_squares is None:
+            dirty = set(range(64))
+        else:
+            drawn = self.drawn_squares
+            dirty = {sq for sq in range(64) if squares[sq] != drawn[sq]}
+            dirty |= highlights ^ self.drawn_highlights
+            dirty |= hidden ^ self.drawn_hidden
+            dirty |= self.stale
+            if sprites != self.drawn_sprites:
+                for _, rect in sprites + self.drawn_sprites:
+                    dirty |= self.squares_under(rect)
+            if dirty and sprites:
+                # Sprites are drawn last, so repaint everything under any
+                # sprite that overlaps a repainted square
+                under = [self.squares_under(rect) for _, rect in sprites]
+                grown = True
+                while grown:
+                    grown = False
+                    for sprite_squares in under:
+                        if sprite_squares & dirty and not sprite_squares <= dirty:
+                            dirty |= sprite_squares
+                            grown = True
+            if dirty and overlay:
+                dirty = set(range(64))
+
+        self.drawn_squares = list(squares)
+        self.drawn_hidden = hidden
+        self.drawn_sprites = sprites
+        self.drawn_highlights = highlights
+        self.stale = set()
+        if not dirty:
+            return []
+
+        full = len(dirty) == 64
+        self.full_redraw = False
+        # Squares do not overlap, so the background goes down first and the
+        # pieces follow in one batched blit from the sprite atlas
+        rects = [self.square_rect(sq) for sq in dirty]
+        background = self.background
+        x, y = self.origin
+        clip = win.get_clip()
+        win.set_clip(self.rect)
+        win.blits([(background, rect, rect.move(-x, -y)) for rect in rects], doreturn=False)
+        for sq, rect in zip(dirty, rects):
+            if sq in highlights:
+                self.draw_highlight(win, rect, squares[sq] is not None)
+        placements = [(squares[sq], rect) for sq, rect in zip(dirty, rects) if squares[sq] and sq not in hidden]
+        placements += [(piece, rect) for piece, rect in sprites if self.squares_under(rect) & dirty]
+        images.draw(win, placements)
+        if full:
+            if overlay:
+                overlay(win)
+            rects = [self.rect.copy()]
+        win.set_clip(clip)
+        if update:
+            pygame.display.update(rects)
+        return rects
@@ -0,0 +1,255 @@
+import argparse
+import sys
+import threading
+from collections import OrderedDict, namedtuple
+
+import pygame
+
+from PyMain import HEIGHT, IDLE_TIMEOUT_MS, SQUARE_SIZE, WIDTH, coalesce_motion, draw_board, next_events
+from animation import MOVE_MS, Animator
+from bitboard import Position
+from pgn import PgnDatabase, move_to_san
+from renderer import DirtyRenderer
+from sprites import SpriteCache
+
+CHECKPOINT_INTERVAL = 16  # plies between stored positions
+CACHED_SEGMENTS = 64
+PREFETCH_SEGMENTS = 4  # segments kept ready ahead of the cursor
+PLAY_SPEED = 2  # plies per second
+FAST_SPEED = 300
+BAR_HEIGHT = 32
+BAR_BG = (40, 44, 52)
+BAR_FILL = (110, 160, 90)
+BAR_TEXT = (230, 230, 230)
+
+# What the renderer needs to draw one ply: the board's 64 squares
+Frame = namedtuple('Frame', 'squares')
+
+class Replay:
+    # Random access to every position of a recorded game. A snapshot of the
+    # position is stored every CHECKPOINT_INTERVAL plies, so seeking to any
+    # ply replays at most that many moves from the checkpoint before it,
+    # however long the game is. The frames of a whole segment between two
+    # checkpoints are built together and kept in an LRU cache; prefetch()
+    # asks a background thread to build the segments ahead of the cursor,
+    # so stepping, playing and fast-forwarding only look frames up.
+    def __init__(self, start, moves, interval=CHECKPOINT_INTERVAL, cached_segments=CACHED_SEGMENTS):
+        self.moves = moves
+        self.interval = interval
+        self.cached_segments = cached_segments
+        self.checkpoints = []
+        self.sans = []
+        position = start.copy()
+        for ply, move in enumerate(moves):
+            if ply % interval == 0:
+                self.checkpoints.append(position.snapshot())
+            self.sans.append(move_to_san(position, move))
+            position.make_move(move)
+        if len(moves) % interval == 0:
+            self.checkpoints.append(position.snapshot())
+        self.segments = OrderedDict()
+        self.lock = threading.Lock()
+        self.wanted = None  # (segment, direction) for the prefetch thread
+        self.requested = None
+        self.wake = threading.Condition(self.lock)
+        self.closed = False
+        self.thread = threading.Thread(target=self._prefetch_loop, daemon=True)
+        self.thread.start()
+
+    def __len__(self):
+        # Number of plies; positions run from 0 to len(replay)
+        return len(self.moves)
+
+    def position_at(self, ply):
+        # A fresh Position after ply moves
+        base = ply - ply % self.interval
+        position = Position.from_snapshot(self.checkpoints[base // self.interval])
+        for move in self.moves[base:ply]:
+            position.make_move(move)
+        return position
+
+    def _build_segment(self, index):
+        base = index * self.interval
+        position = Position.from_snapshot(self.checkpoints[index])
+        frames = [Frame(tuple(position.squares))]
+        for move in self.moves[base:min(base + self.interval - 1, len(self.moves))]:
+            position.make_move(move)
+            frames.append(Frame(tuple(position.squares)))
+        return frames
+
+    def _segment(self, index):
+        with self.lock:
+            frames = self.segments.get(index)
+            if frames is not None:
+                self.segments.move_to_end(index)
+                return frames
+        frames = self._build_segment(index)
+        self._store(index, frames)
+        return frames
+
+    def _store(self, index, frames):
+        with self.lock:
+            self.segments[index] = frames
+            self.segments.move_to_end(index)
+            while len(self.segments) > self.cached_segments:
+                self.segments.popitem(last=False)
+
+    def frame(self, ply):
+        return self._segment(ply // self.interval)[ply % self.interval]
+
+    def prefetch(self, ply, direction=1):
+        # Build the segments the cursor at ply is heading into
+        wanted = (ply // self.interval, 1 if direction >= 0 else -1)
+        if wanted == self.requested:
+            return
+        self.requested = wanted
+        with self.lock:
+            self.wanted = wanted
+            self.wake.notify()
+
+    def _prefetch_loop(self):
+        while True:
+            with self.lock:
+                while self.wanted is None and not self.closed:
+                    self.wake.wait()
+                if self.closed:
+                    return
+                segment, direction = self.wanted
+                self.wanted = None
+            for step in range(PREFETCH_SEGMENTS + 1):
+                index = segment + step * direction
+                if not 0 <= index < len(self.checkpoints):
+                    break
+                with self.lock:
+                    if self.wanted is not None:
+                        break  # the cursor moved on; start from there
+                    cached = index in self.segments
+                if not cached:
+                    self._store(index, self._build_segment(index))
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.wake.notify()
+        self.thread.join(1)
+
+def draw_bar(win, font, replay, ply, speed):
+    # Progress through the game along the bottom of the window, with the
+    # move just played
+    rect = pygame.Rect(0, HEIGHT, WIDTH, BAR_HEIGHT)
+    win.fill(BAR_BG, rect)
+    if len(replay):
+        fill = rect.copy()
+        fill.width = WIDTH * ply // len(replay)
+        win.fill(BAR_FILL, fill)
+    if ply:
+        number = (ply + 1) // 2
+        move = f"{number}. {replay.sans[ply - 1]}" if ply % 2 else f"{number}... {replay.sans[ply - 1]}"
+    else:
+        move = 'start'
+    state = f"{'>>' if speed > 0 else '<<'} {abs(speed)}/s" if speed else 'paused'
+    label = font.render(f'{ply}/{len(replay)}  {move}  {state}', True, BAR_TEXT)
+    win.blit(label, label.get_rect(midleft=(8, rect.centery)))
+    return rect
+
+def main(pgn_path, game_index=0, fast_speed=FAST_SPEED):
+    # Keys: left/right step a ply, page up/down ten, home/end jump to either
+    # end, space plays or pauses, F fast-forwards and B rewinds at
+    # fast_speed plies per second. Click or drag on the bar to scrub.
+    with PgnDatabase(pgn_path) as database:
+        record = database[game_index]
+    replay = Replay(record.start_position(), record.moves())
+
+    pygame.init()
+    win = pygame.display.set_mode((WIDTH, HEIGHT + BAR_HEIGHT))
+    title = f"{record.headers.get('White', '?')} - {record.headers.get('Black', '?')}"
+    pygame.display.set_caption(f"Replay: {title} {record.headers.get('Result', '')}")
+    clock = pygame.time.Clock()
+    images = SpriteCache('images').sprites(SQUARE_SIZE)
+    renderer = DirtyRenderer((WIDTH, HEIGHT), SQUARE_SIZE, draw_board)
+    animator = Animator(renderer)
+    font = pygame.font.SysFont('Arial', 16)
+
+    cursor = 0.0  # fractional while playing, so any speed advances smoothly
+    speed = 0
+    drawn = None
+    shown = 0  # the ply on the board
+    scrubbing = False
+    elapsed = 0
+    run = True
+    while run:
+        if speed:
+            cursor = min(max(cursor + speed * elapsed, 0), len(replay))
+            if cursor in (0, len(replay)):
+                speed = 0
+        ply = int(cursor)
+        replay.prefetch(ply, speed or 1)
+        if ply != shown:
+            # Single steps slide the piece, no slower than the replay runs;
+            # jumps and fast-forwarding just show the new position
+            duration = min(MOVE_MS, 1000 // abs(speed)) if speed else MOVE_MS
+            if ply == shown + 1:
+                animator.animate_move(replay.frame(shown).squares, replay.moves[shown], duration)
+            elif ply == shown - 1:
+                animator.animate_move(replay.frame(ply).squares, replay.moves[ply], duration, reverse=True)
+            else:
+                animator.clear()
+            shown = ply
+        sprites, hidden = animator.frame()
+        rects = renderer.render(win, replay.frame(ply), images, None, update=False, sprites=sprites, hidden=hidden)
+        if (ply, speed) != drawn:
+            rects.append(draw_bar(win, font, replay, ply, speed))
+            drawn = (ply, speed)
+        if rects:
+            pygame.display.update(rects)
+
+        # Run at full frame rate only while playing or animating; paused,
+        # sleep until an event arrives
+        if speed or animator.active:
+            elapsed = clock.tick(60) / 1000
+            events = pygame.event.get()
+        else:
+            events = next_events(IDLE_TIMEOUT_MS)
+            clock.tick()  # the time spent asleep does not move the cursor
+            elapsed = 0
+        for event in coalesce_motion(events):
+            if event.type == pygame.QUIT:
+                run = False
+
+            elif event.type == pygame.KEYDOWN:
+                steps = {pygame.K_RIGHT: 1, pygame.K_LEFT: -1, pygame.K_PAGEDOWN: 10, pygame.K_PAGEUP: -10}
+                if event.key in steps:
+                    cursor = min(max(int(cursor) + steps[event.key], 0), len(replay))
+                    speed = 0
+                elif event.key == pygame.K_HOME:
+                    cursor, speed = 0, 0
+                elif event.key == pygame.K_END:
+                    cursor, speed = len(replay), 0
+                elif event.key == pygame.K_SPACE:
+                    speed = 0 if speed else PLAY_SPEED
+                elif event.key == pygame.K_f:
+                    speed = fast_speed
+                elif event.key == pygame.K_b:
+                    speed = -fast_speed
+
+            elif event.type == pygame.MOUSEBUTTONDOWN and event.pos[1] >= HEIGHT:
+                scrubbing = True
+
+            elif event.type == pygame.MOUSEBUTTONUP:
+                scrubbing = False
+
+            if scrubbing and event.type in (pygame.MOUSEBUTTONDOWN, pygame.MOUSEMOTION):
+                cursor = float(round(min(max(event.pos[0], 0), WIDTH) * len(replay) / WIDTH))
+                speed = 0
+
+    replay.close()
+    pygame.quit()
+    sys.exit()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Step, play and scrub through a recorded game')
+    parser.add_argument('pgn')
+    parser.add_argument('--game', type=int, default=0, help='index of the game in the file, from 0')
+    parser.add_argument('--speed', type=int, default=FAST_SPEED, help='fast-forward speed in plies per second')
+    args = parser.parse_args()
+    main(args.pgn, args.game, args.speed)
@@ -0,0 +1,80 @@
+from bitboard import iter_bits, piece_attacks
+from movegen import has_legal_move
+
+class AttackMap:
+    # Keeps the attack set of every occupied square and the union of those
+    # sets per side. After a move only the squares it touched and the
+    # sliders whose rays crossed them are recomputed.
+    def __init__(self, position):
+        self.attacks_from = [0] * 64
+        self.attacked = {'w': 0, 'b': 0}
+        self.refresh(position)
+
+    def refresh(self, position):
+        occupied = position.all_occupied
+        for sq, piece in enumerate(position.squares):
+            self.attacks_from[sq] = piece_attacks(piece, sq, occupied) if piece else 0
+        self._update_sides(position)
+
+    def update(self, position, move, undo):
+        # Call after position.make_move(move) returned undo
+        self.update_squares(position, changed_squares(position, move, undo))
+
+    def update_squares(self, position, changed):
+        occupied = position.all_occupied
+        squares = position.squares
+        attacks_from = self.attacks_from
+        for sq in iter_bits(changed):
+            piece = squares[sq]
+            attacks_from[sq] = piece_attacks(piece, sq, occupied) if piece else 0
+
+        bb = position.bitboards
+        sliders = (bb['wb'] | bb['wr'] | bb['wq'] | bb['bb'] | bb['br'] | bb['bq']) & ~changed
+        for sq in iter_bits(sliders):
+            # A slider only sees a change if the square was inside its
+            # attack set: either a blocker that moved away or a newly
+            # occupied square on its ray.
+            if attacks_from[sq] & changed:
+                attacks_from[sq] = piece_attacks(squares[sq], sq, occupied)
+        self._update_sides(position)
+
+    def _update_sides(self, position):
+        attacks_from = self.attacks_from
+        for color in ('w', 'b'):
+            attacked = 0
+            for sq in iter_bits(position.occupied[color]):
+                attacked |= attacks_from[sq]
+            self.attacked[color] = attacked
+
+    def in_check(self, position, color):
+        enemy_color = 'b' if color == 'w' else 'w'
+        return bool(position.bitboards[color + 'k'] & self.attacked[enemy_color])
+
+def changed_squares(position, move, undo):
+    # Bitboard of the squares a made move touched, including the en passant
+    # victim and the castling rook. position must be after the move.
+    from_sq, to_sq, _ = move
+    changed = 1 << from_sq | 1 << to_sq | 1 << undo[1]
+    if position.squares[to_sq][1] == 'k' and abs(to_sq - from_sq) == 2:
+        if to_sq > from_sq:
+            changed |= 1 << (from_sq + 1) | 1 << (from_sq + 3)
+        else:
+            changed |= 1 << (from_sq - 1) | 1 << (from_sq - 4)
+    return changed
+
+def position_key(position):
+    # The Zobrist hash covers pieces, side to move, castling rights and a
+    # usable en passant file: everything that decides a repetition.
+    return position.hash
+
+def game_status(position, attack_map, repetitions=None):
+    # Returns 'checkmate', 'stalemate', 'threefold repetition',
+    # 'fifty-move rule' or None while the game goes on.
+    in_check = attack_map.in_check(position, position.turn)
+    if not has_legal_move(position, in_check):
+        return 'checkmate' if in_check else 'stalemate'
+    if repetitions and repetitions.get(position_key(position), 0) >= 3:
+        return 'threefold repetition'
+    if position.halfmove_clock >= 100:
+        return 'fifty-move rule'
+    return None
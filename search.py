@@ -0,0 +1,251 @@
+import time
+
+from evaluate import PIECE_VALUES, evaluate
+from movegen import generate_captures, generate_moves, is_in_check
+from transposition import TranspositionTable, EXACT, LOWER, UPPER
+
+MATE_SCORE = 30000
+MATE_BOUND = MATE_SCORE - 1000  # scores beyond this are mates in some number of plies
+INFINITY = 32000
+MAX_PLY = 64
+
+# The king only ever attacks in ordering terms, and should go last when it does
+ORDER_VALUES = dict(PIECE_VALUES, k=1000)
+
+class SearchTimeout(Exception):
+    pass
+
+def _score_to_tt(score, ply):
+    # Mate scores are stored relative to the node, not the root
+    if score > MATE_BOUND:
+        return score + ply
+    if score < -MATE_BOUND:
+        return score - ply
+    return score
+
+def _score_from_tt(score, ply):
+    if score > MATE_BOUND:
+        return score - ply
+    if score < -MATE_BOUND:
+        return score + ply
+    return score
+
+class Search:
+    # Iterative-deepening negamax with alpha-beta, a transposition table,
+    # MVV-LVA/killer/history move ordering and quiescence search.
+    def __init__(self, tt=None, stop_event=None):
+        self.tt = tt if tt is not None else TranspositionTable()
+        # stop_event lets another process end the search (see parallel.py)
+        self.stop_event = stop_event
+        self.stopped = False
+        self.nodes = 0
+        self.deadline = 0
+        self.killers = []
+        self.history = {}
+        self.line = []
+
+    def stop(self):
+        # Safe to call from another thread; the search returns its best
+        # completed iteration shortly after.
+        self.stopped = True
+
+    def search(self, position, time_ms=1000, max_depth=MAX_PLY, game_keys=None, on_iteration=None,
+               root_moves=None, start_depth=1):
+        # game_keys are the hashes of positions already played in the game,
+        # so the search can see repetitions. root_moves limits the search to
+        # some of the legal moves. Returns a dict with the best move, its
+        # score, the depth reached and node statistics.
+        position = position.copy()
+        start = time.perf_counter()
+        self.deadline = start + time_ms / 1000
+        self.stopped = False
+        self.nodes = 0
+        self.killers = [[None, None] for _ in range(MAX_PLY + 1)]
+        self.history = {}
+        self.line = list(game_keys or [])
+        self.tt.new_search()
+
+        result = {'move': None, 'score': 0, 'depth': 0, 'nodes': 0,
+                  'time_ms': 0, 'nps': 0, 'pv': []}
+        root_moves = list(root_moves) if root_moves is not None else generate_moves(position)
+        if not root_moves:
+            return result
+        result['move'] = root_moves[0]
+
+        for depth in range(min(start_depth, max_depth), max_depth + 1):
+            try:
+                score, move = self._search_root(position, root_moves, depth)
+            except SearchTimeout:
+                break
+            result['move'] = move
+            result['score'] = score
+            result['depth'] = depth
+            result['pv'] = self._principal_variation(position, depth)
+            self._fill_stats(result, start)
+            if on_iteration:
+                on_iteration(dict(result))
+            # Stop on a found mate, or when the next iteration cannot finish
+            elapsed = time.perf_counter() - start
+            if abs(score) > MATE_BOUND or elapsed > (self.deadline - start) / 2:
+                break
+            # Search the best move first next time
+            root_moves.remove(move)
+            root_moves.insert(0, move)
+
+        self._fill_stats(result, start)
+        return result
+
+    def _fill_stats(self, result, start):
+        elapsed = time.perf_counter() - start
+        result['nodes'] = self.nodes
+        result['time_ms'] = int(elapsed * 1000)
+        result['nps'] = int(self.nodes / elapsed) if elapsed > 0 else 0
+
+    def _check_time(self):
+        if self.stopped or time.perf_counter() > self.deadline or \
+                (self.stop_event is not None and self.stop_event.is_set()):
+            raise SearchTimeout()
+
+    def _search_root(self, position, moves, depth):
+        # A timeout unwinds without unmaking moves; search() works on a copy
+        # of the position, so that is harmless.
+        alpha, beta = -INFINITY, INFINITY
+        best_move = moves[0]
+        self.line.append(position.hash)
+        for move in moves:
+            undo = position.make_move(move)
+            score = -self._negamax(position, depth - 1, -beta, -alpha, 1)
+            position.unmake_move(move, undo)
+            if score > alpha:
+                alpha = score
+                best_move = move
+        self.line.pop()
+        self.tt.store(position.hash, depth, alpha, EXACT, best_move)
+        return alpha, best_move
+
+    def _negamax(self, position, depth, alpha, beta, ply):
+        self.nodes += 1
+        if not self.nodes & 255:
+            self._check_time()
+
+        key = position.hash
+        if position.halfmove_clock >= 100 or key in self.line:
+            return 0
+
+        in_check = is_in_check(position)
+        if in_check:
+            depth += 1
+        if depth <= 0 or ply >= MAX_PLY:
+            return self._quiesce(position, alpha, beta, ply)
+
+        tt_move = None
+        entry = self.tt.probe(key)
+        if entry:
+            tt_depth, tt_score, flag, tt_move = entry
+            if tt_depth >= depth:
+                tt_score = _score_from_tt(tt_score, ply)
+                if flag == EXACT or (flag == LOWER and tt_score >= beta) or \
+                        (flag == UPPER and tt_score <= alpha):
+                    return tt_score
+
+        moves = generate_moves(position)
+        if not moves:
+            return -MATE_SCORE + ply if in_check else 0
+        self._order_moves(position, moves, tt_move, ply)
+
+        original_alpha = alpha
+        best_score = -INFINITY
+        best_move = None
+        squares = position.squares
+        self.line.append(key)
+        for move in moves:
+            quiet = not squares[move[1]] and not move[2]
+            undo = position.make_move(move)
+            score = -self._negamax(position, depth - 1, -beta, -alpha, ply + 1)
+            position.unmake_move(move, undo)
+            if score > best_score:
+                best_score = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                if quiet:
+                    self._record_cutoff(move, depth, ply)
+                break
+        self.line.pop()
+
+        if best_score <= original_alpha:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.tt.store(key, depth, _score_to_tt(best_score, ply), flag, best_move)
+        return best_score
+
+    def _quiesce(self, position, alpha, beta, ply):
+        self.nodes += 1
+        if not self.nodes & 255:
+            self._check_time()
+
+        stand_pat = evaluate(position)
+        if stand_pat >= beta or ply >= MAX_PLY:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+
+        # Under-promotions almost never matter for tactics
+        moves = [move for move in generate_captures(position) if move[2] in (None, 'q')]
+        self._order_moves(position, moves, None, ply)
+        for move in moves:
+            undo = position.make_move(move)
+            score = -self._quiesce(position, -beta, -alpha, ply + 1)
+            position.unmake_move(move, undo)
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def _order_moves(self, position, moves, tt_move, ply):
+        squares = position.squares
+        killers = self.killers[ply] if ply < len(self.killers) else ()
+        history = self.history
+
+        def order(move):
+            if move == tt_move:
+                return 1000000
+            victim = squares[move[1]]
+            if victim:
+                # MVV-LVA: most valuable victim first, cheapest attacker first
+                return 100000 + ORDER_VALUES[victim[1]] * 10 - ORDER_VALUES[squares[move[0]][1]]
+            if move[2]:
+                return 90000 + ORDER_VALUES[move[2]]
+            if move in killers:
+                return 80000
+            return history.get((move[0], move[1]), 0)
+
+        moves.sort(key=order, reverse=True)
+
+    def _record_cutoff(self, move, depth, ply):
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        key = (move[0], move[1])
+        self.history[key] = self.history.get(key, 0) + depth * depth
+        if self.history[key] > 50000:
+            # Keep history scores below the killer bonus
+            for k in self.history:
+                self.history[k] //= 2
+
+    def _principal_variation(self, position, depth):
+        pv = []
+        position = position.copy()
+        for _ in range(depth):
+            entry = self.tt.probe(position.hash)
+            if not entry or entry[3] not in generate_moves(position):
+                break
+            pv.append(entry[3])
+            position.make_move(entry[3])
+        return pv
@@ -0,0 +1,150 @@
+import argparse
+import json
+import multiprocessing
+import random
+import sys
+import time
+
+from archive import GameArchive
+from book import Book, probe_books
+from endgame import load_tables
+from game import Game
+from movegen import move_from_uci, move_to_uci
+from search import Search
+
+PLAYERS = ('random', 'engine')
+ARCHIVE_BATCH = 1000  # games appended to an archive at a time
+
+def random_player(rng):
+    def choose(game):
+        return rng.choice(game.legal_moves())
+    return choose
+
+def engine_player(depth, time_ms):
+    # A fixed depth with a generous budget keeps games reproducible;
+    # time_ms only caps runaway positions.
+    engine = Search()
+
+    def choose(game):
+        result = engine.search(game.position, time_ms, max_depth=depth, game_keys=game.repetitions)
+        return result['move']
+    return choose
+
+# Each worker process maps the book files once
+_books = None
+
+def _open_books(args):
+    global _books
+    if _books is None:
+        _books = [Book(path) for path in args['books']]
+        if args['tables']:
+            _books += load_tables(args['tables'])
+    return _books
+
+def make_player(kind, rng, args):
+    if kind == 'engine':
+        # Book moves are drawn from the game's own rng, so games stay reproducible
+        books = _open_books(args)
+        player = engine_player(args['depth'], args['time_ms'])
+        return lambda game: probe_books(books, game.position, rng) or player(game)
+    return random_player(rng)
+
+def play_game(job):
+    # Runs one game in a worker process and returns its summary record
+    index, seed, args = job
+    rng = random.Random(seed)
+    players = {'w': make_player(args['white'], rng, args),
+               'b': make_player(args['black'], rng, args)}
+    game = Game()
+    start = time.perf_counter()
+    while not game.winner and len(game.moves) < args['max_plies']:
+        game.play(players[game.turn](game))
+    record = {
+        'game': index,
+        'seed': seed,
+        'white': args['white'],
+        'black': args['black'],
+        'result': game.result,
+        'termination': game.winner or 'max plies',
+        'plies': len(game.moves),
+        'seconds': round(time.perf_counter() - start, 4)
+    }
+    if args['record_moves'] or args['archive']:
+        record['moves'] = [move_to_uci(move) for move in game.moves]
+    return record
+
+def _archive_entry(record):
+    headers = {'Event': 'selfplay', 'Round': str(record['game']), 'White': record['white'],
+               'Black': record['black'], 'Result': record['result'], 'Termination': record['termination']}
+    return [move_from_uci(text) for text in record['moves']], headers, None
+
+def run(games, workers, seed, args, output, archive=None):
+    # With archive, a GameArchive, every game's moves are appended to it too
+    jobs = [(i, seed + i, args) for i in range(games)]
+    results = {}
+    plies = 0
+    batch = []
+    start = time.perf_counter()
+    with multiprocessing.Pool(workers) as pool:
+        for record in pool.imap_unordered(play_game, jobs, chunksize=max(1, games // (workers * 8))):
+            if archive is not None:
+                batch.append(_archive_entry(record))
+                if len(batch) >= ARCHIVE_BATCH:
+                    archive.extend(batch)
+                    batch = []
+                if not args['record_moves']:
+                    del record['moves']
+            output.write(json.dumps(record) + '\n')
+            results[record['result']] = results.get(record['result'], 0) + 1
+            plies += record['plies']
+    if batch:
+        archive.extend(batch)
+    elapsed = time.perf_counter() - start
+    return {
+        'games': games,
+        'workers': workers,
+        'seconds': round(elapsed, 3),
+        'games_per_sec': round(games / elapsed, 2),
+        'moves_per_sec': round(plies / elapsed, 1),
+        'results': results
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Play many headless games in parallel')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--seed', type=int, default=1, help='game i is played with seed + i')
+    parser.add_argument('--white', choices=PLAYERS, default='random')
+    parser.add_argument('--black', choices=PLAYERS, default='random')
+    parser.add_argument('--depth', type=int, default=2, help='engine search depth')
+    parser.add_argument('--time-ms', type=int, default=1000, help='engine time cap per move')
+    parser.add_argument('--max-plies', type=int, default=400, help='adjourn games that run longer')
+    parser.add_argument('--moves', action='store_true', help='include the UCI move list in each record')
+    parser.add_argument('--book', action='append', default=[], help='opening book for the engine (can be repeated)')
+    parser.add_argument('--tables', help='directory with endgame tables from endgame.py')
+    parser.add_argument('--output', help='write per-game JSON lines here instead of stdout')
+    parser.add_argument('--archive', help='also append the games to this game archive directory (see archive.py)')
+    args = parser.parse_args()
+
+    game_args = {
+        'white': args.white,
+        'black': args.black,
+        'depth': args.depth,
+        'time_ms': args.time_ms,
+        'max_plies': args.max_plies,
+        'record_moves': args.moves,
+        'books': args.book,
+        'tables': args.tables,
+        'archive': bool(args.archive)
+    }
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        archive = GameArchive(args.archive) if args.archive else None
+        stats = run(args.games, args.workers, args.seed, game_args, output, archive)
+    finally:
+        if args.output:
+            output.close()
+    print(json.dumps(stats), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
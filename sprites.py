@@ -0,0 +1,126 @@
+import argparse
+import os
+from collections import OrderedDict
+
+import pygame
+
+from bitboard import PIECES
+
+class SpriteSet:
+    # All twelve piece sprites at one square size, packed side by side into
+    # a single atlas Surface. draw() renders any number of pieces with one
+    # Surface.blits() call using source rects into the atlas, so a frame
+    # costs one call into pygame rather than one per piece. Indexing by
+    # piece gives the sprite as a subsurface of the atlas.
+    def __init__(self, atlas, size):
+        self.atlas = atlas
+        self.size = size
+        self.rects = {piece: pygame.Rect(i * size, 0, size, size) for i, piece in enumerate(PIECES)}
+        self.surfaces = {piece: atlas.subsurface(rect) for piece, rect in self.rects.items()}
+
+    def __getitem__(self, piece):
+        return self.surfaces[piece]
+
+    def __contains__(self, piece):
+        return piece in self.rects
+
+    def __iter__(self):
+        return iter(PIECES)
+
+    def __len__(self):
+        return len(PIECES)
+
+    def draw(self, win, placements):
+        # placements: (piece, destination) pairs
+        atlas = self.atlas
+        rects = self.rects
+        win.blits([(atlas, dest, rects[piece]) for piece, dest in placements], doreturn=False)
+
+class SpriteCache:
+    # Builds the atlas for a square size the first time it is drawn at, from
+    # piece images loaded on first use and converted to the display format
+    # so blits do not convert on every frame. Atlases are kept for the
+    # max_sizes most recently used square sizes.
+    #
+    # With cache_dir, save() writes each atlas there as pieces-<size>.png,
+    # and later starts load that one file instead of decoding the twelve
+    # originals and scaling them. An atlas older than any of the originals
+    # is ignored and rewritten. `python sprites.py` builds them ahead of time.
+    def __init__(self, directory='images', max_sizes=4, cache_dir=None):
+        self.directory = directory
+        self.max_sizes = max_sizes
+        self.cache_dir = cache_dir
+        self.sources = {}
+        self.sets = OrderedDict()
+
+    def _convert(self, surface):
+        # convert_alpha() needs a display mode; without one, keep the surface
+        return surface.convert_alpha() if pygame.display.get_surface() else surface
+
+    def _path(self, piece):
+        return os.path.join(self.directory, f'{piece}.png')
+
+    def source(self, piece):
+        surface = self.sources.get(piece)
+        if surface is None:
+            surface = self._convert(pygame.image.load(self._path(piece)))
+            self.sources[piece] = surface
+        return surface
+
+    def sprites(self, size):
+        sprite_set = self.sets.get(size)
+        if sprite_set is not None:
+            self.sets.move_to_end(size)
+            return sprite_set
+        if self.cache_dir and self._atlas_is_current(size):
+            atlas = self._convert(pygame.image.load(self._atlas_path(size)))
+        else:
+            atlas = self._build_atlas(size)
+        sprite_set = SpriteSet(atlas, size)
+        self.sets[size] = sprite_set
+        while len(self.sets) > self.max_sizes:
+            self.sets.popitem(last=False)
+        return sprite_set
+
+    def _build_atlas(self, size):
+        atlas = pygame.Surface((size * len(PIECES), size), pygame.SRCALPHA)
+        for i, piece in enumerate(PIECES):
+            sprite = pygame.transform.scale(self.source(piece), (size, size))
+            # Copy the pixels and alpha as they are rather than blending
+            atlas.blit(sprite, (i * size, 0), special_flags=pygame.BLEND_RGBA_MAX)
+        return self._convert(atlas)
+
+    def _atlas_path(self, size):
+        return os.path.join(self.cache_dir, f'pieces-{size}.png')
+
+    def _atlas_is_current(self, size):
+        path = self._atlas_path(size)
+        if not os.path.exists(path):
+            return False
+        built = os.path.getmtime(path)
+        return all(os.path.getmtime(self._path(piece)) <= built for piece in PIECES)
+
+    def save(self):
+        # Writes every cached atlas without a current copy on disk
+        if not self.cache_dir:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for size, sprite_set in self.sets.items():
+            if not self._atlas_is_current(size):
+                pygame.image.save(sprite_set.atlas, self._atlas_path(size))
+
+def main():
+    parser = argparse.ArgumentParser(description='Build piece sprite atlases ahead of time')
+    parser.add_argument('cache_dir')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[80], help='square sizes to build')
+    parser.add_argument('--images', default='images', help='directory with the piece PNGs')
+    args = parser.parse_args()
+
+    cache = SpriteCache(args.images, max_sizes=len(args.sizes), cache_dir=args.cache_dir)
+    for size in args.sizes:
+        cache.sprites(size)
+    cache.save()
+    print(f'{len(args.sizes)} atlases in {args.cache_dir}')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+from movegen import decode_move, encode_move
+
+# Bound types
+EXACT, LOWER, UPPER = 0, 1, 2
+
+# Replacement policies
+ALWAYS_REPLACE = 'always'
+DEPTH_PREFERRED = 'depth'
+TWO_TIER = 'two-tier'
+POLICIES = (ALWAYS_REPLACE, DEPTH_PREFERRED, TWO_TIER)
+
+# Each entry is two 64-bit words: key ^ data and data. A torn write (two
+# searches storing the same slot at once) then fails the key check instead
+# of returning a mix of two entries.
+ENTRY_BYTES = 16
+
+# Data word layout
+SCORE_OFFSET = 1 << 19
+SCORE_SHIFT = 16
+DEPTH_SHIFT = 36
+FLAG_SHIFT = 44
+AGE_SHIFT = 46
+
+def pack_entry(depth, score, flag, move, age):
+    return ((encode_move(move) if move else 0)
+            | (score + SCORE_OFFSET) << SCORE_SHIFT
+            | max(0, min(depth, 255)) << DEPTH_SHIFT
+            | flag << FLAG_SHIFT
+            | (age & 255) << AGE_SHIFT)
+
+def unpack_entry(data):
+    # Returns (depth, score, flag, move)
+    return (data >> DEPTH_SHIFT & 255,
+            (data >> SCORE_SHIFT & 0xFFFFF) - SCORE_OFFSET,
+            data >> FLAG_SHIFT & 3,
+            decode_move(data & 0xFFFF))
+
+class TranspositionTable:
+    # Fixed-size hash table keyed by Position.hash. The whole table lives in
+    # one preallocated buffer, so size_mb is a hard memory cap. Passing a
+    # buffer (for example SharedMemory.buf) lets several processes share it.
+    def __init__(self, size_mb=16, policy=DEPTH_PREFERRED, buffer=None):
+        if policy not in POLICIES:
+            raise ValueError(f'Unknown replacement policy: {policy}')
+        self.policy = policy
+        slots = max(2, int(size_mb * 1024 * 1024) // ENTRY_BYTES)
+        # Two-tier tables work on buckets of two neighbouring slots
+        self.slots = slots - slots % 2
+        self.buckets = self.slots // 2
+        if buffer is None:
+            buffer = bytearray(self.slots * ENTRY_BYTES)
+        elif len(buffer) < self.slots * ENTRY_BYTES:
+            raise ValueError(f'Buffer too small for a {size_mb} MB table')
+        self.buffer = memoryview(buffer)[:self.slots * ENTRY_BYTES]
+        self.words = self.buffer.cast('Q')
+        self.age = 0
+        self.hits = 0
+        self.probes = 0
+
+    def clear(self):
+        self.buffer[:] = bytes(len(self.buffer))
+        self.age = 0
+        self.hits = 0
+        self.probes = 0
+
+    def new_search(self):
+        # Entries from earlier searches become the first to be replaced
+        self.age = (self.age + 1) & 255
+
+    def _slot_key(self, slot):
+        words = self.words
+        data = words[2 * slot + 1]
+        return words[2 * slot] ^ data, data
+
+    def _write(self, slot, key, data):
+        self.words[2 * slot] = key ^ data
+        self.words[2 * slot + 1] = data
+
+    def _candidates(self, key):
+        if self.policy == TWO_TIER:
+            first = (key % self.buckets) * 2
+            return (first, first + 1)
+        return (key % self.slots,)
+
+    def probe(self, key):
+        # Returns (depth, score, flag, move) or None
+        self.probes += 1
+        for slot in self._candidates(key):
+            stored_key, data = self._slot_key(slot)
+            if data and stored_key == key:
+                self.hits += 1
+                return unpack_entry(data)
+        return None
+
+    def store(self, key, depth, score, flag, move=None):
+        data = pack_entry(depth, score, flag, move, self.age)
+        if self.policy == ALWAYS_REPLACE:
+            self._write(key % self.slots, key, data)
+            return
+
+        if self.policy == DEPTH_PREFERRED:
+            slot = key % self.slots
+            stored_key, old = self._slot_key(slot)
+            if not old or stored_key == key or self._replaceable(old, depth):
+                self._write(slot, key, data)
+            return
+
+        # Two-tier: the first slot of the bucket keeps the deepest entry, the
+        # second always takes whatever the first one turns down or pushes out.
+        deep, recent = self._candidates(key)
+        stored_key, old = self._slot_key(deep)
+        if not old or stored_key == key or self._replaceable(old, depth):
+            if old and stored_key != key:
+                self._write(recent, stored_key, old)
+            self._write(deep, key, data)
+        else:
+            self._write(recent, key, data)
+
+    def _replaceable(self, old, depth):
+        return (old >> AGE_SHIFT & 255) != self.age or depth >= (old >> DEPTH_SHIFT & 255)
+
+    def hashfull(self):
+        # Per-mille of the first 1000 slots used by the current search,
+        # like the UCI "hashfull" figure
+        sample = min(1000, self.slots)
+        used = 0
+        for slot in range(sample):
+            data = self.words[2 * slot + 1]
+            if data and (data >> AGE_SHIFT & 255) == self.age:
+                used += 1
+        return used * 1000 // sample
+
+    @property
+    def size_bytes(self):
+        return len(self.buffer)
@@ -0,0 +1,68 @@
+import queue
+import threading
+
+from book import probe_books
+from search import Search
+
+class SearchWorker:
+    # Runs Search.search on a background thread so the pygame loop keeps
+    # drawing. Start a search, poll() once per frame for the result, and
+    # cancel() on reset or quit. books are opening books and endgame tables
+    # that are asked before the engine searches. notify, if given, is called
+    # from the search thread once a result is ready, so a caller that sleeps
+    # between events can be woken instead of polling.
+    def __init__(self, engine=None, books=None, notify=None):
+        self.engine = engine or Search()
+        self.books = list(books or [])
+        self.notify = notify
+        self.results = queue.Queue()
+        self.thread = None
+        self.job = 0
+        self.pending = False
+
+    def start(self, position, time_ms, game_keys=None):
+        self.cancel()
+        self.job += 1
+        self.pending = True
+        self.thread = threading.Thread(
+            target=self._run,
+            args=(self.job, position.copy(), time_ms, list(game_keys or [])),
+            daemon=True
+        )
+        self.thread.start()
+
+    def _run(self, job, position, time_ms, game_keys):
+        move = probe_books(self.books, position)
+        if move:
+            result = {'move': move, 'score': 0, 'depth': 0, 'nodes': 0,
+                      'time_ms': 0, 'nps': 0, 'pv': [move], 'book': True}
+        else:
+            result = self.engine.search(position, time_ms, game_keys=game_keys)
+        result['job'] = job
+        self.results.put(result)
+        if self.notify:
+            self.notify()
+
+    def poll(self):
+        # Returns the finished result for the current search, or None.
+        # Results from cancelled searches are dropped.
+        while True:
+            try:
+                result = self.results.get_nowait()
+            except queue.Empty:
+                return None
+            if result['job'] == self.job and self.pending:
+                self.pending = False
+                return result
+
+    def cancel(self):
+        self.pending = False
+        if self.thread:
+            # search() clears the stop flag when it starts, so keep setting it
+            # until the thread is gone
+            while self.thread.is_alive():
+                self.engine.stop()
+                self.thread.join(0.01)
+            self.thread = None
+        while not self.results.empty():
+            self.results.get_nowait()
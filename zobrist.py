@@ -0,0 +1,13 @@
+import random
+
+# Fixed seed so keys, and anything stored under them, are the same on every run
+_rng = random.Random(0x5EED)
+
+def _key():
+    return _rng.getrandbits(64)
+
+PIECE_KEYS = {color + piece_type: [_key() for _ in range(64)]
+              for color in 'wb' for piece_type in 'pnbrqk'}
+SIDE_KEY = _key()  # xored in when black is to move
+CASTLING_KEYS = [_key() for _ in range(16)]
+EN_PASSANT_KEYS = [_key() for _ in range(8)]